@@ -0,0 +1,347 @@
+import argparse
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+
+def default_cutoff(days):
+    """Дата отсечения: days дней назад (ГГГГ-ММ-ДД)"""
+    return (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+class ArchiveReport:
+    """Итоги архивирования: перенесенные строки по периодам и время"""
+
+    def __init__(self):
+        self.moved = {}
+        self.started = time.perf_counter()
+        self.vacuum_seconds = 0.0
+
+    def add(self, period, inspections, defects, images):
+        counts = self.moved.setdefault(period, [0, 0, 0])
+        counts[0] += inspections
+        counts[1] += defects
+        counts[2] += images
+
+    @property
+    def inspections(self):
+        return sum(counts[0] for counts in self.moved.values())
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+class ArchiveManager:
+    """Перенос закрытых проверок в архивные файлы по периодам.
+
+    Проверки со статусом completed/rejected старше даты отсечения вместе с
+    дефектами и изображениями дефектов переносятся пакетами в файлы
+    <база>.archive-<период>.db; перенесенные строки удаляются из основной базы
+    (триггеры статистики, полнотекстового и пространственного индексов
+    срабатывают как при обычном удалении), после чего основной файл сжимается
+    VACUUM. Реестр архивов хранится в таблице archives основной базы.
+
+    Пока enabled выключен, архивы не подключаются и запросы читают только
+    основную базу. При включении attach() подключает архивы к соединению через
+    ATTACH и создает временные представления all_<таблица> (UNION ALL основной
+    таблицы и архивных); окно таблицы строит запросы страниц по sources().
+    """
+
+    TABLES = ("inspections", "defects", "defect_images")
+    STATUSES = ("completed", "rejected")
+    PERIODS = {"year": "%Y", "month": "%Y-%m"}
+
+    REGISTRY = """CREATE TABLE IF NOT EXISTS archives (
+        period TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        inspections INTEGER NOT NULL DEFAULT 0,
+        defects INTEGER NOT NULL DEFAULT 0,
+        defect_images INTEGER NOT NULL DEFAULT 0,
+        first_date TEXT,
+        last_date TEXT,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )"""
+
+    ARCHIVE_INDEXES = [
+        "CREATE INDEX IF NOT EXISTS idx_inspections_date ON inspections(inspection_date)",
+        "CREATE INDEX IF NOT EXISTS idx_defects_inspection ON defects(inspection_id)",
+        "CREATE INDEX IF NOT EXISTS idx_defects_type ON defects(defect_type, severity)",
+        "CREATE INDEX IF NOT EXISTS idx_defect_images_defect ON defect_images(defect_id)",
+    ]
+
+    # Ссылки на таблицы, которых нет в архивном файле: при включенных внешних
+    # ключах любая запись в такую таблицу завершилась бы ошибкой
+    EXTERNAL_KEYS = re.compile(
+        r",\s*FOREIGN KEY \(\w+\) REFERENCES (?:smartphones|users)\(\w+\)[A-Z ]*", re.IGNORECASE)
+
+    BATCH = "(SELECT inspection_id FROM temp.archive_batch)"
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.enabled = False
+        self.archives = []
+
+    def load(self, connection):
+        """Чтение реестра архивов; отсутствующие файлы пропускаются"""
+        archives = []
+        base_dir = os.path.dirname(os.path.abspath(self.db_manager.db_path))
+        for period, path in connection.execute("SELECT period, path FROM archives ORDER BY period"):
+            path = os.path.join(base_dir, path)
+            if os.path.exists(path):
+                archives.append((period, path))
+            else:
+                print(f"Архивный файл не найден: {path}")
+        self.archives = archives
+
+    def archive_path(self, period):
+        base = os.path.splitext(os.path.abspath(self.db_manager.db_path))[0]
+        return f"{base}.archive-{period}.db"
+
+    @staticmethod
+    def alias(period):
+        return "archive_" + period.replace("-", "_")
+
+    def sources(self, table):
+        """Таблицы для чтения: основная и, в режиме истории, архивные"""
+        if not self.enabled or table not in self.TABLES or not self.archives:
+            return [table]
+        return [f"main.{table}"] + [f"{self.alias(period)}.{table}" for period, _ in self.archives]
+
+    def attach(self, connection):
+        """Подключение архивов к соединению и создание представлений all_<таблица>"""
+        attached = {row[1] for row in connection.execute("PRAGMA database_list")}
+        expected = {self.alias(period): path for period, path in self.archives}
+        if all(alias in attached for alias in expected) and not any(
+                name.startswith("archive_") and name not in expected for name in attached):
+            return
+        if connection.in_transaction:
+            connection.commit()
+        for name in attached:
+            if name.startswith("archive_") and name not in expected:
+                connection.execute(f"DETACH DATABASE {name}")
+        for alias, path in expected.items():
+            if alias not in attached:
+                connection.execute("ATTACH DATABASE ? AS " + alias, (path,))
+        for table in self.TABLES:
+            connection.execute(f"DROP VIEW IF EXISTS temp.all_{table}")
+            selects = [f"SELECT * FROM main.{table}"] + [
+                f"SELECT * FROM {alias}.{table}" for alias in expected]
+            connection.execute(f"CREATE TEMP VIEW all_{table} AS " + " UNION ALL ".join(selects))
+
+    def attach_files(self, connection):
+        """Подключение всех архивов реестра без представлений; возвращает псевдонимы.
+
+        Реестр читается из базы, поэтому подключаются и архивы, создаваемые
+        выполняющимся сейчас архивированием; остальные подключения не меняются.
+        """
+        base_dir = os.path.dirname(os.path.abspath(self.db_manager.db_path))
+        attached = {row[1] for row in connection.execute("PRAGMA database_list")}
+        aliases = []
+        for period, path in connection.execute("SELECT period, path FROM archives ORDER BY period").fetchall():
+            alias, path = self.alias(period), os.path.join(base_dir, path)
+            if alias not in attached:
+                if not os.path.exists(path):
+                    continue
+                if connection.in_transaction:
+                    connection.commit()
+                connection.execute("ATTACH DATABASE ? AS " + alias, (path,))
+            aliases.append(alias)
+        return aliases
+
+    def archived_totals(self, connection):
+        """Число строк в архивах по реестру (без чтения архивных файлов)"""
+        row = connection.execute(
+            "SELECT IFNULL(SUM(inspections), 0), IFNULL(SUM(defects), 0), "
+            "IFNULL(SUM(defect_images), 0) FROM archives").fetchone()
+        return {"inspections": row[0], "defects": row[1], "defect_images": row[2]}
+
+    def defects_by_type(self, connection):
+        """Число архивных дефектов по типам (соединение с подключенными архивами)"""
+        counts = {}
+        for period, _ in self.archives:
+            for defect_type, count in connection.execute(
+                    f"SELECT defect_type, COUNT(*) FROM {self.alias(period)}.defects "
+                    f"GROUP BY defect_type"):
+                counts[defect_type] = counts.get(defect_type, 0) + count
+        return counts
+
+    def prepare_archive(self, path):
+        """Создание таблиц архивного файла по схеме основной базы"""
+        from schema_migrations import SchemaMigrations
+
+        connection = sqlite3.connect(path)
+        try:
+            for statement in SchemaMigrations.BASE_TABLES:
+                table = next((table for table in self.TABLES if f"EXISTS {table} (" in statement), None)
+                if table is None:
+                    continue
+                statement = self.EXTERNAL_KEYS.sub("", statement)
+                row = connection.execute(
+                    "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+                if row is None:
+                    connection.execute(statement)
+                elif self.EXTERNAL_KEYS.search(row[0]) or (
+                        "REFERENCES" in row[0].upper() and "ON DELETE" not in row[0].upper()):
+                    # Архив, созданный до включения внешних ключей
+                    SchemaMigrations.rebuild_table(connection, table, statement)
+            for statement in self.ARCHIVE_INDEXES:
+                connection.execute(statement)
+            connection.commit()
+        finally:
+            connection.close()
+
+    def periods(self, connection, cutoff, period):
+        placeholders = ", ".join("?" for _ in self.STATUSES)
+        return [row[0] for row in connection.execute(
+            f"SELECT DISTINCT strftime(?, inspection_date) FROM inspections "
+            f"WHERE status IN ({placeholders}) AND inspection_date < ? "
+            f"AND inspection_date IS NOT NULL ORDER BY 1",
+            (self.PERIODS[period], *self.STATUSES, cutoff))]
+
+    def archive(self, cutoff, period="year", batch_size=5000, vacuum=True, on_progress=None):
+        """Перенос закрытых проверок старше cutoff (ГГГГ-ММ-ДД) в архивы по периодам.
+
+        Каждый пакет переносится одной транзакцией: копирование в архив
+        (INSERT OR REPLACE, поэтому повтор после сбоя безопасен), удаление из
+        основной базы и обновление реестра.
+        """
+        datetime.strptime(cutoff, "%Y-%m-%d")
+        if period not in self.PERIODS:
+            raise ValueError(f"Неизвестный период: {period}")
+        report = ArchiveReport()
+        pool = self.db_manager.pool
+        with pool.writer() as connection:
+            periods = self.periods(connection, cutoff, period)
+
+        for name in periods:
+            path = self.archive_path(name)
+            alias = self.alias(name)
+            self.prepare_archive(path)
+            with pool.writer() as connection:
+                if connection.in_transaction:
+                    connection.commit()
+                # Архив мог остаться подключенным в режиме истории или для отчетов
+                if alias not in {row[1] for row in connection.execute("PRAGMA database_list")}:
+                    connection.execute("ATTACH DATABASE ? AS " + alias, (path,))
+            try:
+                while self.move_batch(alias, name, path, cutoff, period, batch_size, report):
+                    if on_progress:
+                        on_progress(report)
+            finally:
+                with pool.writer() as connection:
+                    if connection.in_transaction:
+                        connection.commit()
+                    connection.execute(f"DETACH DATABASE {alias}")
+
+        with pool.writer() as connection:
+            if vacuum and periods:
+                started = time.perf_counter()
+                connection.execute("VACUUM")
+                connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                report.vacuum_seconds = time.perf_counter() - started
+            self.load(connection)
+        self.db_manager.heatmaps.invalidate()
+        return report
+
+    def move_batch(self, alias, name, path, cutoff, period, batch_size, report):
+        """Перенос одного пакета проверок; возвращает False, если переносить нечего"""
+        placeholders = ", ".join("?" for _ in self.STATUSES)
+        with self.db_manager.pool.writer() as connection:
+            if not connection.in_transaction:
+                connection.execute("BEGIN IMMEDIATE")
+            connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS archive_batch (inspection_id INTEGER PRIMARY KEY)")
+            connection.execute("DELETE FROM temp.archive_batch")
+            selected = connection.execute(
+                f"INSERT INTO temp.archive_batch SELECT inspection_id FROM main.inspections "
+                f"WHERE status IN ({placeholders}) AND inspection_date < ? "
+                f"AND strftime(?, inspection_date) = ? ORDER BY inspection_id LIMIT ?",
+                (*self.STATUSES, cutoff, self.PERIODS[period], name, batch_size)).rowcount
+            if not selected:
+                return False
+
+            defect_ids = f"(SELECT defect_id FROM main.defects WHERE inspection_id IN {self.BATCH})"
+            first_date, last_date = connection.execute(
+                f"SELECT MIN(inspection_date), MAX(inspection_date) FROM main.inspections "
+                f"WHERE inspection_id IN {self.BATCH}").fetchone()
+            connection.execute(f"INSERT OR REPLACE INTO {alias}.inspections SELECT * "
+                               f"FROM main.inspections WHERE inspection_id IN {self.BATCH}")
+            defects = connection.execute(
+                f"INSERT OR REPLACE INTO {alias}.defects SELECT * FROM main.defects "
+                f"WHERE inspection_id IN {self.BATCH}").rowcount
+            images = connection.execute(
+                f"INSERT OR REPLACE INTO {alias}.defect_images SELECT * FROM main.defect_images "
+                f"WHERE defect_id IN {defect_ids}").rowcount
+
+            connection.execute(f"DELETE FROM main.defect_images WHERE defect_id IN {defect_ids}")
+            connection.execute(f"DELETE FROM main.defects WHERE inspection_id IN {self.BATCH}")
+            connection.execute(f"DELETE FROM main.inspections WHERE inspection_id IN {self.BATCH}")
+
+            relative = os.path.relpath(path, os.path.dirname(os.path.abspath(self.db_manager.db_path)))
+            connection.execute(
+                """INSERT INTO archives (period, path, inspections, defects, defect_images,
+                                         first_date, last_date)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(period) DO UPDATE SET
+                       inspections = inspections + excluded.inspections,
+                       defects = defects + excluded.defects,
+                       defect_images = defect_images + excluded.defect_images,
+                       first_date = MIN(IFNULL(first_date, excluded.first_date), excluded.first_date),
+                       last_date = MAX(IFNULL(last_date, excluded.last_date), excluded.last_date),
+                       archived_at = CURRENT_TIMESTAMP""",
+                (name, relative, selected, defects, images, first_date, last_date))
+        report.add(name, selected, defects, images)
+        return True
+
+
+def main():
+    from config import Config
+    from smartphone_defect_detection import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Архивирование закрытых проверок по периодам")
+    parser.add_argument("database", help="Путь к файлу базы данных")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    archive_parser = commands.add_parser("archive", help="Перенос старых проверок в архивы")
+    archive_parser.add_argument("--before", default=None,
+                                help="Дата отсечения ГГГГ-ММ-ДД (по умолчанию - "
+                                     "Config.ARCHIVE_AFTER_DAYS дней назад)")
+    archive_parser.add_argument("--period", choices=sorted(ArchiveManager.PERIODS), default="year")
+    archive_parser.add_argument("--batch-size", type=int, default=5000)
+    archive_parser.add_argument("--no-vacuum", action="store_true",
+                                help="Не сжимать основной файл после переноса")
+    commands.add_parser("list", help="Список архивов")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager()
+    db_manager.open(args.database)
+    try:
+        if args.command == "archive":
+            cutoff = args.before or default_cutoff(Config.ARCHIVE_AFTER_DAYS)
+            report = db_manager.archives.archive(
+                cutoff, args.period, args.batch_size, vacuum=not args.no_vacuum,
+                on_progress=lambda report: print(
+                    f"\rперенесено проверок: {report.inspections}", end="", flush=True))
+            print()
+            if not report.inspections:
+                print(f"Нет закрытых проверок до {cutoff}")
+            for name, (inspections, defects, images) in sorted(report.moved.items()):
+                print(f"{name}: проверок {inspections}, дефектов {defects}, изображений {images}")
+            print(f"Время: {report.elapsed:.1f} с (VACUUM {report.vacuum_seconds:.1f} с)")
+        with db_manager.pool.reader() as connection:
+            for row in connection.execute(
+                    "SELECT period, path, inspections, defects, defect_images, first_date, "
+                    "last_date FROM archives ORDER BY period"):
+                print(" | ".join("" if value is None else str(value) for value in row))
+    except (ValueError, sqlite3.Error) as e:
+        print(e)
+        raise SystemExit(1)
+    finally:
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import argparse
+import sqlite3
+import time
+
+
+class BatchReport:
+    """Ход и итоги пакетной операции: обработано ключей, изменено строк, каскад"""
+
+    def __init__(self, total=0):
+        self.total = total
+        self.done = 0
+        self.changed = 0
+        self.cascaded = {}
+        self.started = time.perf_counter()
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def fraction(self):
+        return self.done / self.total if self.total else 1.0
+
+
+class BatchOperations:
+    """Удаление и изменение множества строк одной транзакцией.
+
+    Все строки пакета обрабатываются одним executemany внутри транзакции
+    писателя: при ошибке (нарушение CHECK, внешнего ключа, отмена) откатывается
+    весь пакет. Ключи передаются генератором, который отмечает ход операции в
+    BatchReport. Зависимые строки удаляются базой каскадом (ON DELETE CASCADE);
+    dependents() заранее подсчитывает их для подтверждения.
+
+    Методы принимают соединение-писатель (pool.writer() или фоновая задача
+    с write=True), фиксация выполняется при выходе из pool.writer().
+    """
+
+    PROGRESS_STEP = 500
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    def track(self, parameters, report, on_progress=None):
+        """Параметры executemany с отметкой хода операции каждые PROGRESS_STEP строк"""
+        done = 0
+        for done, row in enumerate(parameters, 1):
+            yield row
+            if done % self.PROGRESS_STEP == 0:
+                report.done = done
+                if on_progress:
+                    on_progress(report)
+        report.done = done
+
+    def select_keys(self, connection, table, filters):
+        """Ключи строк основной таблицы по равенству колонок {колонка: значение}"""
+        metadata = self.db_manager.schema.table(table, connection)
+        for column in filters:
+            if column not in metadata.by_name:
+                raise ValueError(f"Колонка {column} отсутствует в таблице {table}")
+        where = " AND ".join(f"{column} = ?" for column in filters)
+        query = f"SELECT {metadata.key_column} FROM {table}" + (f" WHERE {where}" if where else "")
+        return [row[0] for row in connection.execute(query, list(filters.values()))]
+
+    def load_keys(self, connection, keys):
+        connection.execute("CREATE TEMP TABLE IF NOT EXISTS batch_keys (key INTEGER PRIMARY KEY)")
+        connection.execute("DELETE FROM temp.batch_keys")
+        connection.executemany("INSERT OR IGNORE INTO temp.batch_keys VALUES (?)",
+                               ((key,) for key in keys))
+
+    def dependents(self, connection, table, keys):
+        """Строки, удаляемые каскадом вместе с keys: {таблица: количество}"""
+        self.load_keys(connection, keys)
+        counts = {}
+        self._count_cascade(connection, table, "SELECT key FROM temp.batch_keys", counts)
+        return counts
+
+    def _count_cascade(self, connection, table, selection, counts):
+        for child, column, on_delete in self.db_manager.schema.children(table):
+            if on_delete.upper() != "CASCADE":
+                continue
+            key = self.db_manager.schema.table(child).key_column
+            rows = f"SELECT {key} FROM {child} WHERE {column} IN ({selection})"
+            count = connection.execute(f"SELECT COUNT(*) FROM ({rows})").fetchone()[0]
+            if count:
+                counts[child] = counts.get(child, 0) + count
+                self._count_cascade(connection, child, rows, counts)
+
+    def delete(self, connection, table, keys, report=None, on_progress=None):
+        """Удаление строк по ключам вместе с зависимыми строками"""
+        metadata = self.db_manager.schema.table(table, connection)
+        keys = list(keys)
+        report = report or BatchReport()
+        report.total = len(keys)
+        if not connection.in_transaction:
+            connection.execute("BEGIN IMMEDIATE")
+        report.cascaded = self.dependents(connection, table, keys)
+        cursor = connection.executemany(
+            metadata.delete_statement, self.track(((key,) for key in keys), report, on_progress))
+        report.changed = cursor.rowcount
+        report.finished = time.perf_counter()
+        return report
+
+    def update(self, connection, table, keys, values, report=None, on_progress=None):
+        """Установка значений колонок {колонка: значение} во всех строках keys"""
+        metadata = self.db_manager.schema.table(table, connection)
+        if not values:
+            raise ValueError("Не заданы изменяемые колонки")
+        for column in values:
+            if column not in metadata.by_name:
+                raise ValueError(f"Колонка {column} отсутствует в таблице {table}")
+            if column == metadata.key_column:
+                raise ValueError("Первичный ключ не изменяется пакетно")
+        keys = list(keys)
+        report = report or BatchReport()
+        report.total = len(keys)
+        if not connection.in_transaction:
+            connection.execute("BEGIN IMMEDIATE")
+        params = tuple(values.values())
+        cursor = connection.executemany(
+            metadata.update_statement(values.keys()),
+            self.track(((*params, key) for key in keys), report, on_progress))
+        report.changed = cursor.rowcount
+        report.finished = time.perf_counter()
+        return report
+
+
+def parse_ids(text):
+    """Ключи из списка вида 1,5,10-20"""
+    keys = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        low, _, high = part.partition("-")
+        try:
+            low = int(low)
+            keys.extend(range(low, int(high) + 1) if high else [low])
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Ожидаются номера или диапазоны: {part!r}")
+    return keys
+
+
+def parse_assignment(text):
+    column, sep, value = text.partition("=")
+    if not sep or not column.strip():
+        raise argparse.ArgumentTypeError(f"Ожидается колонка=значение: {text!r}")
+    return column.strip(), value
+
+
+def print_progress(report):
+    print(f"\rобработано: {report.done:,} из {report.total:,}", end="", flush=True)
+
+
+def main():
+    from smartphone_defect_detection import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Пакетное удаление и изменение строк")
+    parser.add_argument("database", help="Путь к файлу базы данных")
+    parser.add_argument("command", choices=["delete", "update"])
+    parser.add_argument("table", help="Таблица")
+    parser.add_argument("--ids", type=parse_ids, help="Ключи строк: 1,5,10-20")
+    parser.add_argument("--filter", type=parse_assignment, action="append", default=[],
+                        metavar="КОЛОНКА=ЗНАЧЕНИЕ", help="Отбор строк по равенству колонки")
+    parser.add_argument("--set", type=parse_assignment, action="append", default=[],
+                        metavar="КОЛОНКА=ЗНАЧЕНИЕ", help="Новое значение колонки (для update)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Выполнить и откатить транзакцию, показав количество строк")
+    args = parser.parse_args()
+    if args.ids is None and not args.filter:
+        parser.error("Укажите --ids или --filter")
+
+    db_manager = DatabaseManager()
+    db_manager.open(args.database)
+    operations = BatchOperations(db_manager)
+    try:
+        with db_manager.pool.writer() as connection:
+            keys = args.ids if args.ids is not None else operations.select_keys(
+                connection, args.table, dict(args.filter))
+            if args.command == "delete":
+                report = operations.delete(connection, args.table, keys, on_progress=print_progress)
+            else:
+                values = {column: value or None for column, value in args.set}
+                report = operations.update(connection, args.table, keys, values,
+                                           on_progress=print_progress)
+            if args.dry_run:
+                connection.rollback()
+    except (ValueError, KeyError, sqlite3.Error) as e:
+        print(f"\n{e}")
+        raise SystemExit(1)
+    finally:
+        db_manager.close()
+
+    print(f"\n{'Будет изменено' if args.dry_run else 'Изменено'} строк {args.table}: "
+          f"{report.changed} из {report.total}, время: {report.elapsed:.2f} с")
+    for table, count in report.cascaded.items():
+        print(f"  каскадом {table}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,512 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from table_view import PagedTreeview
+
+
+class SyntheticDataGenerator:
+    """Заполнение базы синтетическими данными для нагрузочных замеров.
+
+    Распределения приближены к производственным: популярность моделей
+    убывает по закону Ципфа, проверки идут в рабочие часы и реже в выходные,
+    число дефектов на проверку, их тип и серьезность заданы весами, сколы
+    тяготеют к краям экрана. При одинаковом seed данные совпадают.
+    """
+
+    MANUFACTURERS = [("Samsung", 30), ("Apple", 25), ("Xiaomi", 15), ("Huawei", 8),
+                     ("Oppo", 6), ("Vivo", 5), ("Realme", 4), ("Google", 3),
+                     ("OnePlus", 2), ("Motorola", 2)]
+    RESOLUTIONS = ["1080x2340", "1080x2400", "1170x2532", "1179x2556", "1440x3200", "720x1600"]
+    STATUSES = [("completed", 85), ("pending", 5), ("in_progress", 5), ("rejected", 5)]
+    DEFECTS_PER_INSPECTION = [(0, 35), (1, 30), (2, 17), (3, 10), (4, 5), (5, 2), (8, 1)]
+    DEFECT_TYPES = [("scratch", 40), ("discoloration", 20), ("chip", 15), ("other", 15),
+                    ("crack", 10)]
+    SEVERITY = {
+        "scratch": [1, 1, 2, 2, 2, 3, 3, 4],
+        "discoloration": [1, 2, 2, 3, 3, 4],
+        "chip": [2, 3, 3, 4, 4, 5],
+        "other": [1, 2, 3],
+        "crack": [3, 4, 4, 5, 5, 5],
+    }
+    WORDS = {
+        "scratch": "царапина тонкая глубокая поперечная продольная у края".split(),
+        "discoloration": "пятно желтое засветка неравномерная подсветка".split(),
+        "chip": "скол угол край корпус стекло".split(),
+        "other": "пыль под стеклом битый пиксель мерцание".split(),
+        "crack": "трещина паутина стекло от угла через весь экран".split(),
+    }
+    NOTES = ["Проверка по графику", "Повторная проверка после ремонта", "Жалоба покупателя",
+             "Выборочный контроль партии", "Приемка от поставщика", None, None]
+    SCREEN = (1080, 2400)
+    IMAGE_SHARE = 0.2
+    BATCH = 20000
+
+    INSERTS = {
+        "inspections": "INSERT INTO inspections (inspection_id, smartphone_id, inspector_id, "
+                       "inspection_date, status, overall_result, notes) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        "defects": "INSERT INTO defects (defect_id, inspection_id, defect_type, severity, "
+                   "location_x, location_y, size, description, detected_at) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        "defect_images": "INSERT INTO defect_images (defect_id, image_path, uploaded_at) "
+                         "VALUES (?, ?, ?)",
+    }
+
+    def __init__(self, connection, seed=1, days=365, end=None):
+        self.connection = connection
+        self.random = random.Random(seed)
+        self.days = days
+        self.end = end or datetime(2025, 12, 1)
+
+    @staticmethod
+    def weighted(pairs):
+        """Значения и накопленные веса для random.choices"""
+        return [value for value, _ in pairs], list(itertools.accumulate(w for _, w in pairs))
+
+    def next_id(self, table, key):
+        """Следующий ключ с учетом sqlite_sequence: номера удаленных строк не выдаются повторно"""
+        return self.connection.execute(
+            f"SELECT MAX(IFNULL((SELECT seq FROM sqlite_sequence WHERE name = ?), 0), "
+            f"IFNULL(MAX({key}), 0)) + 1 FROM {table}", (table,)).fetchone()[0]
+
+    def generate_users(self, inspectors):
+        """Инспекторы и наблюдатели; возвращает идентификаторы инспекторов"""
+        start = self.next_id("users", "user_id")
+        password_hash = hashlib.sha256(b"inspector").hexdigest()
+        rows = []
+        for number in range(inspectors + max(1, inspectors // 5)):
+            role = "inspector" if number < inspectors else "viewer"
+            rows.append((start + number, f"synthetic_{start + number}", password_hash, role,
+                         f"Сотрудник {start + number}", f"user{start + number}@example.com"))
+        self.connection.executemany(
+            "INSERT INTO users (user_id, username, password_hash, role, full_name, email) "
+            "VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return [row[0] for row in rows if row[3] == "inspector"]
+
+    def generate_smartphones(self, models):
+        """Модели смартфонов; возвращает идентификаторы в порядке убывания популярности"""
+        rnd = self.random
+        start = self.next_id("smartphones", "smartphone_id")
+        manufacturers = self.weighted(self.MANUFACTURERS)
+        rows = []
+        for number in range(models):
+            manufacturer = rnd.choices(*manufacturers)[0]
+            rows.append((start + number, f"{manufacturer} Model {number + 1}", manufacturer,
+                         round(min(7.6, max(4.7, rnd.gauss(6.3, 0.4))), 1),
+                         rnd.choice(self.RESOLUTIONS)))
+        self.connection.executemany(
+            "INSERT INTO smartphones (smartphone_id, model_name, manufacturer, screen_size, "
+            "resolution) VALUES (?, ?, ?, ?, ?)", rows)
+        ids = [row[0] for row in rows]
+        rnd.shuffle(ids)
+        return ids
+
+    def inspection_date(self):
+        """Дата проверки: рабочее время, в выходные проверок втрое меньше"""
+        rnd = self.random
+        while True:
+            day = self.end - timedelta(days=rnd.randrange(self.days))
+            if day.weekday() < 5 or rnd.random() < 0.33:
+                break
+        return day.replace(hour=rnd.randint(8, 18), minute=rnd.randrange(60),
+                           second=rnd.randrange(60))
+
+    def location(self, defect_type):
+        """Координаты дефекта: сколы и трещины чаще у краев, остальные по всему экрану"""
+        rnd = self.random
+        width, height = self.SCREEN
+        if defect_type in ("chip", "crack") and rnd.random() < 0.7:
+            x = rnd.choice((0, width)) + int(rnd.gauss(0, width * 0.05))
+            y = rnd.choice((0, height)) + int(rnd.gauss(0, height * 0.05))
+            return min(width, max(0, x)), min(height, max(0, y))
+        return rnd.randrange(width), rnd.randrange(height)
+
+    def generate(self, defects, on_progress=None):
+        """Добавление данных до defects дефектов; возвращает число добавленных строк по таблицам"""
+        rnd = self.random
+        inspectors = self.generate_users(max(5, defects // 20000))
+        smartphones = self.generate_smartphones(max(20, defects // 500))
+        counts = {"users": len(inspectors) + max(1, len(inspectors) // 5),
+                  "smartphones": len(smartphones),
+                  "inspections": 0, "defects": 0, "defect_images": 0}
+
+        phone_weights = list(itertools.accumulate(
+            1.0 / (rank + 1) ** 1.1 for rank in range(len(smartphones))))
+        statuses = self.weighted(self.STATUSES)
+        per_inspection = self.weighted(self.DEFECTS_PER_INSPECTION)
+        defect_types = self.weighted(self.DEFECT_TYPES)
+
+        inspection_id = self.next_id("inspections", "inspection_id")
+        defect_id = self.next_id("defects", "defect_id")
+        batch = {"inspections": [], "defects": [], "defect_images": []}
+
+        while counts["defects"] < defects:
+            date = self.inspection_date()
+            status = rnd.choices(*statuses)[0]
+            count = min(rnd.choices(*per_inspection)[0], defects - counts["defects"])
+
+            worst = 0
+            for _ in range(count):
+                defect_type = rnd.choices(*defect_types)[0]
+                severity = rnd.choice(self.SEVERITY[defect_type])
+                worst = max(worst, severity)
+                x, y = self.location(defect_type)
+                words = self.WORDS[defect_type]
+                detected = (date + timedelta(seconds=rnd.randint(5, 600))).strftime(
+                    "%Y-%m-%d %H:%M:%S")
+                batch["defects"].append((
+                    defect_id, inspection_id, defect_type, severity, x, y,
+                    round(rnd.lognormvariate(1.5, 0.8), 1),
+                    " ".join(rnd.sample(words, rnd.randint(2, min(4, len(words))))), detected))
+                if rnd.random() < self.IMAGE_SHARE:
+                    batch["defect_images"].append(
+                        (defect_id, f"images/synthetic/{defect_id}.png", detected))
+                defect_id += 1
+
+            if status in ("pending", "in_progress"):
+                result = None
+            elif worst == 0:
+                result = "pass"
+            else:
+                result = "fail" if worst >= 4 else "conditional"
+            batch["inspections"].append((
+                inspection_id, rnd.choices(smartphones, cum_weights=phone_weights)[0],
+                rnd.choice(inspectors), date.strftime("%Y-%m-%d %H:%M:%S"), status, result,
+                rnd.choice(self.NOTES)))
+            inspection_id += 1
+            counts["defects"] += count
+
+            if len(batch["defects"]) >= self.BATCH or counts["defects"] >= defects:
+                self.flush(batch, counts)
+                if on_progress:
+                    on_progress(counts["defects"], defects)
+        self.flush(batch, counts)
+        return counts
+
+    def flush(self, batch, counts):
+        """Запись накопленных строк одной транзакцией (триггеры статистики и индексов срабатывают)"""
+        for table in ("inspections", "defects", "defect_images"):
+            if table != "defects":
+                counts[table] += len(batch[table])
+            if batch[table]:
+                self.connection.executemany(self.INSERTS[table], batch[table])
+            batch[table].clear()
+        self.connection.commit()
+
+
+class HeadlessTableView(PagedTreeview):
+    """PagedTreeview без виджетов: те же запросы страниц, что и в окне таблицы"""
+
+    def __init__(self, db_manager, table_name, page_size=None):
+        self.db_manager = db_manager
+        self.table_name = table_name
+        self.page_size = page_size or self.PAGE_SIZE
+        self.sort_column = None
+        self.sort_descending = False
+        self.filters = {}
+        self.metadata = db_manager.schema.table(table_name)
+        self.sources = db_manager.archives.sources(table_name)
+        self.columns = self.metadata.column_names
+        self.pk_column = self.metadata.key_column
+        self.build_queries()
+
+    def open_window(self, connection):
+        """Первое окно строк, как в reload() при открытии таблицы"""
+        if self.sort_column is not None:
+            return self.fetch_window(connection, None, None)
+        bounds = connection.execute(self.bounds_query, self.bounds_params).fetchone()
+        return self.fetch_window(connection, bounds[0], bounds[0])
+
+    def scan(self, connection, limit=None):
+        """Чтение таблицы целиком страницами по прокрутке; возвращает число строк"""
+        rows = self.open_window(connection)["rows"]
+        total = len(rows)
+        while rows and len(rows) >= self.page_size and (limit is None or total < limit):
+            rows = self.fetch_page(connection, self.row_cursor(rows[-1]), 1)
+            total += len(rows)
+        return total
+
+
+class BenchmarkSuite:
+    """Замеры основных операций приложения без графического интерфейса.
+
+    Операции выполняются тем же кодом, что и в окне: методы MainApplication
+    для статистики, запросы страниц PagedTreeview, запросы RecordDialog.save
+    и удаления через QueryExecutor. Для каждой операции сохраняются медиана,
+    95-й перцентиль и минимум времени в миллисекундах.
+    """
+
+    TABLES = ["users", "smartphones", "inspections", "defects", "defect_images"]
+    SCAN_TABLES = ["smartphones", "inspections", "defects"]
+
+    def __init__(self, db_manager, repeat=5, scan_limit=None):
+        from smartphone_defect_detection import MainApplication
+
+        self.db_manager = db_manager
+        self.repeat = repeat
+        self.scan_limit = scan_limit
+        self.application = MainApplication
+        # Методы статистики MainApplication используют только self.db_manager
+        self.host = SimpleNamespace(db_manager=db_manager)
+        self.results = {}
+
+    def measure(self, name, func, repeat=None):
+        """Выполнение func repeat раз с прогревом; результат последнего вызова возвращается"""
+        result = func()
+        timings = []
+        for _ in range(repeat or self.repeat):
+            started = time.perf_counter()
+            result = func()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.results[name] = {
+            "median_ms": round(statistics.median(timings), 3),
+            "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+            "min_ms": round(timings[0], 3),
+            "runs": len(timings),
+        }
+        return result
+
+    def background(self, func, write=False):
+        """Выполнение через QueryExecutor, как run_in_background в окне"""
+        return self.db_manager.executor.submit(func, write=write).result()
+
+    def row_counts(self):
+        with self.db_manager.pool.reader() as connection:
+            return {table: connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                    for table in self.TABLES}
+
+    def run(self, on_progress=None):
+        steps = [
+            ("authenticate", self.bench_authenticate),
+            ("statistics", self.bench_statistics),
+            ("tables", self.bench_tables),
+            ("records", self.bench_records),
+        ]
+        for name, step in steps:
+            if on_progress:
+                on_progress(name)
+            step()
+        return self.results
+
+    def bench_authenticate(self):
+        user = self.measure("authenticate",
+                            lambda: self.db_manager.authenticate("admin", "admin123"))
+        if user is None:
+            raise RuntimeError("Пользователь admin/admin123 не найден")
+
+    def bench_statistics(self):
+        stats = self.measure("get_statistics", lambda: self.background(
+            lambda connection: self.application.get_statistics(self.host, connection)))
+        detailed = self.measure("get_detailed_statistics", lambda: self.background(
+            lambda connection: self.application.get_detailed_statistics(self.host, connection)))
+        if not stats or not detailed:
+            raise RuntimeError("Статистика не получена")
+
+    def bench_tables(self):
+        for table in self.TABLES:
+            view = HeadlessTableView(self.db_manager, table)
+            self.measure(f"table_open.{table}", lambda: self.background(view.open_window))
+
+        view = HeadlessTableView(self.db_manager, "inspections")
+        view.sort_column = "inspection_date"
+        view.sort_descending = True
+        self.measure("table_open_sorted.inspections", lambda: self.background(view.open_window))
+
+        view = HeadlessTableView(self.db_manager, "defects")
+        view.filters = {"defect_type": "crack", "severity": ">=4"}
+        view.build_queries()
+        self.measure("table_open_filtered.defects", lambda: self.background(view.open_window))
+
+        # Полный просмотр таблицы - самая долгая операция, поэтому повторов меньше
+        for table in self.SCAN_TABLES:
+            view = HeadlessTableView(self.db_manager, table)
+            self.measure(f"table_scan.{table}",
+                         lambda: self.background(
+                             lambda connection: view.scan(connection, self.scan_limit)),
+                         repeat=max(1, self.repeat // 2))
+
+    def bench_records(self):
+        """Добавление, изменение и удаление записей запросами RecordDialog.save и delete_record"""
+        with self.db_manager.pool.reader() as connection:
+            inspection_id = connection.execute("SELECT MAX(inspection_id) FROM inspections").fetchone()[0]
+            smartphone_id = connection.execute("SELECT MIN(smartphone_id) FROM smartphones").fetchone()[0]
+        # Значения берутся из полей ввода диалога, поэтому передаются строками
+        records = {
+            "inspections": ({"smartphone_id": str(smartphone_id), "inspector_id": "1",
+                             "status": "completed", "overall_result": "pass",
+                             "notes": "Замер производительности", "image_path": ""},
+                            {"overall_result": "conditional", "notes": "Замер: изменено"}),
+            "defects": ({"inspection_id": str(inspection_id or ""), "defect_type": "scratch",
+                         "severity": "2", "location_x": "540", "location_y": "1200",
+                         "size": "3.5", "description": "царапина замер производительности"},
+                        {"severity": "3", "location_x": "560", "description": "царапина изменена"}),
+        }
+        for table, (data, changes) in records.items():
+            metadata = self.db_manager.schema.table(table)
+            insert = metadata.insert_statement(data.keys())
+            created = []
+
+            def add(connection):
+                created.append(connection.execute(insert, tuple(data.values())).lastrowid)
+
+            self.measure(f"insert.{table}", lambda: self.background(add, write=True))
+
+            # Диалог редактирования сохраняет все поля записи
+            changed = dict(data, **changes)
+            update = metadata.update_statement(changed.keys())
+            self.measure(f"update.{table}", lambda: self.background(
+                lambda connection: connection.execute(
+                    update, tuple(changed.values()) + (created[-1],)), write=True))
+
+            def delete(connection):
+                connection.execute(metadata.delete_statement, (created.pop(),))
+
+            self.measure(f"delete.{table}", lambda: self.background(delete, write=True),
+                         repeat=len(created) - 1)
+
+
+def compare(results, baseline, tolerance=0.25, min_delta_ms=1.0):
+    """Сравнение с эталоном; возвращает строки отчета и список регрессий.
+
+    Регрессией считается рост медианы больше чем на tolerance (доля) и
+    одновременно больше чем на min_delta_ms, чтобы шум субмиллисекундных
+    операций не давал ложных срабатываний.
+    """
+    lines, regressions = [], []
+    for name, current in sorted(results["results"].items()):
+        reference = baseline["results"].get(name)
+        if reference is None:
+            lines.append(f"{name:<36} {current['median_ms']:>10.2f} мс  (нет в эталоне)")
+            continue
+        before, after = reference["median_ms"], current["median_ms"]
+        change = (after - before) / before if before else 0.0
+        regressed = after > before * (1 + tolerance) and after - before > min_delta_ms
+        mark = "РЕГРЕССИЯ" if regressed else ("быстрее" if change < -tolerance else "")
+        lines.append(f"{name:<36} {before:>10.2f} -> {after:>10.2f} мс {change:>+8.1%}  {mark}")
+        if regressed:
+            regressions.append(name)
+    for name in sorted(set(baseline["results"]) - set(results["results"])):
+        lines.append(f"{name:<36} отсутствует в текущем замере")
+    if results.get("rows") != baseline.get("rows"):
+        lines.append("Внимание: объем данных отличается от эталона, сравнение неточно")
+    return lines, regressions
+
+
+def generate_database(path, defects, seed):
+    from smartphone_defect_detection import DatabaseManager
+
+    db_manager = DatabaseManager()
+    db_manager.open(path)
+    started = time.perf_counter()
+    try:
+        with db_manager.pool.writer() as connection:
+            connection.execute("PRAGMA synchronous = OFF")
+            generator = SyntheticDataGenerator(connection, seed=seed)
+            counts = generator.generate(
+                defects, on_progress=lambda done, total: print(
+                    f"\rдефектов: {done}/{total}", end="", flush=True))
+            connection.execute("PRAGMA optimize")
+    finally:
+        db_manager.close()
+    print(f"\nДобавлено за {time.perf_counter() - started:.1f} с: "
+          + ", ".join(f"{table} {count}" for table, count in counts.items()))
+
+
+def run_benchmarks(path, repeat, scan_limit):
+    from smartphone_defect_detection import DatabaseManager
+
+    db_manager = DatabaseManager()
+    db_manager.open(path)
+    try:
+        suite = BenchmarkSuite(db_manager, repeat=repeat, scan_limit=scan_limit)
+        rows = suite.row_counts()
+        suite.run(on_progress=lambda name: print(f"замер: {name}", flush=True))
+    finally:
+        db_manager.close()
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "database": os.path.abspath(path),
+        "rows": rows,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "repeat": repeat,
+        "results": suite.results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности без графического интерфейса")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = commands.add_parser("generate", help="Заполнение базы синтетическими данными")
+    generate_parser.add_argument("database", help="Путь к файлу базы данных")
+    generate_parser.add_argument("--defects", type=int, default=10000,
+                                 help="Число дефектов (от 10 тыс. до 10 млн)")
+    generate_parser.add_argument("--seed", type=int, default=1)
+
+    run_parser = commands.add_parser("run", help="Выполнение замеров")
+    run_parser.add_argument("database", help="Путь к файлу базы данных")
+    run_parser.add_argument("--repeat", type=int, default=5, help="Повторов каждой операции")
+    run_parser.add_argument("--scan-limit", type=int, default=None,
+                            help="Наибольшее число строк при полном просмотре таблицы")
+    run_parser.add_argument("--output", help="Файл JSON для результатов")
+    run_parser.add_argument("--baseline", help="Файл JSON эталонного замера для сравнения")
+    run_parser.add_argument("--save-baseline", action="store_true",
+                            help="Сохранить результаты в файл --baseline")
+    run_parser.add_argument("--tolerance", type=float, default=0.25,
+                            help="Допустимое замедление (доля медианы)")
+    run_parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                            help="Изменения меньше этого значения не считаются регрессией")
+
+    compare_parser = commands.add_parser("compare", help="Сравнение двух файлов результатов")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument("--tolerance", type=float, default=0.25)
+    compare_parser.add_argument("--min-delta-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        generate_database(args.database, args.defects, args.seed)
+        return
+
+    if args.command == "compare":
+        with open(args.results, encoding="utf-8") as f:
+            results = json.load(f)
+    else:
+        results = run_benchmarks(args.database, args.repeat, args.scan_limit)
+        for name, timing in sorted(results["results"].items()):
+            print(f"{name:<36} {timing['median_ms']:>10.2f} мс (p95 {timing['p95_ms']:.2f})")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+        if args.save_baseline or not args.baseline:
+            if args.save_baseline and args.baseline:
+                with open(args.baseline, "w", encoding="utf-8") as f:
+                    json.dump(results, f, ensure_ascii=False, indent=2)
+                print(f"Эталон сохранен: {args.baseline}")
+            return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    lines, regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+    print("\n".join(lines))
+    if regressions:
+        print(f"\nОБНАРУЖЕНЫ РЕГРЕССИИ ({len(regressions)}): {', '.join(regressions)}",
+              file=sys.stderr)
+        raise SystemExit(1)
+    print("\nРегрессий нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from config import Config
+
+
+class ValidationError(ValueError):
+    """Запись не соответствует ограничениям таблицы"""
+
+
+class ImportReport:
+    """Итоги загрузки: количество строк, отклоненные записи и скорость"""
+
+    def __init__(self):
+        self.inserted = {}
+        self.rejected = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    @property
+    def total_inserted(self):
+        return sum(self.inserted.values())
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.total_inserted / self.elapsed if self.elapsed else 0.0
+
+    def add(self, table, count):
+        self.inserted[table] = self.inserted.get(table, 0) + count
+
+
+class BulkImporter:
+    """Потоковая пакетная загрузка проверок и дефектов из CSV/JSONL.
+
+    Файлы читаются построчно, каждая запись проверяется в Python на соответствие
+    ограничениям CHECK и внешним ключам (идентификаторы смартфонов и пользователей
+    кэшируются в памяти), после чего строки вставляются через executemany
+    крупными транзакциями соединения-писателя DatabaseManager. Ссылки на
+    проверки и явно заданные inspection_id проверяются в той же транзакции
+    одним запросом к первичному ключу inspections на пакет.
+    Допустимые значения колонок берутся из метаданных схемы DatabaseManager.
+    Записи JSONL для inspections могут содержать вложенный список "defects".
+    """
+
+    COLUMNS = {
+        "inspections": ["inspection_id", "smartphone_id", "inspector_id", "inspection_date",
+                        "status", "overall_result", "notes", "image_path"],
+        "defects": ["defect_id", "inspection_id", "defect_type", "severity", "location_x",
+                    "location_y", "size", "description", "detected_at"],
+    }
+
+    TIMESTAMP_COLUMNS = {"inspection_date", "detected_at"}
+
+    def __init__(self, db_manager, batch_size=5000, max_errors=100, on_progress=None):
+        self.db_manager = db_manager
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.on_progress = on_progress
+
+        self.smartphone_ids = set()
+        self.smartphone_models = {}
+        self.user_ids = set()
+        self.usernames = {}
+        self.domains = {}
+        self.ranges = {}
+        self.statements = {table: self.build_insert(table) for table in self.COLUMNS}
+
+    def build_insert(self, table):
+        """Оператор INSERT с подстановкой значений по умолчанию для отметок времени"""
+        columns = self.COLUMNS[table]
+        placeholders = ", ".join(
+            "COALESCE(?, CURRENT_TIMESTAMP)" if col in self.TIMESTAMP_COLUMNS else "?"
+            for col in columns
+        )
+        return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+
+    def load_caches(self):
+        """Загрузка ограничений колонок и идентификаторов для проверки внешних ключей"""
+        for table in self.COLUMNS:
+            for column in self.db_manager.schema.table(table).columns:
+                if column.range:
+                    self.ranges[column.name] = column.range
+                elif column.choices:
+                    self.domains[column.name] = set(column.choices)
+
+        # Новые наборы собираются целиком и подменяют старые одним присваиванием,
+        # чтобы проверки, идущие параллельно с перечитыванием, не видели их пустыми
+        smartphone_ids, smartphone_models = set(), {}
+        user_ids, usernames = set(), {}
+        with self.db_manager.pool.reader() as connection:
+            for smartphone_id, model_name, manufacturer in connection.execute(
+                    "SELECT smartphone_id, model_name, manufacturer FROM smartphones"):
+                smartphone_ids.add(smartphone_id)
+                smartphone_models[(manufacturer, model_name)] = smartphone_id
+
+            for user_id, username in connection.execute("SELECT user_id, username FROM users"):
+                user_ids.add(user_id)
+                usernames[username] = user_id
+
+        self.smartphone_ids, self.smartphone_models = smartphone_ids, smartphone_models
+        self.user_ids, self.usernames = user_ids, usernames
+
+    @staticmethod
+    def next_inspection_id(connection):
+        """Следующий номер проверки с учетом sqlite_sequence.
+
+        Таблица объявлена с AUTOINCREMENT, поэтому номера удаленных проверок
+        повторно не выдаются: отсчет ведется от большего из последнего
+        выданного номера и максимального существующего.
+        """
+        return connection.execute(
+            "SELECT MAX(IFNULL((SELECT seq FROM sqlite_sequence WHERE name = 'inspections'), 0), "
+            "IFNULL(MAX(inspection_id), 0)) + 1 FROM inspections").fetchone()[0]
+
+    def read_records(self, path, file_format=None):
+        """Построчное чтение записей из CSV или JSONL"""
+        file_format = file_format or os.path.splitext(path)[1].lstrip(".").lower()
+        with open(path, newline="", encoding="utf-8") as source:
+            if file_format == "csv":
+                for line_number, record in enumerate(csv.DictReader(source), start=2):
+                    yield line_number, record
+            elif file_format in ("jsonl", "ndjson", "json"):
+                for line_number, line in enumerate(source, start=1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield line_number, json.loads(line)
+                    except json.JSONDecodeError as e:
+                        yield line_number, ValidationError(f"некорректный JSON: {e}")
+            else:
+                raise ValueError(f"Неподдерживаемый формат файла: {file_format}")
+
+    def _value(self, record, column):
+        value = record.get(column)
+        # Списки и объекты JSON не хешируются и не подходят ни для одной колонки
+        if value is not None and not isinstance(value, (str, int, float)):
+            raise ValidationError(f"{column}: ожидается скалярное значение, получено {value!r}")
+        if isinstance(value, str):
+            value = value.strip()
+            if value == "":
+                return None
+        return value
+
+    def _integer(self, record, column):
+        value = self._value(record, column)
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValidationError(f"{column}: ожидается целое число, получено {value!r}")
+
+    def _real(self, record, column):
+        value = self._value(record, column)
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise ValidationError(f"{column}: ожидается число, получено {value!r}")
+
+    def _choice(self, record, column):
+        value = self._value(record, column)
+        if value is not None and value not in self.domains[column]:
+            allowed = ", ".join(sorted(self.domains[column]))
+            raise ValidationError(f"{column}: недопустимое значение {value!r} ({allowed})")
+        return value
+
+    def _timestamp(self, record, column):
+        value = self._value(record, column)
+        if value is None:
+            return None
+        try:
+            return datetime.fromisoformat(str(value)).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            raise ValidationError(f"{column}: некорректная дата {value!r}")
+
+    def resolve_smartphone(self, record):
+        smartphone_id = self._integer(record, "smartphone_id")
+        if smartphone_id is None:
+            key = (self._value(record, "manufacturer"), self._value(record, "model_name"))
+            if key == (None, None):
+                return None
+            smartphone_id = self.smartphone_models.get(key)
+            if smartphone_id is None:
+                raise ValidationError(f"смартфон {key[0]} {key[1]} не найден")
+        elif smartphone_id not in self.smartphone_ids:
+            raise ValidationError(f"smartphone_id {smartphone_id} не найден")
+        return smartphone_id
+
+    def resolve_inspector(self, record):
+        inspector_id = self._integer(record, "inspector_id")
+        if inspector_id is None:
+            username = self._value(record, "inspector")
+            if username is None:
+                return None
+            inspector_id = self.usernames.get(username)
+            if inspector_id is None:
+                raise ValidationError(f"пользователь {username!r} не найден")
+        elif inspector_id not in self.user_ids:
+            raise ValidationError(f"inspector_id {inspector_id} не найден")
+        return inspector_id
+
+    def validate_inspection(self, record):
+        """Проверка записи проверки; возвращает кортеж значений для INSERT"""
+        return (
+            self._integer(record, "inspection_id"),
+            self.resolve_smartphone(record),
+            self.resolve_inspector(record),
+            self._timestamp(record, "inspection_date"),
+            self._choice(record, "status"),
+            self._choice(record, "overall_result"),
+            self._value(record, "notes"),
+            self._value(record, "image_path"),
+        )
+
+    def validate_nested(self, record):
+        """Проверка вложенного списка "defects" записи проверки"""
+        nested = record.get("defects") or []
+        if not isinstance(nested, list):
+            raise ValidationError("defects: ожидается список дефектов")
+        return [self.validate_defect(defect, inspection_id=0) for defect in nested]
+
+    def validate_defect(self, record, inspection_id=None):
+        """Проверка записи дефекта; возвращает кортеж значений для INSERT"""
+        if not isinstance(record, dict):
+            raise ValidationError("ожидается объект с полями дефекта")
+        if inspection_id is None:
+            inspection_id = self._integer(record, "inspection_id")
+
+        severity = self._integer(record, "severity")
+        low, high = self.ranges["severity"]
+        if severity is not None and not low <= severity <= high:
+            raise ValidationError(
+                f"severity: ожидается значение от {low} до {high}, получено {severity}")
+
+        return (
+            self._integer(record, "defect_id"),
+            inspection_id,
+            self._choice(record, "defect_type"),
+            severity,
+            self._integer(record, "location_x"),
+            self._integer(record, "location_y"),
+            self._real(record, "size"),
+            self._value(record, "description"),
+            self._timestamp(record, "detected_at"),
+        )
+
+    def import_file(self, path, table, file_format=None, report=None):
+        """Загрузка одного файла в таблицу inspections или defects"""
+        return self.import_records(self.read_records(path, file_format), table, report, path)
+
+    def import_records(self, records, table, report=None, source="<records>"):
+        """Загрузка последовательности пар (номер, запись) в таблицу inspections или defects"""
+        if table not in self.COLUMNS:
+            raise ValueError(f"Загрузка в таблицу {table} не поддерживается")
+
+        report = report or ImportReport()
+        self.load_caches()
+
+        batch = []
+        lines = []
+        for line_number, record in records:
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                if not isinstance(record, dict):
+                    raise ValidationError("ожидается объект с полями записи")
+                if table == "inspections":
+                    nested = self.validate_nested(record)
+                    batch.append((self.validate_inspection(record), nested))
+                else:
+                    batch.append((self.validate_defect(record), []))
+            except ValidationError as e:
+                self.reject(report, source, line_number, e)
+                continue
+            lines.append(line_number)
+
+            if len(batch) >= self.batch_size:
+                self.flush(table, batch, report, source, lines)
+                batch = []
+                lines = []
+
+        if batch:
+            self.flush(table, batch, report, source, lines)
+        return report
+
+    def reject(self, report, source, line_number, error):
+        report.rejected += 1
+        report.errors.append(f"{source}:{line_number}: {error}")
+        if self.max_errors is not None and report.rejected > self.max_errors:
+            raise ValidationError(
+                f"Превышено допустимое число ошибок ({self.max_errors}), загрузка остановлена")
+
+    def flush(self, table, batch, report, source="<records>", lines=None):
+        """Вставка пакета одной транзакцией с ограничением длины журнала изменений"""
+        with self.db_manager.pool.writer() as connection:
+            if not connection.in_transaction:
+                connection.execute("BEGIN IMMEDIATE")
+            batch = self.check_keys(connection, table, batch, report, source,
+                                    lines or range(1, len(batch) + 1))
+            self.write_batch(connection, table, batch, report)
+            self.db_manager.changes.prune(connection, Config.CHANGE_LOG_MAX_ROWS)
+
+        if self.on_progress:
+            self.on_progress(report)
+
+    def check_keys(self, connection, table, batch, report, source, lines):
+        """Отклонение записей пакета с существующим inspection_id (inspections) или
+        ссылкой на отсутствующую проверку (defects); возвращает оставшиеся записи.
+
+        Номера пакета ищутся одним запросом по первичному ключу, поэтому память
+        не зависит от размера таблицы inspections.
+        """
+        column = 0 if table == "inspections" else 1
+        ids = [row[column] for row, _ in batch if row[column] is not None]
+        if not ids:
+            return batch
+        existing = {row[0] for row in connection.execute(
+            "SELECT inspection_id FROM inspections "
+            "WHERE inspection_id IN (SELECT value FROM json_each(?))", (json.dumps(ids),))}
+
+        checked = []
+        for line_number, (row, nested) in zip(lines, batch):
+            inspection_id = row[column]
+            try:
+                if inspection_id is not None and table == "inspections":
+                    if inspection_id in existing:
+                        raise ValidationError(f"inspection_id {inspection_id} уже существует")
+                    existing.add(inspection_id)
+                elif inspection_id is not None and inspection_id not in existing:
+                    raise ValidationError(f"inspection_id {inspection_id} не найден")
+            except ValidationError as e:
+                self.reject(report, source, line_number, e)
+                continue
+            checked.append((row, nested))
+        return checked
+
+    def write_batch(self, connection, table, batch, report):
+        """Вставка проверенных записей в открытой транзакции.
+
+        Возвращает идентификаторы вставленных проверок (для defects - пустой список).
+        """
+        if table == "inspections":
+            return self._insert_inspections(connection, batch, report)
+        rows = [row for row, _ in batch]
+        connection.executemany(self.statements["defects"], rows)
+        report.add("defects", len(rows))
+        return []
+
+    def _insert_inspections(self, connection, batch, report):
+        next_id = self.next_inspection_id(connection)
+
+        inspections = []
+        defects = []
+        for row, nested in batch:
+            inspection_id = row[0]
+            if inspection_id is None:
+                inspection_id = next_id
+                next_id += 1
+            else:
+                next_id = max(next_id, inspection_id + 1)
+            inspections.append((inspection_id,) + row[1:])
+            defects.extend((defect[0], inspection_id) + defect[2:] for defect in nested)
+
+        connection.executemany(self.statements["inspections"], inspections)
+        report.add("inspections", len(inspections))
+
+        if defects:
+            connection.executemany(self.statements["defects"], defects)
+            report.add("defects", len(defects))
+        return [row[0] for row in inspections]
+
+
+def print_progress(report):
+    inserted = ", ".join(f"{table}: {count}" for table, count in report.inserted.items())
+    print(f"\r{inserted} | отклонено: {report.rejected} | "
+          f"{report.rows_per_second:,.0f} строк/с", end="", flush=True)
+
+
+def main():
+    from smartphone_defect_detection import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Пакетная загрузка проверок и дефектов")
+    parser.add_argument("database", help="Путь к файлу базы данных")
+    parser.add_argument("files", nargs="+", help="Файлы CSV или JSONL")
+    parser.add_argument("--table", choices=["inspections", "defects"], required=True)
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None,
+                        help="Формат файлов (по умолчанию - по расширению)")
+    parser.add_argument("--batch-size", type=int, default=5000,
+                        help="Количество записей в одной транзакции")
+    parser.add_argument("--max-errors", type=int, default=100,
+                        help="Допустимое число отклоненных записей")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager()
+    db_manager.open(args.database)
+    importer = BulkImporter(db_manager, batch_size=args.batch_size,
+                            max_errors=args.max_errors, on_progress=print_progress)
+    report = ImportReport()
+    try:
+        for path in args.files:
+            importer.import_file(path, args.table, args.format, report)
+    except (ValidationError, sqlite3.Error) as e:
+        print(f"\n{e}")
+    finally:
+        db_manager.close()
+
+    print()
+    for error in report.errors[:20]:
+        print(error)
+    print(f"Загружено строк: {report.total_inserted}, отклонено: {report.rejected}, "
+          f"время: {report.elapsed:.2f} с, {report.rows_per_second:,.0f} строк/с")
+    if report.rejected:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import argparse
+import sqlite3
+
+
+class ChangeLog:
+    """Журнал изменений строк основных таблиц для инкрементного обновления окон.
+
+    Триггеры на вставку, изменение и удаление записывают в change_log имя
+    таблицы, первичный ключ строки и операцию. Открытое окно таблицы опрашивает
+    PRAGMA data_version отдельного соединения: значение меняется только после
+    фиксации транзакции другим соединением (в том числе на другой станции),
+    поэтому опрос ничего не читает из файла. При изменении окно читает записи
+    журнала после последней примененной и перечитывает только эти строки.
+
+    Журнал ограничивается последними max_rows записями (prune); окно, отставшее
+    сильнее, перезагружается целиком.
+    """
+
+    TABLE_KEYS = {
+        "users": "user_id",
+        "smartphones": "smartphone_id",
+        "inspections": "inspection_id",
+        "defects": "defect_id",
+        "defect_images": "image_id",
+    }
+
+    # AUTOINCREMENT: номера не используются повторно после очистки журнала
+    TABLES = [
+        """CREATE TABLE IF NOT EXISTS change_log (
+            change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL CHECK(op IN ('insert', 'update', 'delete'))
+        )"""
+    ]
+
+    def __init__(self):
+        self.watcher = None
+        self.triggers = []
+        for table, key in self.TABLE_KEYS.items():
+            self.triggers.extend([
+                f"""CREATE TRIGGER IF NOT EXISTS changes_{table}_insert AFTER INSERT ON {table} BEGIN
+                    INSERT INTO change_log (table_name, row_id, op) VALUES ('{table}', NEW.{key}, 'insert');
+                END""",
+
+                f"""CREATE TRIGGER IF NOT EXISTS changes_{table}_delete AFTER DELETE ON {table} BEGIN
+                    INSERT INTO change_log (table_name, row_id, op) VALUES ('{table}', OLD.{key}, 'delete');
+                END""",
+
+                # Смена первичного ключа - удаление старой строки и изменение новой
+                f"""CREATE TRIGGER IF NOT EXISTS changes_{table}_update AFTER UPDATE ON {table} BEGIN
+                    INSERT INTO change_log (table_name, row_id, op)
+                        SELECT '{table}', OLD.{key}, 'delete' WHERE OLD.{key} IS NOT NEW.{key};
+                    INSERT INTO change_log (table_name, row_id, op) VALUES ('{table}', NEW.{key}, 'update');
+                END"""
+            ])
+
+    def create(self, connection):
+        for statement in self.TABLES + self.triggers:
+            connection.execute(statement)
+
+    def latest(self, connection):
+        """Номер последней записи журнала (0 для пустого журнала)"""
+        return connection.execute("SELECT IFNULL(MAX(change_id), 0) FROM change_log").fetchone()[0]
+
+    def since(self, connection, table, change_id, limit):
+        """Ключи строк table, измененных после change_id, и номер последней записи.
+
+        None - если часть записей уже удалена из журнала или изменений больше
+        limit: в этих случаях дешевле перечитать окно целиком.
+        """
+        oldest, latest = connection.execute(
+            "SELECT IFNULL(MIN(change_id), 0), IFNULL(MAX(change_id), 0) FROM change_log").fetchone()
+        if latest <= change_id:
+            return change_id, []
+        if oldest > change_id + 1:
+            return None
+        keys = [row[0] for row in connection.execute(
+            "SELECT DISTINCT row_id FROM change_log "
+            "WHERE change_id > ? AND change_id <= ? AND table_name = ? LIMIT ?",
+            (change_id, latest, table, limit + 1))]
+        if len(keys) > limit:
+            return None
+        return latest, keys
+
+    def prune(self, connection, max_rows):
+        """Удаление старых записей, если журнал длиннее max_rows; возвращает число удаленных"""
+        oldest, latest = connection.execute(
+            "SELECT IFNULL(MIN(change_id), 0), IFNULL(MAX(change_id), 0) FROM change_log").fetchone()
+        if latest - oldest < max_rows:
+            return 0
+        return connection.execute("DELETE FROM change_log WHERE change_id <= ?",
+                                  (latest - max_rows,)).rowcount
+
+    def watch(self, connection):
+        """Соединение только для опроса data_version (без замера запросов)"""
+        self.close()
+        self.watcher = connection
+
+    def data_version(self):
+        if self.watcher is None:
+            return None
+        return self.watcher.execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self):
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Журнал изменений строк основных таблиц")
+    parser.add_argument("command", choices=["status", "prune"])
+    parser.add_argument("database", help="Путь к файлу базы данных")
+    parser.add_argument("--keep", type=int, default=100000,
+                        help="Количество сохраняемых записей при очистке")
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.database)
+    changes = ChangeLog()
+    try:
+        if args.command == "prune":
+            removed = changes.prune(connection, args.keep)
+            connection.commit()
+            print(f"Удалено записей журнала: {removed}")
+        for table, count, last in connection.execute(
+                "SELECT table_name, COUNT(*), MAX(change_id) FROM change_log "
+                "GROUP BY table_name ORDER BY table_name"):
+            print(f"{table}: записей {count}, последняя {last}")
+    except sqlite3.Error as e:
+        print(e)
+        raise SystemExit(1)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,58 @@ class Config:
     DATABASE_DIR = os.path.join(BASE_DIR, 'databases')
     IMAGES_DIR = os.path.join(BASE_DIR, 'images')
     
-    for directory in [DATABASE_DIR, IMAGES_DIR]:
-        if not os.path.exists(directory):
-            os.makedirs(directory)
-    
     DEFAULT_DB = os.path.join(DATABASE_DIR, 'smartphone_defects.db')
     
+    # Параметры соединений SQLite (см. connection_pool.ConnectionProfile).
+    # Для базы на сетевом диске WAL недоступен: journal_mode = "delete".
+    DB_PROFILE = {
+        "journal_mode": "wal",
+        "synchronous": "normal",
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": "memory",
+        "busy_timeout": 5000,
+        "foreign_keys": True,
+    }
+    DB_READ_CONNECTIONS = 4
+    
+    # Замер запросов и журнал медленных запросов (рядом с файлом базы: <база>.slow.log)
+    QUERY_METRICS_ENABLED = True
+    SLOW_QUERY_MS = 100
+    SLOW_QUERY_LOG_BYTES = 5 * 1024 * 1024
+    SLOW_QUERY_LOG_BACKUPS = 3
+    
+    # Закрытые проверки старше этого срока переносятся в архивные файлы (archive.py)
+    ARCHIVE_AFTER_DAYS = 365
+    ARCHIVE_PERIOD = "year"
+    
+    # Опрос изменений других станций открытым окном таблицы (change_log.ChangeLog)
+    CHANGE_POLL_MS = 1000
+    CHANGE_LOG_MAX_ROWS = 100000
+    
+    # Период отчета о качестве по умолчанию (дней)
+    REPORT_DAYS = 30
+    
+    # Наибольшее отличие (бит из 64) перцептивных хешей почти одинаковых
+    # изображений дефектов (image_fingerprints.ImageFingerprints)
+    IMAGE_DUPLICATE_DISTANCE = 6
+    
+    # Запись новых изображений в хранилище <база>.images.db (image_store) со
+    # ссылкой sha256:<хеш> в image_path вместо пути к файлу
+    IMAGE_STORE_UPLOADS = False
+    
+    # Объем кэша декодированных изображений панели просмотра
+    IMAGE_CACHE_BYTES = 128 * 1024 * 1024
+    
+    # Эталонные изображения моделей (reference_images.ReferenceStore)
+    REFERENCES_DIR = os.path.join(IMAGES_DIR, 'references')
+    REFERENCE_SIZE = 512
+    REFERENCE_MAX_SAMPLES = 25
+    REFERENCE_MAX_MODELS = 200
+    REFERENCE_MAX_AGE_DAYS = 180
+    # Интервал проверки актуальности эталона по базе при сравнении снимков (секунды)
+    REFERENCE_STALE_CHECK_SECONDS = 60
+    
     APP_NAME = "Система обнаружения дефектов экранов смартфонов"
     APP_VERSION = "1.0.0"
     
@@ -19,6 +65,12 @@ class Config:
     WARNING_COLOR = "#FF9800"
     ERROR_COLOR = "#f44336"
     
+    @staticmethod
+    def ensure_dirs():
+        """Создание рабочих каталогов (вызывается при запуске, а не при импорте)"""
+        for directory in [Config.DATABASE_DIR, Config.IMAGES_DIR]:
+            os.makedirs(directory, exist_ok=True)
+    
     @staticmethod
     def get_db_path(db_name):
         return os.path.join(Config.DATABASE_DIR, db_name)
\ No newline at end of file
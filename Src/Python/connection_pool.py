@@ -0,0 +1,129 @@
+import pathlib
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class ConnectionProfile:
+    """Настройки соединения SQLite: режим журнала, синхронизация, кэш и ожидание блокировок.
+
+    Режим WAL позволяет читателям работать параллельно с записью. Для файла
+    на сетевом ресурсе WAL не поддерживается, в этом случае следует указать
+    journal_mode="delete". foreign_keys включает проверку внешних ключей и
+    каскадное удаление (в SQLite по умолчанию выключено для каждого соединения).
+    """
+
+    DEFAULTS = {
+        "journal_mode": "wal",
+        "synchronous": "normal",
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": "memory",
+        "busy_timeout": 5000,
+        "foreign_keys": True,
+    }
+
+    def __init__(self, **settings):
+        unknown = set(settings) - set(self.DEFAULTS)
+        if unknown:
+            raise ValueError(f"Неизвестные параметры соединения: {', '.join(sorted(unknown))}")
+        self.settings = dict(self.DEFAULTS, **settings)
+        for name, value in self.settings.items():
+            setattr(self, name, value)
+
+    def open(self, db_path, read_only=False, factory=sqlite3.Connection):
+        """Открытие соединения с применением профиля"""
+        timeout = self.busy_timeout / 1000.0
+        if read_only:
+            uri = pathlib.Path(db_path).resolve().as_uri() + "?mode=ro"
+            connection = sqlite3.connect(uri, uri=True, timeout=timeout,
+                                         check_same_thread=False, factory=factory)
+        else:
+            connection = sqlite3.connect(db_path, timeout=timeout, check_same_thread=False,
+                                         factory=factory)
+        self.apply(connection, read_only)
+        return connection
+
+    def apply(self, connection, read_only=False):
+        """Применение PRAGMA профиля к открытому соединению"""
+        if not read_only:
+            connection.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        connection.execute(f"PRAGMA synchronous = {self.synchronous}")
+        connection.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        connection.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        connection.execute(f"PRAGMA temp_store = {self.temp_store}")
+        connection.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        connection.execute(f"PRAGMA foreign_keys = {'ON' if self.foreign_keys else 'OFF'}")
+
+
+class ConnectionPool:
+    """Пул соединений: несколько соединений только для чтения и один писатель.
+
+    Все изменения выполняются через единственное соединение-писатель под
+    блокировкой, поэтому записи внутри процесса не конкурируют друг с другом,
+    а читатели в режиме WAL не ждут завершения записи.
+    """
+
+    def __init__(self, db_path, profile=None, readers=4, metrics=None):
+        self.db_path = db_path
+        self.profile = profile or ConnectionProfile()
+        self.max_readers = readers
+        # С metrics (query_metrics.QueryMetrics) все соединения пула замеряют запросы
+        self.factory = metrics.connection_class if metrics else sqlite3.Connection
+        self.writer_connection = self.profile.open(db_path, factory=self.factory)
+        self._write_lock = threading.RLock()
+        self._idle_readers = queue.LifoQueue()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+
+    def open_reader(self):
+        """Открытие нового соединения только для чтения"""
+        return self.profile.open(self.db_path, read_only=True, factory=self.factory)
+
+    def _acquire_reader(self):
+        try:
+            return self._idle_readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._readers_lock:
+            if len(self._readers) < self.max_readers:
+                connection = self.open_reader()
+                self._readers.append(connection)
+                return connection
+        return self._idle_readers.get()
+
+    @contextmanager
+    def reader(self):
+        """Соединение для чтения из пула"""
+        connection = self._acquire_reader()
+        try:
+            yield connection
+        finally:
+            if connection.in_transaction:
+                connection.rollback()
+            self._idle_readers.put(connection)
+
+    @contextmanager
+    def writer(self):
+        """Монопольный доступ к соединению-писателю; фиксация при успешном выходе"""
+        with self._write_lock:
+            connection = self.writer_connection
+            try:
+                yield connection
+                if connection.in_transaction:
+                    connection.commit()
+            except Exception:
+                if connection.in_transaction:
+                    connection.rollback()
+                raise
+
+    def close(self):
+        """Закрытие всех соединений пула"""
+        with self._readers_lock:
+            for connection in self._readers:
+                connection.close()
+            self._readers.clear()
+        self._idle_readers = queue.LifoQueue()
+        with self._write_lock:
+            self.writer_connection.close()
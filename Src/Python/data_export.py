@@ -0,0 +1,286 @@
+import argparse
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+
+class ExportReport:
+    """Итоги выгрузки: количество строк, время и скорость"""
+
+    def __init__(self):
+        self.rows = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+class CsvWriter:
+    def __init__(self, stream, columns, types):
+        self.writer = csv.writer(stream)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        pass
+
+
+class JsonlWriter:
+    def __init__(self, stream, columns, types):
+        self.stream = stream
+        self.columns = columns
+
+    def write(self, rows):
+        columns = self.columns
+        self.stream.writelines(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows)
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    """Колоночный Parquet: каждый пакет строк - отдельная группа строк файла.
+
+    Требует pyarrow (импортируется при первой выгрузке в Parquet); типы колонок
+    берутся из объявленных типов SQLite, поэтому схема не зависит от данных пакета.
+    """
+
+    def __init__(self, stream, columns, types, compression="snappy"):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Для выгрузки в Parquet установите пакет pyarrow")
+        self.pa = pyarrow
+        self.columns = columns
+        self.schema = pyarrow.schema([(name, self.arrow_type(column_type))
+                                      for name, column_type in zip(columns, types)])
+        self.writer = pyarrow.parquet.ParquetWriter(stream, self.schema, compression=compression)
+
+    def arrow_type(self, column_type):
+        column_type = (column_type or "").upper()
+        if "INT" in column_type:
+            return self.pa.int64()
+        if any(name in column_type for name in ("REAL", "FLOA", "DOUB", "NUM")):
+            return self.pa.float64()
+        return self.pa.string()
+
+    def write(self, rows):
+        data = {name: list(values) for name, values in zip(self.columns, zip(*rows))}
+        try:
+            table = self.pa.Table.from_pydict(data, schema=self.schema)
+        except (self.pa.ArrowInvalid, self.pa.ArrowTypeError, OverflowError):
+            # SQLite допускает в колонке значения другого типа (например, "" в INTEGER)
+            table = self.pa.Table.from_pydict(
+                {name: self.coerce(name, values) for name, values in data.items()},
+                schema=self.schema)
+        self.writer.write_table(table)
+
+    def coerce(self, name, values):
+        field_type = self.schema.field(name).type
+        if field_type == self.pa.string():
+            return [None if value is None else str(value) for value in values]
+        convert = int if field_type == self.pa.int64() else float
+        result = []
+        for value in values:
+            if value is None or value == "":
+                result.append(None)
+                continue
+            try:
+                result.append(convert(value))
+            except (TypeError, ValueError):
+                raise ValueError(f"Колонка {name}: значение {value!r} не приводится к {field_type}")
+        return result
+
+    def close(self):
+        self.writer.close()
+
+
+class DataExporter:
+    """Потоковая выгрузка таблиц и отчетов в CSV, JSONL и Parquet.
+
+    Строки читаются пакетами fetchmany из соединения для чтения и сразу
+    записываются в файл, поэтому расход памяти не зависит от объема выгрузки.
+    CSV и JSONL могут сжиматься gzip, Parquet сжимается внутри файла.
+    Кроме таблиц доступны отчеты - соединения таблиц из REPORTS.
+    """
+
+    FORMATS = ("csv", "jsonl", "parquet")
+    WRITERS = {"csv": CsvWriter, "jsonl": JsonlWriter}
+
+    # Колонки даты для отбора периода --since/--until
+    DATE_COLUMNS = {
+        "users": "created_at",
+        "smartphones": "created_at",
+        "inspections": "inspection_date",
+        "defects": "detected_at",
+        "defect_images": "uploaded_at",
+    }
+
+    # Отчет: (запрос, колонка даты, типы колонок). Проверки без дефектов
+    # выгружаются одной строкой с пустыми полями дефекта.
+    REPORTS = {
+        "inspection_defects": (
+            """SELECT i.inspection_id, i.inspection_date, i.status, i.overall_result,
+                      s.manufacturer, s.model_name, u.full_name AS inspector,
+                      d.defect_id, d.defect_type, d.severity, d.location_x, d.location_y,
+                      d.size, d.description, d.detected_at
+               FROM inspections i
+               LEFT JOIN smartphones s ON s.smartphone_id = i.smartphone_id
+               LEFT JOIN users u ON u.user_id = i.inspector_id
+               LEFT JOIN defects d ON d.inspection_id = i.inspection_id
+               {where}
+               ORDER BY i.inspection_date, i.inspection_id, d.defect_id""",
+            "i.inspection_date",
+            ["INTEGER", "TIMESTAMP", "TEXT", "TEXT", "TEXT", "TEXT", "TEXT", "INTEGER",
+             "TEXT", "INTEGER", "INTEGER", "INTEGER", "REAL", "TEXT", "TIMESTAMP"],
+        ),
+    }
+
+    def __init__(self, db_manager, batch_size=5000):
+        self.db_manager = db_manager
+        self.batch_size = batch_size
+
+    def sources(self):
+        """Основные таблицы и отчеты (служебные таблицы индексов не выгружаются)"""
+        return list(self.DATE_COLUMNS) + sorted(self.REPORTS)
+
+    def build_query(self, source, since=None, until=None):
+        """Запрос, параметры и объявленные типы колонок выгрузки"""
+        conditions, params = [], []
+        if source in self.REPORTS:
+            query, date_column, types = self.REPORTS[source]
+        else:
+            metadata = self.db_manager.schema.table(source)
+            date_column = self.DATE_COLUMNS.get(source)
+            types = [column.type for column in metadata.columns]
+            # Порядок по первичному ключу читает таблицу без сортировки в памяти
+            query = (f"SELECT {', '.join(metadata.column_names)} FROM {source} {{where}} "
+                     f"ORDER BY {metadata.key_column}")
+
+        if (since or until) and date_column is None:
+            raise ValueError(f"Для {source} отбор по дате не поддерживается")
+        for value in (since, until):
+            if value:
+                try:
+                    datetime.strptime(value, "%Y-%m-%d")
+                except ValueError:
+                    raise ValueError(f"Ожидается дата ГГГГ-ММ-ДД: {value!r}")
+        if since:
+            conditions.append(f"{date_column} >= ?")
+            params.append(since)
+        if until:
+            conditions.append(f"{date_column} < DATE(?, '+1 day')")
+            params.append(until)
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        return query.format(where=where), params, types
+
+    @staticmethod
+    def open_output(path, file_format, compress):
+        if file_format == "parquet":
+            return open(path, "wb")
+        if compress:
+            return gzip.open(path, "wt", compresslevel=6, encoding="utf-8", newline="")
+        return open(path, "w", encoding="utf-8", newline="")
+
+    def export(self, connection, source, path, file_format="csv", compress=False,
+               since=None, until=None, report=None, on_progress=None):
+        """Выгрузка source в path; при ошибке недописанный файл удаляется"""
+        if file_format not in self.FORMATS:
+            raise ValueError(f"Неподдерживаемый формат: {file_format}")
+        query, params, types = self.build_query(source, since, until)
+        report = report or ExportReport()
+
+        cursor = connection.execute(query, params)
+        columns = [description[0] for description in cursor.description]
+        try:
+            with self.open_output(path, file_format, compress) as stream:
+                if file_format == "parquet":
+                    writer = ParquetWriter(stream, columns, types,
+                                           compression="gzip" if compress else "snappy")
+                else:
+                    writer = self.WRITERS[file_format](stream, columns, types)
+                while True:
+                    rows = cursor.fetchmany(self.batch_size)
+                    if not rows:
+                        break
+                    writer.write(rows)
+                    report.rows += len(rows)
+                    if on_progress:
+                        on_progress(report)
+                writer.close()
+        except BaseException:
+            cursor.close()
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        cursor.close()
+        report.finished = time.perf_counter()
+        return report
+
+    @classmethod
+    def default_extension(cls, file_format, compress):
+        return f".{file_format}" + (".gz" if compress and file_format != "parquet" else "")
+
+
+def print_progress(report):
+    print(f"\rвыгружено строк: {report.rows:,} | {report.rows_per_second:,.0f} строк/с",
+          end="", flush=True)
+
+
+def main():
+    from smartphone_defect_detection import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Выгрузка таблиц и отчетов в CSV, JSONL и Parquet")
+    parser.add_argument("database", help="Путь к файлу базы данных")
+    parser.add_argument("source", help="Таблица или отчет (" + ", ".join(DataExporter.REPORTS) + ")")
+    parser.add_argument("output", help="Файл выгрузки")
+    parser.add_argument("--format", choices=DataExporter.FORMATS, default=None,
+                        help="Формат (по умолчанию - по расширению файла)")
+    parser.add_argument("--gzip", action="store_true", help="Сжать выгрузку gzip")
+    parser.add_argument("--since", help="Начало периода, ГГГГ-ММ-ДД")
+    parser.add_argument("--until", help="Конец периода включительно, ГГГГ-ММ-ДД")
+    parser.add_argument("--batch-size", type=int, default=5000,
+                        help="Количество строк в одном пакете чтения")
+    args = parser.parse_args()
+
+    file_format = args.format
+    if file_format is None:
+        name = args.output[:-3] if args.output.endswith(".gz") else args.output
+        file_format = os.path.splitext(name)[1].lstrip(".").lower()
+    compress = args.gzip or (args.output.endswith(".gz") and file_format != "parquet")
+
+    db_manager = DatabaseManager()
+    db_manager.open(args.database)
+    exporter = DataExporter(db_manager, batch_size=args.batch_size)
+    try:
+        if args.source not in exporter.sources():
+            raise ValueError(f"Неизвестная таблица или отчет: {args.source}")
+        with db_manager.pool.reader() as connection:
+            report = exporter.export(connection, args.source, args.output, file_format, compress,
+                                     args.since, args.until, on_progress=print_progress)
+    except (ValueError, RuntimeError, OSError, sqlite3.Error) as e:
+        print(f"\n{e}")
+        raise SystemExit(1)
+    finally:
+        db_manager.close()
+
+    print(f"\nВыгружено строк: {report.rows}, время: {report.elapsed:.2f} с, "
+          f"{report.rows_per_second:,.0f} строк/с, размер: {os.path.getsize(args.output):,} байт")
+
+
+if __name__ == "__main__":
+    main()
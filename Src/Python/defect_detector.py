@@ -0,0 +1,380 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import image_store
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff"}
+
+
+def box_mean(values, radius):
+    """Среднее в окне (2r+1)x(2r+1) через интегральное изображение"""
+    padded = np.pad(values, radius + 1, mode="edge").astype(np.float64)
+    integral = padded.cumsum(axis=0).cumsum(axis=1)
+    size = 2 * radius + 1
+    total = (integral[size:, size:] - integral[:-size, size:]
+             - integral[size:, :-size] + integral[:-size, :-size])
+    return (total / (size * size))[:values.shape[0], :values.shape[1]].astype(np.float32)
+
+
+def gradient_magnitude(gray):
+    """Модуль градиента (оператор Собеля на срезах массива)"""
+    padded = np.pad(gray, 1, mode="edge")
+    gx = (padded[:-2, 2:] + 2 * padded[1:-1, 2:] + padded[2:, 2:]
+          - padded[:-2, :-2] - 2 * padded[1:-1, :-2] - padded[2:, :-2])
+    gy = (padded[2:, :-2] + 2 * padded[2:, 1:-1] + padded[2:, 2:]
+          - padded[:-2, :-2] - 2 * padded[:-2, 1:-1] - padded[:-2, 2:])
+    return np.hypot(gx, gy) / 8.0
+
+
+def robust_threshold(values, k):
+    """Порог median + k * MAD, устойчивый к самим дефектам"""
+    median = np.median(values)
+    mad = np.median(np.abs(values - median)) * 1.4826
+    return median + k * max(mad, 1e-3)
+
+
+def label_components(mask):
+    """Разметка связных областей (8-связность) распространением минимальной метки.
+
+    Каждая итерация - векторные операции над всем массивом; переход по
+    указателям (метка метки) сокращает число итераций до логарифмического.
+    """
+    height, width = mask.shape
+    if not mask.any():
+        return np.zeros(mask.shape, dtype=np.int64), 0
+
+    background = height * width + 1
+    labels = np.where(mask, np.arange(1, height * width + 1).reshape(height, width), background)
+
+    while True:
+        padded = np.pad(labels, 1, mode="constant", constant_values=background)
+        candidates = labels
+        for dy in (0, 1, 2):
+            for dx in (0, 1, 2):
+                if dy == 1 and dx == 1:
+                    continue
+                candidates = np.minimum(candidates, padded[dy:dy + height, dx:dx + width])
+        candidates = np.where(mask, candidates, background)
+
+        flat = candidates.ravel()
+        inside = flat < background
+        flat[inside] = np.minimum(flat[inside], flat[flat[inside] - 1])
+
+        if np.array_equal(candidates, labels):
+            break
+        labels = candidates
+
+    labels = np.where(mask, labels, 0)
+    roots, inverse = np.unique(labels, return_inverse=True)
+    inverse = inverse.reshape(mask.shape)
+    if roots[0] == 0:
+        return inverse, len(roots) - 1
+    return inverse + 1, len(roots)
+
+
+def component_properties(labels, count, weights=None):
+    """Площадь, центр, главные оси и средний вес областей (через np.bincount)"""
+    ys, xs = np.nonzero(labels)
+    ids = labels[ys, xs]
+    xs = xs.astype(np.float64)
+    ys = ys.astype(np.float64)
+    length = count + 1
+
+    area = np.bincount(ids, minlength=length)
+    safe_area = np.maximum(area, 1)
+    cx = np.bincount(ids, xs, length) / safe_area
+    cy = np.bincount(ids, ys, length) / safe_area
+    dx = xs - cx[ids]
+    dy = ys - cy[ids]
+    sxx = np.bincount(ids, dx * dx, length) / safe_area
+    syy = np.bincount(ids, dy * dy, length) / safe_area
+    sxy = np.bincount(ids, dx * dy, length) / safe_area
+
+    spread = np.sqrt(((sxx - syy) / 2) ** 2 + sxy ** 2)
+    major = (sxx + syy) / 2 + spread
+    minor = np.maximum((sxx + syy) / 2 - spread, 1e-6)
+
+    if weights is None:
+        mean_weight = np.zeros(length)
+    else:
+        mean_weight = np.bincount(ids, weights[ys.astype(int), xs.astype(int)], length) / safe_area
+
+    return {
+        "area": area[1:],
+        "cx": cx[1:],
+        "cy": cy[1:],
+        "length": 4 * np.sqrt(major[1:]),
+        "elongation": np.sqrt(major[1:] / minor[1:]),
+        "weight": mean_weight[1:],
+    }
+
+
+class ScreenDefectDetector:
+    """Поиск дефектов экрана на фотографии векторными операциями NumPy.
+
+    Изображение уменьшается до WORK_SIZE, после чего строятся карта градиента,
+    карта локального контраста и карта отклонения цвета. Связные области
+    классифицируются по форме: длинные тонкие - трещины и царапины, компактные
+    у края экрана - сколы, крупные области без резких границ - изменение цвета.
+    """
+
+    WORK_SIZE = 768
+    CONTRAST_RADIUS = 7
+    COLOR_RADIUS = 24
+    EDGE_K = 6.0
+    CONTRAST_K = 6.0
+    COLOR_THRESHOLD = 0.08
+    MIN_AREA = 12
+    MIN_DISCOLORATION_FRACTION = 0.004
+    BORDER_FRACTION = 0.05
+
+    def load(self, path):
+        """Чтение изображения в массив float32 RGB 0..1 и коэффициент масштаба"""
+        from PIL import Image
+
+        with image_store.open_source(path) as source, Image.open(source) as image:
+            image.draft("RGB", (self.WORK_SIZE, self.WORK_SIZE))
+            original_width = image.size[0]
+            image = image.convert("RGB")
+            image.thumbnail((self.WORK_SIZE, self.WORK_SIZE), Image.Resampling.BILINEAR)
+            scale = original_width / image.size[0]
+            return np.asarray(image, dtype=np.float32) / 255.0, scale
+
+    def detect_file(self, path):
+        """Поиск дефектов на изображении из файла; координаты - в пикселях оригинала"""
+        rgb, scale = self.load(path)
+        defects = self.detect(rgb)
+        for defect in defects:
+            defect["location_x"] = int(round(defect["location_x"] * scale))
+            defect["location_y"] = int(round(defect["location_y"] * scale))
+            defect["size"] = round(defect["size"] * scale, 1)
+        return defects
+
+    def detect(self, rgb):
+        """Поиск дефектов на массиве HxWx3 (float 0..1)"""
+        gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        height, width = gray.shape
+
+        gradient = gradient_magnitude(gray)
+        local_mean = box_mean(gray, self.CONTRAST_RADIUS)
+        contrast = np.abs(gray - local_mean)
+
+        structure = ((gradient > robust_threshold(gradient, self.EDGE_K))
+                     | (contrast > robust_threshold(contrast, self.CONTRAST_K)))
+
+        color_mean = np.stack([box_mean(rgb[..., c], self.COLOR_RADIUS) for c in range(3)], axis=-1)
+        reference = np.median(color_mean.reshape(-1, 3), axis=0)
+        deviation = np.linalg.norm(color_mean - reference, axis=-1)
+        discolored = deviation > self.COLOR_THRESHOLD
+
+        defects = self.classify_structures(structure, contrast, discolored, width, height)
+        defects.extend(self.classify_discoloration(discolored & ~structure, deviation,
+                                                   width, height))
+        return defects
+
+    def classify_structures(self, mask, contrast, discolored, width, height):
+        labels, count = label_components(mask)
+        if count == 0:
+            return []
+        props = component_properties(labels, count, contrast)
+        diagonal = float(np.hypot(width, height))
+        border = self.BORDER_FRACTION * min(width, height)
+
+        defects = []
+        for i in np.nonzero(props["area"] >= self.MIN_AREA)[0]:
+            length = props["length"][i]
+            elongation = props["elongation"][i]
+            cx, cy = props["cx"][i], props["cy"][i]
+            near_border = min(cx, cy, width - 1 - cx, height - 1 - cy) <= border
+
+            if elongation >= 3.0:
+                defect_type = "crack" if length >= 0.25 * min(width, height) else "scratch"
+                size = length
+            elif near_border:
+                defect_type = "chip"
+                size = 2 * np.sqrt(props["area"][i] / np.pi)
+            elif discolored[int(cy), int(cx)]:
+                # Граница пятна изменения цвета учитывается как discoloration
+                continue
+            else:
+                defect_type = "other"
+                size = 2 * np.sqrt(props["area"][i] / np.pi)
+
+            defects.append(self.make_defect(defect_type, cx, cy, size, diagonal,
+                                            props["weight"][i]))
+        return defects
+
+    def classify_discoloration(self, mask, deviation, width, height):
+        labels, count = label_components(mask)
+        if count == 0:
+            return []
+        props = component_properties(labels, count, deviation)
+        diagonal = float(np.hypot(width, height))
+        min_area = self.MIN_DISCOLORATION_FRACTION * width * height
+
+        return [self.make_defect("discoloration", props["cx"][i], props["cy"][i],
+                                 2 * np.sqrt(props["area"][i] / np.pi), diagonal,
+                                 props["weight"][i])
+                for i in np.nonzero(props["area"] >= min_area)[0]]
+
+    def make_defect(self, defect_type, cx, cy, size, diagonal, strength):
+        relative_size = size / diagonal
+        score = min(relative_size * 8, 1.0) * 0.7 + min(float(strength) * 4, 1.0) * 0.3
+        severity = int(np.clip(1 + round(score * 4), 1, 5))
+        return {
+            "defect_type": defect_type,
+            "severity": severity,
+            "location_x": float(cx),
+            "location_y": float(cy),
+            "size": float(size),
+            "description": f"Обнаружено автоматически (контраст {float(strength):.3f})",
+        }
+
+
+_detector = None
+
+
+def detect_image_file(path):
+    """Обработка одного файла в дочернем процессе: (path, defects, error)"""
+    global _detector
+    if _detector is None:
+        _detector = ScreenDefectDetector()
+    try:
+        return path, _detector.detect_file(path), None
+    except Exception as e:
+        return path, [], str(e)
+
+
+def overall_result(defects):
+    """Итог проверки по найденным дефектам"""
+    if not defects:
+        return "pass"
+    if max(defect["severity"] for defect in defects) >= 3:
+        return "fail"
+    return "conditional"
+
+
+class DefectDetectionEngine:
+    """Пакетная обработка фотографий экранов в пуле процессов с записью в БД.
+
+    Для каждого изображения создается проверка (inspections) с найденными
+    дефектами (defects); запись выполняется через BulkImporter пакетами.
+    """
+
+    def __init__(self, db_manager, workers=None, batch_size=200):
+        self.db_manager = db_manager
+        self.workers = workers
+        self.batch_size = batch_size
+
+    def find_images(self, directory):
+        for root, _, files in os.walk(directory):
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                    yield os.path.join(root, name)
+
+    def process_directory(self, directory, smartphone_id, inspector_id=None, on_progress=None):
+        """Обработка всех изображений каталога; возвращает статистику"""
+        from bulk_import import BulkImporter, ImportReport
+
+        paths = list(self.find_images(directory))
+        stats = {"images": 0, "defects": 0, "failed": 0, "errors": []}
+        started = time.perf_counter()
+        importer = BulkImporter(self.db_manager, batch_size=self.batch_size, max_errors=None)
+        report = ImportReport()
+
+        def records(results):
+            for path, defects, error in results:
+                stats["images"] += 1
+                if error:
+                    stats["failed"] += 1
+                    stats["errors"].append(f"{path}: {error}")
+                    continue
+                stats["defects"] += len(defects)
+                stats["images_per_second"] = stats["images"] / (time.perf_counter() - started)
+                if on_progress and stats["images"] % 10 == 0:
+                    on_progress(stats)
+                yield path, {
+                    "smartphone_id": smartphone_id,
+                    "inspector_id": inspector_id,
+                    "status": "completed",
+                    "overall_result": overall_result(defects),
+                    "image_path": os.path.abspath(path),
+                    "notes": "Автоматическая проверка",
+                    "defects": defects,
+                }
+
+        workers = self.workers or os.cpu_count() or 1
+        chunksize = max(1, min(16, len(paths) // (4 * workers)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            importer.import_records(records(pool.map(detect_image_file, paths,
+                                                     chunksize=chunksize)),
+                                    "inspections", report, directory)
+
+        stats["errors"].extend(report.errors)
+        stats["elapsed"] = time.perf_counter() - started
+        stats["images_per_second"] = stats["images"] / stats["elapsed"] if stats["elapsed"] else 0.0
+        if on_progress:
+            on_progress(stats)
+        return stats
+
+    def process_inspection(self, inspection_id, detector=None):
+        """Поиск дефектов на изображении существующей проверки"""
+        row = self.db_manager.fetch_one(
+            "SELECT image_path FROM inspections WHERE inspection_id=?", (inspection_id,))
+        if not row or not row[0]:
+            raise ValueError(f"У проверки {inspection_id} нет изображения")
+
+        defects = (detector or ScreenDefectDetector()).detect_file(row[0])
+        with self.db_manager.pool.writer() as connection:
+            connection.executemany(
+                "INSERT INTO defects (inspection_id, defect_type, severity, location_x, "
+                "location_y, size, description) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(inspection_id, d["defect_type"], d["severity"], d["location_x"],
+                  d["location_y"], d["size"], d["description"]) for d in defects])
+            connection.execute(
+                "UPDATE inspections SET overall_result=? WHERE inspection_id=?",
+                (overall_result(defects), inspection_id))
+        return defects
+
+
+def print_progress(stats):
+    print(f"\rизображений: {stats['images']} | дефектов: {stats['defects']} | "
+          f"ошибок: {stats['failed']} | {stats.get('images_per_second', 0):,.1f} изобр./с",
+          end="", flush=True)
+
+
+def main():
+    from smartphone_defect_detection import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Автоматический поиск дефектов экранов")
+    parser.add_argument("database", help="Путь к файлу базы данных")
+    parser.add_argument("directory", help="Каталог с фотографиями экранов")
+    parser.add_argument("--smartphone-id", type=int, required=True)
+    parser.add_argument("--inspector-id", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None, help="Число процессов")
+    parser.add_argument("--batch-size", type=int, default=200,
+                        help="Количество проверок в одной транзакции")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager()
+    db_manager.open(args.database)
+    engine = DefectDetectionEngine(db_manager, workers=args.workers, batch_size=args.batch_size)
+    try:
+        stats = engine.process_directory(args.directory, args.smartphone_id, args.inspector_id,
+                                         on_progress=print_progress)
+    finally:
+        db_manager.close()
+
+    print()
+    for error in stats["errors"][:20]:
+        print(error)
+    print(f"Обработано изображений: {stats['images']}, найдено дефектов: {stats['defects']}, "
+          f"время: {stats['elapsed']:.2f} с, {stats['images_per_second']:,.1f} изобр./с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+import argparse
+import threading
+
+from change_log import ChangeLog
+
+
+class DefectLocationIndex:
+    """Пространственный индекс координат дефектов (R*Tree).
+
+    Таблица defects_rtree хранит прямоугольник каждого дефекта с известными
+    координатами (location_x/location_y +- size/2) и поддерживается триггерами
+    на defects. Поиск по области экрана выполняется по R*Tree, а не полным
+    просмотром таблицы defects.
+    """
+
+    TABLES = [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS defects_rtree USING rtree(
+            defect_id, min_x, max_x, min_y, max_y
+        )"""
+    ]
+
+    BOX = """
+        SELECT {row}.defect_id,
+               {row}.location_x - IFNULL({row}.size, 0) / 2.0,
+               {row}.location_x + IFNULL({row}.size, 0) / 2.0,
+               {row}.location_y - IFNULL({row}.size, 0) / 2.0,
+               {row}.location_y + IFNULL({row}.size, 0) / 2.0"""
+
+    TRIGGERS = [
+        f"""CREATE TRIGGER IF NOT EXISTS defects_rtree_insert AFTER INSERT ON defects
+        WHEN NEW.location_x IS NOT NULL AND NEW.location_y IS NOT NULL BEGIN
+            INSERT INTO defects_rtree {BOX.format(row="NEW")};
+        END""",
+
+        """CREATE TRIGGER IF NOT EXISTS defects_rtree_delete AFTER DELETE ON defects BEGIN
+            DELETE FROM defects_rtree WHERE defect_id = OLD.defect_id;
+        END""",
+
+        f"""CREATE TRIGGER IF NOT EXISTS defects_rtree_update
+        AFTER UPDATE OF defect_id, location_x, location_y, size ON defects BEGIN
+            DELETE FROM defects_rtree WHERE defect_id = OLD.defect_id;
+            INSERT INTO defects_rtree {BOX.format(row="NEW")}
+            WHERE NEW.location_x IS NOT NULL AND NEW.location_y IS NOT NULL;
+        END"""
+    ]
+
+    # CROSS JOIN фиксирует порядок соединения: сначала поиск по R*Tree
+    REGION_QUERY = """
+        SELECT d.defect_id, d.inspection_id, i.smartphone_id, d.defect_type, d.severity,
+               d.location_x, d.location_y, d.size, i.inspection_date
+        FROM defects_rtree r
+        CROSS JOIN defects d ON d.defect_id = r.defect_id
+        CROSS JOIN inspections i ON i.inspection_id = d.inspection_id
+        WHERE r.max_x >= ? AND r.min_x <= ? AND r.max_y >= ? AND r.min_y <= ?"""
+
+    def is_installed(self, connection):
+        return connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'defects_rtree'").fetchone() is not None
+
+    def create(self, connection):
+        """Создание R*Tree и триггеров и заполнение по таблице defects"""
+        for statement in self.TABLES + self.TRIGGERS:
+            connection.execute(statement)
+        connection.execute("DELETE FROM defects_rtree")
+        connection.execute(f"INSERT INTO defects_rtree {self.BOX.format(row='defects')} "
+                           "FROM defects WHERE location_x IS NOT NULL AND location_y IS NOT NULL")
+
+    def region(self, connection, x_min, y_min, x_max, y_max, smartphone_id=None,
+               defect_type=None, since=None):
+        """Дефекты, пересекающие прямоугольник экрана, с дополнительными фильтрами"""
+        query = self.REGION_QUERY
+        params = [x_min, x_max, y_min, y_max]
+        if smartphone_id is not None:
+            query += " AND i.smartphone_id = ?"
+            params.append(smartphone_id)
+        if defect_type is not None:
+            query += " AND d.defect_type = ?"
+            params.append(defect_type)
+        if since is not None:
+            query += " AND i.inspection_date >= ?"
+            params.append(since)
+        return connection.execute(query + " ORDER BY d.defect_id", params).fetchall()
+
+    def near(self, connection, x, y, radius, **filters):
+        """Дефекты в пределах radius пикселей от точки (x, y)"""
+        return self.region(connection, x - radius, y - radius, x + radius, y + radius,
+                           **filters)
+
+
+class DefectHeatmaps:
+    """Тепловые карты расположения дефектов по модели и типу дефекта.
+
+    Гистограммы NumPy кэшируются в памяти вместе с последним учтенным
+    defect_id и номером записи журнала изменений (change_log). Пока журнал не
+    изменился, карта возвращается без запросов к defects. Иначе по журналу
+    проверяется, затронуты ли уже учтенные дефекты (изменение координат,
+    удаление, перенос проверки на другую модель): тогда карта строится
+    заново, а если добавлены только новые дефекты - дополняется ими.
+    NumPy импортируется при первом построении карты.
+    """
+
+    BINS = 64
+    DEFAULT_EXTENT = 4096
+    # Наибольшее число измененных строк, проверяемых по журналу до перестроения
+    CHANGE_LIMIT = 1000
+
+    POINTS_QUERY = """
+        SELECT d.defect_id, d.location_x, d.location_y
+        FROM defects d JOIN inspections i ON i.inspection_id = d.inspection_id
+        WHERE d.location_x IS NOT NULL AND d.location_y IS NOT NULL AND d.defect_id > ?"""
+
+    def __init__(self, bins=None):
+        self.bins = bins or self.BINS
+        self.changes = ChangeLog()
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _filters(self, smartphone_id, defect_type):
+        query = ""
+        params = []
+        if smartphone_id is not None:
+            query += " AND i.smartphone_id = ?"
+            params.append(smartphone_id)
+        if defect_type is not None:
+            query += " AND d.defect_type = ?"
+            params.append(defect_type)
+        return query, params
+
+    def extent(self, connection, smartphone_id):
+        """Размер области карты: наибольшая сторона разрешения модели"""
+        query = "SELECT resolution FROM smartphones"
+        params = ()
+        if smartphone_id is not None:
+            query += " WHERE smartphone_id = ?"
+            params = (smartphone_id,)
+        sides = []
+        for (resolution,) in connection.execute(query, params):
+            try:
+                sides.extend(int(part) for part in resolution.lower().replace(" ", "").split("x"))
+            except (AttributeError, ValueError):
+                continue
+        return max(sides) if sides else self.DEFAULT_EXTENT
+
+    def is_outdated(self, connection, cached):
+        """Изменились ли после построения карты уже учтенные в ней дефекты"""
+        changes = self.changes.since(connection, "defects", cached["change_id"], self.CHANGE_LIMIT)
+        if changes is None or any(key <= cached["last_defect_id"] for key in changes[1]):
+            return True
+        changes = self.changes.since(connection, "inspections", cached["change_id"], self.CHANGE_LIMIT)
+        if changes is None:
+            return True
+        if not changes[1]:
+            return False
+        placeholders = ", ".join("?" for _ in changes[1])
+        return connection.execute(
+            f"SELECT 1 FROM defects WHERE inspection_id IN ({placeholders}) AND defect_id <= ? LIMIT 1",
+            changes[1] + [cached["last_defect_id"]]).fetchone() is not None
+
+    def heatmap(self, connection, smartphone_id=None, defect_type=None):
+        """Гистограмма (bins x bins, строки - ось Y) и размер области в пикселях"""
+        import numpy as np
+
+        key = (smartphone_id, defect_type)
+        filters, params = self._filters(smartphone_id, defect_type)
+
+        with self._lock:
+            cached = self._cache.get(key)
+        # Номер журнала читается до дефектов: изменения между запросами
+        # будут повторно проверены при следующем обращении
+        change_id = self.changes.latest(connection)
+        if cached is not None:
+            if cached["change_id"] == change_id:
+                return cached["histogram"], cached["extent"]
+            if self.is_outdated(connection, cached):
+                cached = None
+        if cached is None:
+            extent = self.extent(connection, smartphone_id)
+            cached = {"histogram": np.zeros((self.bins, self.bins), dtype=np.int64),
+                      "extent": extent, "last_defect_id": 0}
+        cached = dict(cached, change_id=change_id)
+
+        rows = connection.execute(self.POINTS_QUERY + filters,
+                                  [cached["last_defect_id"]] + params).fetchall()
+        if rows:
+            points = np.array(rows, dtype=np.float64)
+            extent = cached["extent"]
+            # Точки за пределами области попадают в крайние ячейки
+            xs = np.clip(points[:, 1], 0, extent - 1e-6)
+            ys = np.clip(points[:, 2], 0, extent - 1e-6)
+            histogram, _, _ = np.histogram2d(ys, xs, bins=self.bins,
+                                             range=[[0, extent], [0, extent]])
+            cached = dict(cached, histogram=cached["histogram"] + histogram.astype(np.int64),
+                          last_defect_id=int(points[:, 0].max()))
+
+        with self._lock:
+            self._cache[key] = cached
+        return cached["histogram"], cached["extent"]
+
+    def invalidate(self):
+        with self._lock:
+            self._cache.clear()
+
+    @staticmethod
+    def render(histogram, size=512):
+        """Изображение тепловой карты (PIL.Image) с логарифмической шкалой"""
+        import numpy as np
+        from PIL import Image
+
+        values = np.log1p(histogram.astype(np.float64))
+        if values.max() > 0:
+            values /= values.max()
+        stops = np.array([0.0, 0.33, 0.66, 1.0])
+        colors = np.array([[0, 0, 32], [33, 150, 243], [255, 152, 0], [244, 67, 54]])
+        rgb = np.stack([np.interp(values, stops, colors[:, c]) for c in range(3)], axis=-1)
+        image = Image.fromarray(rgb.astype(np.uint8), "RGB")
+        return image.resize((size, size), Image.Resampling.NEAREST)
+
+
+def main():
+    from smartphone_defect_detection import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Пространственные запросы и тепловые карты дефектов")
+    parser.add_argument("database", help="Путь к файлу базы данных")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    region = subparsers.add_parser("region", help="Дефекты в прямоугольной области экрана")
+    region.add_argument("x_min", type=float)
+    region.add_argument("y_min", type=float)
+    region.add_argument("x_max", type=float)
+    region.add_argument("y_max", type=float)
+    heatmap = subparsers.add_parser("heatmap", help="Тепловая карта в файл PNG")
+    heatmap.add_argument("output")
+    for subparser in (region, heatmap):
+        subparser.add_argument("--smartphone-id", type=int, default=None)
+        subparser.add_argument("--type", dest="defect_type", default=None)
+    region.add_argument("--since", default=None, help="Не ранее даты проверки (ГГГГ-ММ-ДД)")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager()
+    db_manager.open(args.database)
+    try:
+        with db_manager.pool.reader() as connection:
+            if args.command == "region":
+                rows = DefectLocationIndex().region(
+                    connection, args.x_min, args.y_min, args.x_max, args.y_max,
+                    smartphone_id=args.smartphone_id, defect_type=args.defect_type,
+                    since=args.since)
+                for row in rows:
+                    print(" | ".join("" if value is None else str(value) for value in row))
+                print(f"Найдено дефектов: {len(rows)}")
+            else:
+                histogram, extent = DefectHeatmaps().heatmap(
+                    connection, args.smartphone_id, args.defect_type)
+                DefectHeatmaps.render(histogram).save(args.output)
+                print(f"Дефектов на карте: {int(histogram.sum())}, область: {extent}x{extent} пикс.")
+    finally:
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import sqlite3
+
+
+class FullTextSearch:
+    """Полнотекстовый поиск по inspections.notes и defects.description (FTS5).
+
+    Индексы FTS5 с внешним содержимым (content=...) хранят только словарь,
+    сам текст читается из основных таблиц. Индексы поддерживаются триггерами
+    при вставке, удалении и изменении текста. Результаты упорядочиваются по
+    релевантности bm25 и возвращаются постранично.
+    """
+
+    INDEXES = {
+        "inspections": ("inspections_fts", "notes", "inspection_id"),
+        "defects": ("defects_fts", "description", "defect_id"),
+    }
+
+    HIGHLIGHT = ("[", "]")
+
+    def __init__(self):
+        self.tables = []
+        self.triggers = []
+        for table, (index, column, key) in self.INDEXES.items():
+            self.tables.append(
+                f"""CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5(
+                    {column}, content='{table}', content_rowid='{key}',
+                    tokenize='unicode61 remove_diacritics 2'
+                )""")
+            self.triggers.extend([
+                f"""CREATE TRIGGER IF NOT EXISTS {index}_insert AFTER INSERT ON {table} BEGIN
+                    INSERT INTO {index}(rowid, {column}) VALUES (NEW.{key}, NEW.{column});
+                END""",
+
+                f"""CREATE TRIGGER IF NOT EXISTS {index}_delete AFTER DELETE ON {table} BEGIN
+                    INSERT INTO {index}({index}, rowid, {column})
+                    VALUES ('delete', OLD.{key}, OLD.{column});
+                END""",
+
+                f"""CREATE TRIGGER IF NOT EXISTS {index}_update
+                AFTER UPDATE OF {key}, {column} ON {table} BEGIN
+                    INSERT INTO {index}({index}, rowid, {column})
+                    VALUES ('delete', OLD.{key}, OLD.{column});
+                    INSERT INTO {index}(rowid, {column}) VALUES (NEW.{key}, NEW.{column});
+                END"""
+            ])
+
+    @classmethod
+    def supports(cls, table_name):
+        return table_name in cls.INDEXES
+
+    def is_installed(self, connection):
+        return connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'inspections_fts'").fetchone() is not None
+
+    def create(self, connection):
+        """Создание индексов и триггеров и заполнение индексов по основным таблицам"""
+        for statement in self.tables + self.triggers:
+            connection.execute(statement)
+        self.rebuild(connection)
+
+    def rebuild(self, connection):
+        for index, _, _ in self.INDEXES.values():
+            connection.execute(f"INSERT INTO {index}({index}) VALUES ('rebuild')")
+
+    @staticmethod
+    def match_expression(text):
+        """Запрос FTS5 из введенного текста: все слова обязательны, слово* - по префиксу"""
+        terms = []
+        for word in text.split():
+            prefix = word.endswith("*")
+            word = word.rstrip("*").replace('"', '""')
+            if word:
+                terms.append(f'"{word}"' + ("*" if prefix else ""))
+        return " ".join(terms)
+
+    def search(self, connection, table, text, columns, limit, offset=0):
+        """Страница найденных строк таблицы, отсортированных по bm25.
+
+        Каждая строка содержит колонки columns и последним значением - текст
+        с выделенными совпадениями.
+        """
+        index, column, key = self.INDEXES[table]
+        expression = self.match_expression(text)
+        if not expression:
+            return []
+
+        select = ", ".join(f"t.{name}" for name in columns)
+        start, end = self.HIGHLIGHT
+        query = f"""
+            SELECT {select}, highlight({index}, 0, '{start}', '{end}')
+            FROM {index} JOIN {table} t ON t.{key} = {index}.rowid
+            WHERE {index} MATCH ?
+            ORDER BY {index}.rank
+            LIMIT ? OFFSET ?"""
+        return connection.execute(query, (expression, limit, offset)).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Полнотекстовый поиск по заметкам и описаниям")
+    parser.add_argument("database", help="Путь к файлу базы данных")
+    parser.add_argument("table", choices=sorted(FullTextSearch.INDEXES))
+    parser.add_argument("text", help="Искомый текст")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.database)
+    search = FullTextSearch()
+    try:
+        key = FullTextSearch.INDEXES[args.table][2]
+        for row in search.search(connection, args.table, args.text, [key], args.limit):
+            print(f"{row[0]}: {row[1]}")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+import argparse
+import os
+import threading
+import time
+from itertools import combinations
+
+import numpy as np
+
+import image_store
+from config import Config
+
+HASH_SIZE = 8
+DCT_SIZE = 32
+
+# Число единичных битов в байте - для расстояния Хэмминга по массивам хешей
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def dct_matrix(size):
+    """Матрица DCT-II: dct(x) = M @ x"""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+DCT = dct_matrix(DCT_SIZE)
+
+
+def pack_bits(bits):
+    """Биты (N, 64) в 64-битные хеши; int64, так как INTEGER в SQLite знаковый"""
+    return np.packbits(bits, axis=1).view(">u8").ravel().astype(np.uint64).view(np.int64)
+
+
+def dhash(small):
+    """Разностный хеш по изображениям (N, 8, 9): сравнение соседних пикселей строки"""
+    return pack_bits((small[:, :, 1:] > small[:, :, :-1]).reshape(len(small), -1))
+
+
+def phash(gray):
+    """Перцептивный хеш по изображениям (N, 32, 32): знаки низких частот DCT относительно медианы"""
+    coefficients = np.einsum("ij,njk,lk->nil", DCT, gray, DCT)[:, :HASH_SIZE, :HASH_SIZE]
+    coefficients = coefficients.reshape(len(gray), -1)
+    median = np.median(coefficients[:, 1:], axis=1, keepdims=True)
+    return pack_bits(coefficients > median)
+
+
+def distances(hashes, value):
+    """Расстояния Хэмминга от value до каждого хеша массива int64"""
+    difference = np.bitwise_xor(np.asarray(hashes, dtype=np.int64), np.int64(value))
+    return POPCOUNT[difference.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def fingerprint_files(paths):
+    """dHash и pHash файлов изображений; выполняется в дочернем процессе.
+
+    Изображения декодируются по одному, хеши вычисляются одним вызовом NumPy
+    для всего списка. Возвращает список (dhash, phash, error).
+    """
+    from PIL import Image
+
+    grays, smalls, errors = [], [], []
+    for path in paths:
+        try:
+            with image_store.open_source(path) as source, Image.open(source) as image:
+                # Для JPEG draft() декодирует сразу в уменьшенном масштабе
+                image.draft("L", (DCT_SIZE, DCT_SIZE))
+                image = image.convert("L")
+                grays.append(np.asarray(image.resize((DCT_SIZE, DCT_SIZE), Image.Resampling.BILINEAR),
+                                        dtype=np.float32))
+                smalls.append(np.asarray(image.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BILINEAR),
+                                         dtype=np.int16))
+            errors.append(None)
+        except Exception as e:
+            errors.append(str(e))
+
+    if grays:
+        hashes = iter(zip(dhash(np.stack(smalls)).tolist(), phash(np.stack(grays)).tolist()))
+    results = []
+    for error in errors:
+        results.append((None, None, error) if error else (*next(hashes), None))
+    return results
+
+
+class HashIndex:
+    """Индекс 64-битных хешей для поиска по расстоянию Хэмминга (multi-index hashing).
+
+    Хеш делится на BANDS полос по 16 бит; для каждой полосы хранится
+    отсортированный массив значений. Если хеши отличаются не более чем на
+    radius битов, хотя бы в одной полосе они отличаются не более чем на
+    radius // BANDS битов, поэтому кандидаты находятся двоичным поиском по
+    полосам со всеми вариантами из нескольких измененных битов, а точное
+    расстояние проверяется только для них. Новые хеши копятся в небольшом
+    буфере и проверяются перебором до следующего слияния.
+    """
+
+    BANDS = 4
+    BAND_BITS = 16
+    MERGE_SIZE = 4096
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.hashes = np.empty(0, dtype=np.int64)
+        self.bands = []
+        self.pending = []
+        self._masks = {}
+
+    def __len__(self):
+        return len(self.ids) + len(self.pending)
+
+    def add(self, rows):
+        """Добавление пар (image_id, хеш)"""
+        self.pending.extend(rows)
+        if len(self.pending) >= self.MERGE_SIZE:
+            self.merge()
+
+    def merge(self):
+        if not self.pending:
+            return
+        added = np.array(self.pending, dtype=np.int64).reshape(-1, 2)
+        self.ids = np.concatenate([self.ids, added[:, 0]])
+        self.hashes = np.concatenate([self.hashes, added[:, 1]])
+        self.pending = []
+        unsigned = self.hashes.view(np.uint64)
+        self.bands = []
+        for band in range(self.BANDS):
+            values = ((unsigned >> np.uint64(band * self.BAND_BITS)) & np.uint64(0xFFFF)).astype(np.uint16)
+            order = np.argsort(values, kind="stable")
+            self.bands.append((values[order], order))
+
+    def masks(self, bits):
+        """Все 16-битные маски не более чем из bits единиц"""
+        if bits not in self._masks:
+            masks = [0]
+            for count in range(1, bits + 1):
+                for positions in combinations(range(self.BAND_BITS), count):
+                    masks.append(sum(1 << position for position in positions))
+            self._masks[bits] = np.array(masks, dtype=np.uint16)
+        return self._masks[bits]
+
+    def search(self, value, radius):
+        """Ключи хешей на расстоянии не больше radius: список (image_id, расстояние)"""
+        found = []
+        if len(self.ids):
+            masks = self.masks(radius // self.BANDS)
+            unsigned = int(np.int64(value).view(np.uint64))
+            candidates = []
+            for band, (values, order) in enumerate(self.bands):
+                keys = ((unsigned >> (band * self.BAND_BITS)) & 0xFFFF) ^ masks
+                low = np.searchsorted(values, keys, side="left")
+                high = np.searchsorted(values, keys, side="right")
+                candidates.extend(order[start:end] for start, end in zip(low, high) if end > start)
+            if candidates:
+                positions = np.unique(np.concatenate(candidates))
+                counts = distances(self.hashes[positions], value)
+                close = counts <= radius
+                found.extend(zip(self.ids[positions][close].tolist(), counts[close].tolist()))
+        if self.pending:
+            pending = np.array(self.pending, dtype=np.int64).reshape(-1, 2)
+            counts = distances(pending[:, 1], value)
+            close = counts <= radius
+            found.extend(zip(pending[close, 0].tolist(), counts[close].tolist()))
+        return sorted(found, key=lambda item: (item[1], item[0]))
+
+
+class ImageFingerprints:
+    """Перцептивные хеши изображений дефектов и поиск почти одинаковых снимков.
+
+    Для каждого defect_images.image_path в таблице image_fingerprints
+    хранятся dHash и pHash (64 бита). Поиск похожих выполняется по pHash через
+    HashIndex в памяти: индекс загружается при первом поиске и дополняется
+    строками с порядковым номером записи seq больше последнего загруженного.
+    Номер выдается при каждой записи хеша, поэтому в индекс попадают и
+    хеши, записанные backfill для старых изображений после новых. Найденные кандидаты
+    перечитываются из базы, поэтому удаленные и измененные изображения в
+    результат не попадают. Похожими считаются снимки, у которых оба хеша
+    отличаются не более чем на distance битов.
+
+    Заполнение для существующих изображений (backfill) выполняется пакетами
+    в пуле процессов, как создание миниатюр.
+    """
+
+    TABLE = """CREATE TABLE IF NOT EXISTS image_fingerprints (
+        image_id INTEGER PRIMARY KEY,
+        dhash INTEGER NOT NULL,
+        phash INTEGER NOT NULL,
+        seq INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (image_id) REFERENCES defect_images(image_id) ON DELETE CASCADE
+    )"""
+
+    # Порядок записи хешей для дозагрузки индекса
+    INDEX = "CREATE INDEX IF NOT EXISTS idx_image_fingerprints_seq ON image_fingerprints(seq)"
+
+    # Последний выданный номер seq; в отличие от MAX(seq) не уменьшается при
+    # удалении строки с наибольшим номером (в том числе каскадном)
+    SEQUENCE = "CREATE TABLE IF NOT EXISTS image_fingerprint_sequence (seq INTEGER NOT NULL)"
+
+    def __init__(self, db_manager, workers=None, batch_size=500, distance=None):
+        self.db_manager = db_manager
+        self.workers = workers
+        self.batch_size = batch_size
+        self.distance = Config.IMAGE_DUPLICATE_DISTANCE if distance is None else distance
+        self.index = HashIndex()
+        self.index_path = None
+        self.index_seq = 0
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             initializer=image_store.configure,
+                                             initargs=(self.db_manager.images.path,))
+        return self._pool
+
+    def backfill(self, on_progress=None):
+        """Вычисление хешей для всех изображений без записи в image_fingerprints"""
+        stats = {"processed": 0, "hashed": 0, "failed": 0}
+        started = time.perf_counter()
+        last_id = 0
+        workers = self.workers or os.cpu_count() or 1
+
+        while True:
+            rows = self.db_manager.fetch_all(
+                "SELECT d.image_id, d.image_path FROM defect_images d "
+                "LEFT JOIN image_fingerprints f ON f.image_id = d.image_id "
+                "WHERE f.image_id IS NULL AND d.image_id > ? ORDER BY d.image_id LIMIT ?",
+                (last_id, self.batch_size)
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            size = max(1, -(-len(rows) // workers))
+            chunks = [[path for _, path in rows[start:start + size]]
+                      for start in range(0, len(rows), size)]
+            results = [result for chunk in self.pool.map(fingerprint_files, chunks) for result in chunk]
+
+            hashes = []
+            for (image_id, _), (dhash_value, phash_value, error) in zip(rows, results):
+                stats["processed"] += 1
+                if error:
+                    stats["failed"] += 1
+                    continue
+                stats["hashed"] += 1
+                hashes.append((image_id, dhash_value, phash_value))
+            self.save(hashes)
+
+            stats["images_per_second"] = stats["processed"] / (time.perf_counter() - started)
+            if on_progress:
+                on_progress(stats)
+        return stats
+
+    def save(self, hashes, connection=None):
+        """Пакетная запись хешей (image_id, dhash, phash) со следующими номерами seq"""
+        if not hashes:
+            return
+        if connection is None:
+            with self.db_manager.pool.writer() as connection:
+                self.save(hashes, connection)
+            return
+        last = connection.execute(
+            "UPDATE image_fingerprint_sequence SET seq = seq + ? RETURNING seq",
+            (len(hashes),)).fetchall()[0][0]
+        first = last - len(hashes) + 1
+        connection.executemany(
+            "INSERT OR REPLACE INTO image_fingerprints (image_id, dhash, phash, seq) VALUES (?, ?, ?, ?)",
+            [(image_id, dhash_value, phash_value, first + number)
+             for number, (image_id, dhash_value, phash_value) in enumerate(hashes)])
+
+    def sync(self, connection):
+        """Загрузка в индекс хешей, записанных после последней загрузки.
+
+        Перезаписанный хеш добавляется в индекс повторно; устаревшие
+        значения отсеиваются при перечитывании кандидатов из базы.
+        """
+        with self._lock:
+            if self.index_path != self.db_manager.db_path:
+                self.index = HashIndex()
+                self.index_path = self.db_manager.db_path
+                self.index_seq = 0
+            rows = connection.execute(
+                "SELECT image_id, phash, seq FROM image_fingerprints WHERE seq > ? ORDER BY seq",
+                (self.index_seq,)).fetchall()
+            if rows:
+                self.index.add([(image_id, phash_value) for image_id, phash_value, _ in rows])
+                self.index.merge()
+                self.index_seq = rows[-1][2]
+
+    def similar(self, connection, dhash_value, phash_value, exclude=None):
+        """Похожие изображения: список (image_id, image_path, расстояние pHash, расстояние dHash)"""
+        self.sync(connection)
+        with self._lock:
+            candidates = [image_id for image_id, _ in self.index.search(phash_value, self.distance)
+                          if image_id != exclude]
+        if not candidates:
+            return []
+        placeholders = ", ".join("?" for _ in candidates)
+        result = []
+        for image_id, image_path, stored_dhash, stored_phash in connection.execute(
+                f"SELECT f.image_id, d.image_path, f.dhash, f.phash FROM image_fingerprints f "
+                f"JOIN defect_images d ON d.image_id = f.image_id "
+                f"WHERE f.image_id IN ({placeholders})", candidates):
+            phash_distance = int(distances([stored_phash], phash_value)[0])
+            dhash_distance = int(distances([stored_dhash], dhash_value)[0])
+            if phash_distance <= self.distance and dhash_distance <= self.distance:
+                result.append((image_id, image_path, phash_distance, dhash_distance))
+        return sorted(result, key=lambda row: (row[2], row[3], row[0]))
+
+    def register(self, connection, image_id, image_path):
+        """Хеши нового изображения и похожие на него среди уже загруженных.
+
+        Выполняется на соединении-писателе; изображение хешируется в текущем
+        потоке (одно изображение быстрее передачи в пул процессов). В индекс
+        хеш попадает при следующей синхронизации, после фиксации транзакции.
+        """
+        dhash_value, phash_value, error = fingerprint_files([image_path])[0]
+        if error:
+            raise OSError(f"Не удалось прочитать изображение {image_path}: {error}")
+        duplicates = self.similar(connection, dhash_value, phash_value, exclude=image_id)
+        self.save([(image_id, dhash_value, phash_value)], connection)
+        return duplicates
+
+    def groups(self, connection):
+        """Группы похожих изображений среди всех хешей: списки image_id (от 2 и больше)"""
+        self.sync(connection)
+        hashes = dict(connection.execute("SELECT image_id, dhash FROM image_fingerprints"))
+        parent = {}
+
+        def root(image_id):
+            while parent.get(image_id, image_id) != image_id:
+                image_id = parent[image_id]
+            return image_id
+
+        with self._lock:
+            index = self.index
+            index.merge()
+            for image_id, phash_value in zip(index.ids.tolist(), index.hashes.tolist()):
+                if image_id not in hashes:
+                    continue
+                for other, _ in index.search(phash_value, self.distance):
+                    if other <= image_id or other not in hashes:
+                        continue
+                    if distances([hashes[other]], hashes[image_id])[0] <= self.distance:
+                        parent[root(other)] = root(image_id)
+
+        members = {}
+        for image_id in parent:
+            members.setdefault(root(image_id), set()).add(image_id)
+        return sorted((sorted(group | {key}) for key, group in members.items()), key=len, reverse=True)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def print_progress(stats):
+    print(f"\rобработано: {stats['processed']} | хешей: {stats['hashed']} | "
+          f"ошибок: {stats['failed']} | {stats['images_per_second']:,.1f} изобр./с",
+          end="", flush=True)
+
+
+def main():
+    from smartphone_defect_detection import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Перцептивные хеши и поиск похожих изображений дефектов")
+    parser.add_argument("database", help="Путь к файлу базы данных")
+    parser.add_argument("command", choices=["backfill", "check", "duplicates"])
+    parser.add_argument("image", nargs="?", help="Файл изображения для check")
+    parser.add_argument("--distance", type=int, default=None,
+                        help="Наибольшее расстояние Хэмминга между хешами похожих изображений")
+    parser.add_argument("--workers", type=int, default=None, help="Число процессов")
+    parser.add_argument("--batch-size", type=int, default=500,
+                        help="Количество изображений в одном пакете")
+    args = parser.parse_args()
+    if args.command == "check" and not args.image:
+        parser.error("Для check укажите файл изображения")
+
+    db_manager = DatabaseManager()
+    db_manager.open(args.database)
+    fingerprints = ImageFingerprints(db_manager, workers=args.workers, batch_size=args.batch_size,
+                                     distance=args.distance)
+    try:
+        if args.command == "backfill":
+            fingerprints.backfill(on_progress=print_progress)
+            print()
+        elif args.command == "check":
+            dhash_value, phash_value, error = fingerprint_files([args.image])[0]
+            if error:
+                print(error)
+                raise SystemExit(1)
+            with db_manager.pool.reader() as connection:
+                started = time.perf_counter()
+                fingerprints.sync(connection)
+                loaded = time.perf_counter()
+                similar = fingerprints.similar(connection, dhash_value, phash_value)
+                elapsed = time.perf_counter() - loaded
+            print(f"Хешей в индексе: {len(fingerprints.index)}, загрузка {loaded - started:.2f} с, "
+                  f"поиск {elapsed * 1000:.1f} мс")
+            for image_id, image_path, phash_distance, dhash_distance in similar:
+                print(f"{image_id}: {image_path} (pHash {phash_distance}, dHash {dhash_distance})")
+        else:
+            with db_manager.pool.reader() as connection:
+                groups = fingerprints.groups(connection)
+            for group in groups:
+                print(f"{len(group)} изобр.: " + ", ".join(str(image_id) for image_id in group))
+            print(f"Групп похожих изображений: {len(groups)}, "
+                  f"лишних копий: {sum(len(group) - 1 for group in groups)}")
+    finally:
+        fingerprints.shutdown()
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
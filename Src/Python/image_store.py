@@ -0,0 +1,307 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+PREFIX = "sha256:"
+
+_default = None
+
+
+def is_reference(path):
+    """Ссылка на изображение в хранилище вида sha256:<хеш>"""
+    return bool(path) and path.startswith(PREFIX)
+
+
+def reference_digest(path):
+    return path[len(PREFIX):]
+
+
+def configure(path):
+    """Хранилище, через которое open_source читает ссылки sha256:.
+
+    Вызывается при открытии базы, а в дочерних процессах пулов - как
+    initializer с путем хранилища. Возвращает хранилище (None при path=None).
+    """
+    global _default
+    if _default is not None and (path is None or _default.path != os.path.abspath(path)):
+        _default.close()
+        _default = None
+    if path is not None and _default is None:
+        _default = ImageStore(path)
+    return _default
+
+
+def open_source(path):
+    """Файловый объект изображения для Image.open: файл на диске или BLOB хранилища"""
+    if is_reference(path):
+        if _default is None:
+            raise FileNotFoundError(f"Хранилище изображений не подключено: {path}")
+        return _default.open(path)
+    return open(path, "rb")
+
+
+def exists(path):
+    """Наличие изображения по пути или ссылке"""
+    if is_reference(path):
+        return _default is not None and _default.contains(path)
+    return bool(path) and os.path.isfile(path)
+
+
+class ImageStore:
+    """Хранилище содержимого изображений в отдельной базе SQLite с адресацией по SHA-256.
+
+    Одинаковые файлы хранятся один раз; в image_path вместо пути к файлу
+    записывается ссылка sha256:<хеш>, которая не зависит от того, как станция
+    подключила общий каталог. Запись и чтение выполняются потоково через
+    инкрементный ввод-вывод BLOB (Connection.blobopen): файл записывается
+    блоками в заранее выделенный zeroblob, а open() возвращает объект Blob с
+    read/seek/tell, который Image.open читает напрямую, без копирования
+    изображения в память целиком.
+
+    Файл хранилища - <база>.images.db рядом с основной базой (как архивы);
+    он создается при первой записи. У каждого потока свое соединение.
+    """
+
+    TABLE = """CREATE TABLE IF NOT EXISTS blobs (
+        blob_id INTEGER PRIMARY KEY,
+        digest TEXT UNIQUE NOT NULL,
+        size INTEGER NOT NULL,
+        data BLOB NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )"""
+
+    CHUNK_SIZE = 1024 * 1024
+    MMAP_SIZE = 256 * 1024 * 1024
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def path_for(db_path):
+        return os.path.splitext(os.path.abspath(db_path))[0] + ".images.db"
+
+    def connection(self, create=False):
+        """Соединение текущего потока; без create отсутствующий файл не создается"""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            return connection
+        if not create and not os.path.exists(self.path):
+            raise FileNotFoundError(f"Хранилище изображений не найдено: {self.path}")
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute(f"PRAGMA mmap_size = {self.MMAP_SIZE}")
+        connection.execute(self.TABLE)
+        connection.commit()
+        self._local.connection = connection
+        with self._lock:
+            self._connections.append(connection)
+        return connection
+
+    def blob_id(self, connection, reference):
+        row = connection.execute("SELECT blob_id FROM blobs WHERE digest = ?",
+                                 (reference_digest(reference),)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"Изображение отсутствует в хранилище: {reference}")
+        return row[0]
+
+    def contains(self, reference):
+        try:
+            self.blob_id(self.connection(), reference)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def open(self, reference):
+        """Blob изображения только для чтения; закрывается как файл (with)"""
+        connection = self.connection()
+        return connection.blobopen("blobs", "data", self.blob_id(connection, reference), readonly=True)
+
+    def put_file(self, path):
+        """Запись файла в хранилище; возвращает ссылку sha256:<хеш>.
+
+        Файл читается дважды блоками CHUNK_SIZE: для хеша и для записи, так
+        что большие изображения не загружаются в память целиком.
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as source:
+            for chunk in iter(lambda: source.read(self.CHUNK_SIZE), b""):
+                digest.update(chunk)
+        reference = PREFIX + digest.hexdigest()
+        size = os.path.getsize(path)
+
+        connection = self.connection(create=True)
+        with connection:
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO blobs (digest, size, data) VALUES (?, ?, zeroblob(?))",
+                (digest.hexdigest(), size, size))
+            if cursor.rowcount:
+                with open(path, "rb") as source, \
+                        connection.blobopen("blobs", "data", cursor.lastrowid) as blob:
+                    for chunk in iter(lambda: source.read(self.CHUNK_SIZE), b""):
+                        blob.write(chunk)
+                    if blob.tell() != size:
+                        raise OSError(f"Файл {path} изменился во время записи в хранилище")
+        return reference
+
+    def export(self, reference, target):
+        """Выгрузка изображения из хранилища в файл"""
+        with self.open(reference) as blob, open(target, "wb") as output:
+            for chunk in iter(lambda: blob.read(self.CHUNK_SIZE), b""):
+                output.write(chunk)
+
+    def verify(self, on_progress=None):
+        """Пересчет SHA-256 всех изображений; возвращает список поврежденных хешей"""
+        connection = self.connection()
+        damaged = []
+        for checked, (blob_id, expected) in enumerate(
+                connection.execute("SELECT blob_id, digest FROM blobs").fetchall(), 1):
+            digest = hashlib.sha256()
+            with connection.blobopen("blobs", "data", blob_id, readonly=True) as blob:
+                for chunk in iter(lambda: blob.read(self.CHUNK_SIZE), b""):
+                    digest.update(chunk)
+            if digest.hexdigest() != expected:
+                damaged.append(expected)
+            if on_progress and checked % 100 == 0:
+                on_progress(checked)
+        return damaged
+
+    def stats(self):
+        count, size = self.connection().execute(
+            "SELECT COUNT(*), IFNULL(SUM(size), 0) FROM blobs").fetchone()
+        return {"images": count, "bytes": size}
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+
+class ImageStoreMigration:
+    """Перенос изображений, заданных путями к файлам, в хранилище.
+
+    Строки обрабатываются пакетами по ключу; после записи файлов в хранилище
+    пути пакета заменяются ссылками одной транзакцией основной базы.
+    Отсутствующие файлы пропускаются с сохранением пути. С delete_files
+    исходный файл удаляется, когда на его путь больше не ссылается ни одна строка.
+    """
+
+    COLUMNS = {"inspections": "inspection_id", "defect_images": "image_id"}
+
+    def __init__(self, db_manager, store, batch_size=200, delete_files=False):
+        self.db_manager = db_manager
+        self.store = store
+        self.batch_size = batch_size
+        self.delete_files = delete_files
+
+    def migrate(self, tables=None, on_progress=None):
+        stats = {"processed": 0, "stored": 0, "missing": 0, "deleted": 0}
+        started = time.perf_counter()
+        for table in tables or self.COLUMNS:
+            key = self.COLUMNS[table]
+            last_id = 0
+            while True:
+                rows = self.db_manager.fetch_all(
+                    f"SELECT {key}, image_path FROM {table} WHERE {key} > ? "
+                    f"AND image_path IS NOT NULL AND image_path != '' "
+                    f"AND image_path NOT LIKE '{PREFIX}%' ORDER BY {key} LIMIT ?",
+                    (last_id, self.batch_size))
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+
+                updates, moved = [], set()
+                for row_id, path in rows:
+                    stats["processed"] += 1
+                    if not os.path.isfile(path):
+                        stats["missing"] += 1
+                        continue
+                    updates.append((self.store.put_file(path), row_id))
+                    moved.add(path)
+                stats["stored"] += len(updates)
+                with self.db_manager.pool.writer() as connection:
+                    connection.executemany(f"UPDATE {table} SET image_path = ? WHERE {key} = ?", updates)
+                if self.delete_files:
+                    stats["deleted"] += self.remove_unreferenced(moved)
+
+                stats["images_per_second"] = stats["processed"] / (time.perf_counter() - started)
+                if on_progress:
+                    on_progress(stats)
+        return stats
+
+    def remove_unreferenced(self, paths):
+        removed = 0
+        for path in paths:
+            referenced = self.db_manager.fetch_one(
+                "SELECT 1 FROM inspections WHERE image_path = ? "
+                "UNION ALL SELECT 1 FROM defect_images WHERE image_path = ? LIMIT 1", (path, path))
+            if referenced is None:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError as e:
+                    print(f"Не удалось удалить {path}: {e}")
+        return removed
+
+
+def print_progress(stats):
+    print(f"\rобработано: {stats['processed']} | перенесено: {stats['stored']} | "
+          f"нет файла: {stats['missing']} | удалено файлов: {stats['deleted']} | "
+          f"{stats['images_per_second']:,.1f} изобр./с", end="", flush=True)
+
+
+def main():
+    from smartphone_defect_detection import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Хранилище изображений с адресацией по SHA-256")
+    parser.add_argument("database", help="Путь к файлу базы данных")
+    parser.add_argument("command", choices=["migrate", "stats", "verify", "export"])
+    parser.add_argument("reference", nargs="?", help="Ссылка sha256:... для export")
+    parser.add_argument("target", nargs="?", help="Файл для export")
+    parser.add_argument("--table", choices=sorted(ImageStoreMigration.COLUMNS), action="append",
+                        help="Таблица для migrate (по умолчанию - обе)")
+    parser.add_argument("--delete-files", action="store_true",
+                        help="Удалять перенесенные файлы, на которые не осталось ссылок")
+    parser.add_argument("--batch-size", type=int, default=200,
+                        help="Количество строк в одном пакете")
+    args = parser.parse_args()
+    if args.command == "export" and not (args.reference and args.target):
+        parser.error("Для export укажите ссылку и файл")
+
+    db_manager = DatabaseManager()
+    db_manager.open(args.database)
+    store = db_manager.images
+    try:
+        if args.command == "migrate":
+            migration = ImageStoreMigration(db_manager, store, batch_size=args.batch_size,
+                                            delete_files=args.delete_files)
+            migration.migrate(args.table, on_progress=print_progress)
+            print()
+        elif args.command == "verify":
+            damaged = store.verify()
+            for digest in damaged:
+                print(f"Повреждено: {PREFIX}{digest}")
+            if damaged:
+                raise SystemExit(1)
+            print("Содержимое хранилища соответствует хешам")
+        elif args.command == "export":
+            store.export(args.reference, args.target)
+        stats = store.stats()
+        print(f"{store.path}: изображений {stats['images']}, {stats['bytes'] / 1024 ** 2:,.1f} МБ")
+    except (OSError, sqlite3.Error) as e:
+        print(e)
+        raise SystemExit(1)
+    finally:
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
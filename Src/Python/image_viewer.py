@@ -0,0 +1,252 @@
+import os
+import queue
+import tkinter as tk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import image_store
+
+
+class PhotoImageCache:
+    """LRU-кэш декодированных PhotoImage, ограниченный объемом памяти в байтах"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        self._items.move_to_end(key)
+        return item[0]
+
+    def put(self, key, photo, size_bytes):
+        if key in self._items:
+            self.current_bytes -= self._items.pop(key)[1]
+        if size_bytes > self.max_bytes:
+            return
+        self._items[key] = (photo, size_bytes)
+        self.current_bytes += size_bytes
+        while self.current_bytes > self.max_bytes:
+            _, (_, evicted_bytes) = self._items.popitem(last=False)
+            self.current_bytes -= evicted_bytes
+
+    def clear(self):
+        self._items.clear()
+        self.current_bytes = 0
+
+
+class ImagePreviewPane:
+    """Панель просмотра изображения выбранной строки с отметками дефектов.
+
+    Изображения декодируются и масштабируются в фоновых потоках, PhotoImage
+    создается в потоке Tk и помещается в общий кэш. При выборе строки в фоне
+    заранее декодируются изображения соседних строк. Отсутствие файла или
+    ссылки в хранилище тоже выясняется при фоновом декодировании, так что
+    redraw не обращается ни к диску, ни к базе.
+    """
+
+    IMAGE_QUERIES = {
+        "inspections": """
+            SELECT inspection_id, image_path, NULL FROM inspections
+            WHERE inspection_id IN ({ids})""",
+        "defects": """
+            SELECT d.defect_id,
+                   COALESCE((SELECT image_path FROM defect_images
+                             WHERE defect_id = d.defect_id ORDER BY image_id LIMIT 1),
+                            i.image_path),
+                   d.defect_id
+            FROM defects d LEFT JOIN inspections i ON i.inspection_id = d.inspection_id
+            WHERE d.defect_id IN ({ids})""",
+        "defect_images": """
+            SELECT image_id, image_path, defect_id FROM defect_images
+            WHERE image_id IN ({ids})"""
+    }
+
+    MARKER_COLOR = "#f44336"
+    PREFETCH_NEIGHBOURS = 3
+    POLL_INTERVAL_MS = 30
+    DEFAULT_SIZE = (360, 360)
+
+    def __init__(self, parent, table_name, cache, runner, workers=2):
+        self.table_name = table_name
+        self.cache = cache
+        self.runner = runner
+        self.current = None
+        self._decoder = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-decode")
+        self._decoded = queue.Queue()
+        self._pending = set()
+        self._failed = {}
+        self._missing = set()
+        self._poll_job = None
+
+        self.frame = tk.Frame(parent, width=self.DEFAULT_SIZE[0])
+        self.canvas = tk.Canvas(self.frame, width=self.DEFAULT_SIZE[0],
+                                height=self.DEFAULT_SIZE[1], bg="#202020",
+                                highlightthickness=0)
+        self.canvas.pack(fill="both", expand=True)
+        self.caption = tk.Label(self.frame, text="Выберите запись", anchor="w")
+        self.caption.pack(fill="x")
+        self.canvas.bind("<Configure>", lambda event: self.redraw())
+        self.frame.bind("<Destroy>", lambda event: self.close())
+
+    @classmethod
+    def supports(cls, table_name):
+        return table_name in cls.IMAGE_QUERIES
+
+    def target_size(self):
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        if width <= 1 or height <= 1:
+            return self.DEFAULT_SIZE
+        return width, height
+
+    def show_record(self, record_id, neighbour_ids=()):
+        """Отображение изображения записи и предзагрузка соседних записей"""
+        ids = [record_id] + [i for i in neighbour_ids if i != record_id]
+
+        def query(connection):
+            placeholders = ", ".join("?" for _ in ids)
+            rows = connection.execute(
+                self.IMAGE_QUERIES[self.table_name].format(ids=placeholders), ids).fetchall()
+            images = {row[0]: (row[1], row[2]) for row in rows}
+            markers = self.load_markers(connection, record_id, images.get(record_id))
+            return images, markers
+
+        def apply(result):
+            if not self.canvas.winfo_exists():
+                return
+            images, markers = result
+            image_path = images.get(record_id, (None, None))[0]
+            # Повторный выбор записи заново проверяет ранее отсутствовавший файл
+            self._missing.discard(image_path)
+            self.current = {"record_id": record_id, "path": image_path, "markers": markers}
+            self.redraw()
+            for neighbour_id in ids[1:]:
+                path = images.get(neighbour_id, (None, None))[0]
+                if path:
+                    self.request(path)
+
+        self.runner(query, apply)
+
+    def load_markers(self, connection, record_id, image_info):
+        """Координаты дефектов для отображения поверх изображения"""
+        query = ("SELECT location_x, location_y, size, defect_type FROM defects "
+                 "WHERE location_x IS NOT NULL AND location_y IS NOT NULL AND ")
+        if self.table_name == "inspections":
+            return connection.execute(query + "inspection_id = ?", (record_id,)).fetchall()
+        if image_info and image_info[1] is not None:
+            return connection.execute(query + "defect_id = ?", (image_info[1],)).fetchall()
+        return []
+
+    def cache_key(self, path):
+        return path, self.target_size()
+
+    def request(self, path):
+        """Декодирование изображения в фоне, если его нет в кэше"""
+        key = self.cache_key(path)
+        if key in self.cache or key in self._pending or path in self._failed or path in self._missing:
+            return
+        self._pending.add(key)
+        future = self._decoder.submit(self.decode, path, key[1])
+        future.add_done_callback(lambda finished: self._decoded.put((key, finished)))
+        if self._poll_job is None:
+            self._poll_job = self.canvas.after(self.POLL_INTERVAL_MS, self._poll)
+
+    @staticmethod
+    def decode(path, size):
+        """Чтение и масштабирование изображения; выполняется в фоновом потоке"""
+        from PIL import Image
+
+        with image_store.open_source(path) as source, Image.open(source) as image:
+            original_size = image.size
+            image.draft("RGB", size)
+            image.thumbnail(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGB")
+            image.load()
+            return image, original_size
+
+    def _poll(self):
+        from PIL import ImageTk
+
+        self._poll_job = None
+        if not self.canvas.winfo_exists():
+            return
+        while True:
+            try:
+                key, future = self._decoded.get_nowait()
+            except queue.Empty:
+                break
+            self._pending.discard(key)
+            try:
+                image, original_size = future.result()
+            except FileNotFoundError:
+                self._missing.add(key[0])
+                if self.current and self.current["path"] == key[0]:
+                    self.redraw()
+                continue
+            except Exception as e:
+                self._failed[key[0]] = str(e)
+                if self.current and self.current["path"] == key[0]:
+                    self.redraw()
+                continue
+            photo = ImageTk.PhotoImage(image)
+            photo.original_size = original_size
+            self.cache.put(key, photo, image.width * image.height * 4)
+            if self.current and self.current["path"] == key[0]:
+                self.redraw()
+
+        if self._pending:
+            self._poll_job = self.canvas.after(self.POLL_INTERVAL_MS, self._poll)
+
+    def redraw(self):
+        """Отрисовка текущего изображения и отметок дефектов"""
+        self.canvas.delete("all")
+        if not self.current:
+            return
+
+        path = self.current["path"]
+        if not path:
+            self.caption.config(text="Изображение не указано")
+            return
+        if path in self._missing:
+            self.caption.config(text=f"Файл не найден: {path}")
+            return
+        if path in self._failed:
+            self.caption.config(text=f"Ошибка при загрузке изображения: {self._failed[path]}")
+            return
+
+        photo = self.cache.get(self.cache_key(path))
+        if photo is None:
+            self.caption.config(text="Загрузка изображения...")
+            self.request(path)
+            return
+
+        width, height = self.target_size()
+        left = (width - photo.width()) // 2
+        top = (height - photo.height()) // 2
+        self.canvas.create_image(left, top, anchor="nw", image=photo)
+
+        scale = photo.width() / photo.original_size[0]
+        for x, y, size, defect_type in self.current["markers"]:
+            cx = left + x * scale
+            cy = top + y * scale
+            radius = max((size or 0) * scale / 2, 6)
+            self.canvas.create_oval(cx - radius, cy - radius, cx + radius, cy + radius,
+                                    outline=self.MARKER_COLOR, width=2)
+            if defect_type:
+                self.canvas.create_text(cx + radius + 2, cy - radius, anchor="sw",
+                                        text=defect_type, fill=self.MARKER_COLOR)
+
+        self.caption.config(text=f"{os.path.basename(path)}  "
+                                 f"({photo.original_size[0]}x{photo.original_size[1]}, "
+                                 f"дефектов: {len(self.current['markers'])})")
+
+    def close(self):
+        self._decoder.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,373 @@
+import argparse
+import asyncio
+import json
+import sqlite3
+import time
+from collections import deque
+
+from bulk_import import BulkImporter, ImportReport, ValidationError
+from config import Config
+
+
+def percentile(values, fraction):
+    """Перцентиль по отсортированному списку (ближайший ранг)"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+
+class IngestStats:
+    """Счетчики службы и задержки записи (от постановки в очередь до фиксации)"""
+
+    def __init__(self, window=10000):
+        self.accepted = 0
+        self.rejected = 0
+        self.failed = 0
+        self.committed = 0
+        self.batches = 0
+        self.latencies = deque(maxlen=window)
+        self.started = time.perf_counter()
+
+    def snapshot(self, queue_size=0):
+        latencies = sorted(self.latencies)
+        elapsed = time.perf_counter() - self.started
+        return {
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "committed": self.committed,
+            "batches": self.batches,
+            "average_batch": round(self.committed / self.batches, 1) if self.batches else 0.0,
+            "queue": queue_size,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "records_per_second": round(self.committed / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+class IngestService:
+    """Прием результатов от станций контроля по сети с групповой фиксацией.
+
+    Станции отправляют записи JSON построчно через TCP (одна запись - одна
+    строка, ответ - строка JSON) или запросом HTTP POST /inspections,
+    /defects. Записи проверяются BulkImporter и ставятся в очередь; отдельная
+    задача записывает их одной транзакцией на batch_size записей или на
+    flush_interval_ms миллисекунд. При заполненной очереди прием
+    приостанавливается, а после put_timeout секунд запись отклоняется
+    с ошибкой "queue full" (HTTP 503).
+    """
+
+    TABLES = ("inspections", "defects")
+    CACHE_RELOAD_INTERVAL = 5.0
+    MAX_IN_FLIGHT = 1000
+
+    def __init__(self, db_manager, batch_size=500, flush_interval_ms=50, max_queue=10000,
+                 put_timeout=5.0):
+        self.db_manager = db_manager
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_queue = max_queue
+        self.put_timeout = put_timeout
+        self.importer = BulkImporter(db_manager, max_errors=None)
+        self.stats = IngestStats()
+        self.queue = None
+        self._caches_loaded = 0.0
+        self._reload = None
+
+    def load_caches(self):
+        self.importer.load_caches()
+        self._caches_loaded = time.monotonic()
+
+    async def reload_caches(self):
+        """Перечитывание кэшей в пуле потоков, не чаще раза в CACHE_RELOAD_INTERVAL секунд.
+
+        Одновременные запросы ждут одно и то же перечитывание; возвращает False,
+        если кэши обновлялись недавно и перечитывать их не нужно.
+        """
+        if self._reload is None:
+            if time.monotonic() - self._caches_loaded < self.CACHE_RELOAD_INTERVAL:
+                return False
+            self._caches_loaded = time.monotonic()
+            self._reload = asyncio.get_running_loop().run_in_executor(None, self.load_caches)
+            self._reload.add_done_callback(self._reload_done)
+        await asyncio.shield(self._reload)
+        return True
+
+    def _reload_done(self, future):
+        self._reload = None
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Ошибка перечитывания кэшей: {future.exception()!r}", flush=True)
+
+    def validate(self, table, record):
+        """Проверка записи по кэшам BulkImporter (без обращения к базе)"""
+        if table not in self.TABLES:
+            raise ValidationError(f"неизвестная таблица {table!r}")
+        if not isinstance(record, dict):
+            raise ValidationError("ожидается объект с полями записи")
+
+        if table == "inspections":
+            nested = self.importer.validate_nested(record)
+            return self.importer.validate_inspection(record), nested
+        return self.importer.validate_defect(record), []
+
+    async def submit(self, table, record):
+        """Постановка записи в очередь и ожидание фиксации; возвращает ответ для станции.
+
+        Непредвиденная ошибка обработки записи возвращается ответом этой записи
+        и не обрывает соединение станции.
+        """
+        try:
+            return await self.submit_record(table, record)
+        except Exception as e:
+            self.stats.rejected += 1
+            print(f"Ошибка обработки записи {table!r}: {e!r}", flush=True)
+            return {"ok": False, "error": f"ошибка обработки записи: {e}"}
+
+    async def submit_record(self, table, record):
+        try:
+            try:
+                item = self.validate(table, record)
+            except ValidationError:
+                # Ссылка может указывать на смартфон или пользователя, добавленных
+                # после загрузки кэшей: перечитываем их и проверяем запись еще раз
+                if not await self.reload_caches():
+                    raise
+                item = self.validate(table, record)
+        except ValidationError as e:
+            self.stats.rejected += 1
+            return {"ok": False, "error": str(e)}
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(self.queue.put((table, item, future, time.perf_counter())),
+                                   self.put_timeout)
+        except asyncio.TimeoutError:
+            self.stats.rejected += 1
+            return {"ok": False, "error": "queue full", "retry": True}
+        self.stats.accepted += 1
+
+        try:
+            inspection_id = await future
+        except sqlite3.Error as e:
+            return {"ok": False, "error": str(e)}
+        response = {"ok": True}
+        if inspection_id is not None:
+            response["inspection_id"] = inspection_id
+        return response
+
+    async def writer_loop(self):
+        """Сбор пакетов из очереди и их запись в пуле потоков"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            results = await loop.run_in_executor(None, self.write, batch)
+            committed = time.perf_counter()
+            for (_, _, future, enqueued), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    self.stats.failed += 1
+                    if not future.done():
+                        future.set_exception(result)
+                    continue
+                self.stats.committed += 1
+                self.stats.latencies.append(committed - enqueued)
+                if not future.done():
+                    future.set_result(result)
+            self.stats.batches += 1
+
+    def write(self, batch):
+        """Запись пакета одной транзакцией; при ошибке записи проверяются по одной"""
+        try:
+            return self.write_group(batch)
+        except sqlite3.Error:
+            results = []
+            for item in batch:
+                try:
+                    results.extend(self.write_group([item]))
+                except sqlite3.Error as e:
+                    results.append(e)
+            return results
+
+    def write_group(self, batch):
+        report = ImportReport()
+        with self.db_manager.pool.writer() as connection:
+            if not connection.in_transaction:
+                connection.execute("BEGIN IMMEDIATE")
+            inspections = [item for table, item, _, _ in batch if table == "inspections"]
+            defects = [item for table, item, _, _ in batch if table == "defects"]
+            ids = iter(self.importer.write_batch(connection, "inspections", inspections, report)
+                       if inspections else [])
+            if defects:
+                self.importer.write_batch(connection, "defects", defects, report)
+            # Журнал изменений растет с каждой записью - ограничиваем его при фиксации группы
+            self.db_manager.changes.prune(connection, Config.CHANGE_LOG_MAX_ROWS)
+        return [next(ids) if table == "inspections" else None for table, _, _, _ in batch]
+
+    async def handle_connection(self, reader, writer):
+        try:
+            first_line = await reader.readline()
+            if first_line.split(b" ", 1)[0] in (b"GET", b"POST"):
+                await self.handle_http(first_line, reader, writer)
+            else:
+                await self.handle_lines(first_line, reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_line(self, line):
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            return {"ok": False, "error": f"некорректный JSON: {e}"}
+        if not isinstance(record, dict):
+            return {"ok": False, "error": "ожидается объект JSON"}
+        if record.get("command") == "stats":
+            return self.stats.snapshot(self.queue.qsize())
+        return await self.submit(record.pop("table", "inspections"), record)
+
+    async def handle_lines(self, line, reader, writer):
+        """Построчный протокол: {"table": "inspections", ...поля} -> ответ JSON.
+
+        Станция может отправлять записи, не дожидаясь ответов (до MAX_IN_FLIGHT
+        на соединение); ответы возвращаются в порядке записей.
+        """
+        responses = asyncio.Queue(maxsize=self.MAX_IN_FLIGHT)
+
+        async def send_responses():
+            while True:
+                task = await responses.get()
+                if task is None:
+                    return
+                response = await task
+                writer.write(json.dumps(response, ensure_ascii=False).encode() + b"\n")
+                await writer.drain()
+
+        sender = asyncio.create_task(send_responses())
+        try:
+            while line:
+                line = line.strip()
+                if line:
+                    await responses.put(asyncio.create_task(self.handle_line(line)))
+                line = await reader.readline()
+            await responses.put(None)
+            await sender
+        finally:
+            sender.cancel()
+
+    async def handle_http(self, request_line, reader, writer):
+        """HTTP: POST /inspections или /defects (объект или массив), GET /stats.
+
+        Некорректная строка запроса или Content-Length - ответ 400.
+        """
+        try:
+            request = request_line.decode("latin-1").strip()
+            parts = request.split()
+            if len(parts) < 2:
+                raise ValueError(f"некорректная строка запроса: {request[:100]!r}")
+            method, path = parts[:2]
+            length = 0
+            while True:
+                header = await reader.readline()
+                if header in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = header.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    try:
+                        length = int(value.strip())
+                    except ValueError:
+                        length = -1
+                    if length < 0:
+                        raise ValueError(f"некорректный Content-Length: {value.strip()[:100]!r}")
+
+            table = path.strip("/")
+            if method == "GET" and table == "stats":
+                status, body = 200, self.stats.snapshot(self.queue.qsize())
+            elif method == "POST" and table in self.TABLES:
+                payload = json.loads(await reader.readexactly(length))
+                records = payload if isinstance(payload, list) else [payload]
+                body = await asyncio.gather(*(self.submit(table, record) for record in records))
+                status = 200 if all(result["ok"] for result in body) else (
+                    503 if any(result.get("retry") for result in body) else 422)
+                body = body if isinstance(payload, list) else body[0]
+            else:
+                status, body = 404, {"ok": False, "error": "not found"}
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            status, body = 400, {"ok": False, "error": str(e)}
+
+        data = json.dumps(body, ensure_ascii=False).encode()
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found",
+                   422: "Unprocessable Entity", 503: "Service Unavailable"}
+        writer.write(f"HTTP/1.1 {status} {reasons[status]}\r\n"
+                     f"Content-Type: application/json; charset=utf-8\r\n"
+                     f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data)
+        await writer.drain()
+
+    async def report_loop(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            stats = self.stats.snapshot(self.queue.qsize())
+            print(f"принято: {stats['accepted']} | записано: {stats['committed']} | "
+                  f"отклонено: {stats['rejected']} | очередь: {stats['queue']} | "
+                  f"пакет: {stats['average_batch']} | p50: {stats['p50_ms']} мс | "
+                  f"p99: {stats['p99_ms']} мс", flush=True)
+
+    async def serve(self, host="127.0.0.1", port=8765, report_interval=10.0):
+        """Запуск службы до отмены задачи"""
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        await asyncio.get_running_loop().run_in_executor(None, self.load_caches)
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        tasks = [asyncio.create_task(self.writer_loop())]
+        if report_interval:
+            tasks.append(asyncio.create_task(self.report_loop(report_interval)))
+        print(f"Служба приема запущена на {host}:{port}", flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def main():
+    from smartphone_defect_detection import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Служба приема результатов станций контроля")
+    parser.add_argument("database", help="Путь к файлу базы данных")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--batch-size", type=int, default=500,
+                        help="Наибольшее число записей в одной транзакции")
+    parser.add_argument("--flush-ms", type=int, default=50,
+                        help="Наибольшее ожидание пакета, мс")
+    parser.add_argument("--max-queue", type=int, default=10000,
+                        help="Размер очереди до приостановки приема")
+    parser.add_argument("--report-interval", type=float, default=10.0,
+                        help="Период вывода статистики, с (0 - не выводить)")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager()
+    db_manager.open(args.database)
+    service = IngestService(db_manager, batch_size=args.batch_size,
+                            flush_interval_ms=args.flush_ms, max_queue=args.max_queue)
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.report_interval))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db_manager.close()
+        print(json.dumps(service.stats.snapshot(), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
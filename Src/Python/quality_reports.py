@@ -0,0 +1,416 @@
+import argparse
+import sqlite3
+from datetime import date, datetime, timedelta
+
+
+class DailyRollups:
+    """Сводные таблицы проверок и дефектов по дням для отчетов о качестве.
+
+    Итоги хранятся корзинами: проверки - по (день, смартфон) с числом
+    результатов pass/fail/conditional и проверок с дефектами, дефекты - по
+    (день проверки, смартфон, тип, серьезность). Отчет за любой период
+    суммирует корзины вместо чтения основных таблиц.
+
+    Обновление инкрементное (refresh): новые строки находятся по ключам после
+    отметки последнего обновления (high-water mark в rollup_state), поэтому
+    вставка не требует триггеров. Изменения и удаления проверок и дефектов
+    ставят свои корзины в очередь rollup_queue. Затронутые корзины целиком
+    пересчитываются по основной базе и архивным файлам, так что перенос в
+    архив итоги не меняет, а отчеты всегда включают архив.
+
+    Новыми считаются строки с ключом больше отметки (AUTOINCREMENT); строки,
+    вставленные с явным меньшим ключом, учитываются только после rebuild.
+    """
+
+    TABLES = [
+        """CREATE TABLE IF NOT EXISTS rollup_inspections_daily (
+            day TEXT NOT NULL,
+            smartphone_id INTEGER NOT NULL,
+            inspections INTEGER NOT NULL DEFAULT 0,
+            passed INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            conditional INTEGER NOT NULL DEFAULT 0,
+            with_defects INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, smartphone_id)
+        ) WITHOUT ROWID""",
+
+        """CREATE TABLE IF NOT EXISTS rollup_defects_daily (
+            day TEXT NOT NULL,
+            smartphone_id INTEGER NOT NULL,
+            defect_type TEXT NOT NULL,
+            severity INTEGER NOT NULL,
+            defects INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, smartphone_id, defect_type, severity)
+        ) WITHOUT ROWID""",
+
+        """CREATE TABLE IF NOT EXISTS rollup_queue (
+            queue_id INTEGER PRIMARY KEY,
+            day TEXT NOT NULL,
+            smartphone_id INTEGER NOT NULL
+        )""",
+
+        """CREATE TABLE IF NOT EXISTS rollup_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )"""
+    ]
+
+    # Корзина строки: день проверки и смартфон (0 - смартфон не указан);
+    # проверки без распознаваемой даты в отчеты не попадают (день '')
+    INSPECTION_BUCKET = "IFNULL(DATE({row}.inspection_date), ''), IFNULL({row}.smartphone_id, 0)"
+
+    TRIGGERS = [
+        f"""CREATE TRIGGER IF NOT EXISTS rollup_inspections_delete AFTER DELETE ON inspections BEGIN
+            INSERT INTO rollup_queue (day, smartphone_id)
+                VALUES ({INSPECTION_BUCKET.format(row="OLD")});
+        END""",
+
+        f"""CREATE TRIGGER IF NOT EXISTS rollup_inspections_update
+        AFTER UPDATE OF inspection_date, smartphone_id, overall_result ON inspections
+        WHEN DATE(OLD.inspection_date) IS NOT DATE(NEW.inspection_date)
+          OR OLD.smartphone_id IS NOT NEW.smartphone_id
+          OR OLD.overall_result IS NOT NEW.overall_result BEGIN
+            INSERT INTO rollup_queue (day, smartphone_id)
+                VALUES ({INSPECTION_BUCKET.format(row="OLD")});
+            INSERT INTO rollup_queue (day, smartphone_id)
+                SELECT {INSPECTION_BUCKET.format(row="NEW")}
+                WHERE DATE(OLD.inspection_date) IS NOT DATE(NEW.inspection_date)
+                   OR OLD.smartphone_id IS NOT NEW.smartphone_id;
+        END""",
+
+        f"""CREATE TRIGGER IF NOT EXISTS rollup_defects_delete AFTER DELETE ON defects BEGIN
+            INSERT INTO rollup_queue (day, smartphone_id)
+                SELECT {INSPECTION_BUCKET.format(row="inspections")} FROM inspections
+                WHERE inspection_id = OLD.inspection_id;
+        END""",
+
+        f"""CREATE TRIGGER IF NOT EXISTS rollup_defects_update
+        AFTER UPDATE OF inspection_id, defect_type, severity ON defects
+        WHEN OLD.inspection_id IS NOT NEW.inspection_id
+          OR OLD.defect_type IS NOT NEW.defect_type
+          OR OLD.severity IS NOT NEW.severity BEGIN
+            INSERT INTO rollup_queue (day, smartphone_id)
+                SELECT {INSPECTION_BUCKET.format(row="inspections")} FROM inspections
+                WHERE inspection_id IN (OLD.inspection_id, NEW.inspection_id);
+        END"""
+    ]
+
+    # Строки проверок: все или только из затронутых корзин temp.rollup_dirty
+    ALL_ROWS = "{schema}.inspections i"
+    DIRTY_ROWS = """temp.rollup_dirty r JOIN {schema}.inspections i
+        ON i.smartphone_id IS NULLIF(r.smartphone_id, 0)
+        AND i.inspection_date >= r.day AND i.inspection_date < DATE(r.day, '+1 day')"""
+
+    INSPECTION_TOTALS = """
+        SELECT DATE(i.inspection_date), IFNULL(i.smartphone_id, 0), COUNT(*),
+               SUM(i.overall_result IS 'pass'), SUM(i.overall_result IS 'fail'),
+               SUM(i.overall_result IS 'conditional'),
+               SUM(EXISTS (SELECT 1 FROM {schema}.defects d WHERE d.inspection_id = i.inspection_id))
+        FROM {rows} WHERE DATE(i.inspection_date) IS NOT NULL
+        GROUP BY 1, 2"""
+
+    DEFECT_TOTALS = """
+        SELECT DATE(i.inspection_date), IFNULL(i.smartphone_id, 0),
+               IFNULL(d.defect_type, ''), IFNULL(d.severity, 0), COUNT(*)
+        FROM {rows} JOIN {schema}.defects d ON d.inspection_id = i.inspection_id
+        WHERE DATE(i.inspection_date) IS NOT NULL
+        GROUP BY 1, 2, 3, 4"""
+
+    # Итоги добавляются к корзине: одна корзина может собираться из основной
+    # базы и нескольких архивов
+    INSPECTION_UPSERT = """
+        INSERT INTO rollup_inspections_daily
+            (day, smartphone_id, inspections, passed, failed, conditional, with_defects)
+        {totals}
+        ON CONFLICT (day, smartphone_id) DO UPDATE SET
+            inspections = inspections + excluded.inspections,
+            passed = passed + excluded.passed,
+            failed = failed + excluded.failed,
+            conditional = conditional + excluded.conditional,
+            with_defects = with_defects + excluded.with_defects"""
+
+    DEFECT_UPSERT = """
+        INSERT INTO rollup_defects_daily (day, smartphone_id, defect_type, severity, defects)
+        {totals}
+        ON CONFLICT (day, smartphone_id, defect_type, severity) DO UPDATE SET
+            defects = defects + excluded.defects"""
+
+    def is_installed(self, connection):
+        """Проверка наличия сводных таблиц"""
+        row = connection.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name='rollup_state'"
+        ).fetchone()
+        return row[0] > 0
+
+    def create(self, connection):
+        """Создание таблиц и триггеров; заполнение выполняет первый refresh.
+
+        Заполнение откладывается, потому что для него нужны подключенные
+        архивы, а ATTACH внутри транзакции миграции невозможен.
+        """
+        for statement in self.TABLES + self.TRIGGERS:
+            connection.execute(statement)
+
+    def refresh(self, connection, archives=()):
+        """Пересчет корзин с новыми, измененными и удаленными строками.
+
+        archives - псевдонимы подключенных архивов (ArchiveManager.attach_files).
+        Возвращает число пересчитанных корзин.
+        """
+        if not connection.in_transaction:
+            connection.execute("BEGIN IMMEDIATE")
+        try:
+            marks = dict(connection.execute("SELECT name, value FROM rollup_state"))
+            if "inspections" not in marks:
+                count = self._rebuild(connection, archives)
+                connection.commit()
+                return count
+
+            connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS rollup_dirty (day TEXT, smartphone_id INTEGER, "
+                "PRIMARY KEY (day, smartphone_id)) WITHOUT ROWID")
+            connection.execute("DELETE FROM temp.rollup_dirty")
+            connection.execute(
+                "INSERT OR IGNORE INTO temp.rollup_dirty "
+                "SELECT day, smartphone_id FROM rollup_queue WHERE day != ''")
+            connection.execute(
+                f"INSERT OR IGNORE INTO temp.rollup_dirty "
+                f"SELECT {self.INSPECTION_BUCKET.format(row='inspections')} FROM main.inspections "
+                f"WHERE inspection_id > ? AND DATE(inspection_date) IS NOT NULL",
+                (marks["inspections"],))
+            # CROSS JOIN фиксирует порядок: от новых дефектов по диапазону ключей,
+            # иначе планировщик выбирает полный просмотр проверок
+            connection.execute(
+                f"INSERT OR IGNORE INTO temp.rollup_dirty "
+                f"SELECT {self.INSPECTION_BUCKET.format(row='i')} FROM main.defects d "
+                f"CROSS JOIN main.inspections i ON i.inspection_id = d.inspection_id "
+                f"WHERE d.defect_id > ? AND DATE(i.inspection_date) IS NOT NULL",
+                (marks["defects"],))
+            count = connection.execute("SELECT COUNT(*) FROM temp.rollup_dirty").fetchone()[0]
+
+            if count:
+                for table in ("rollup_inspections_daily", "rollup_defects_daily"):
+                    connection.execute(
+                        f"DELETE FROM {table} WHERE (day, smartphone_id) IN "
+                        f"(SELECT day, smartphone_id FROM temp.rollup_dirty)")
+                self._fill(connection, self.DIRTY_ROWS, archives)
+            connection.execute("DELETE FROM rollup_queue WHERE queue_id > 0")
+            self._mark(connection, marks)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        return count
+
+    def rebuild(self, connection, archives=()):
+        """Полный пересчет сводных таблиц; возвращает число корзин проверок"""
+        if not connection.in_transaction:
+            connection.execute("BEGIN IMMEDIATE")
+        try:
+            count = self._rebuild(connection, archives)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        return count
+
+    def _rebuild(self, connection, archives):
+        for table in ("rollup_inspections_daily", "rollup_defects_daily", "rollup_queue"):
+            connection.execute(f"DELETE FROM {table}")
+        self._fill(connection, self.ALL_ROWS, archives)
+        self._mark(connection, {"inspections": 0, "defects": 0})
+        return connection.execute("SELECT COUNT(*) FROM rollup_inspections_daily").fetchone()[0]
+
+    def _fill(self, connection, rows, archives):
+        for schema in ("main", *archives):
+            scope = rows.format(schema=schema)
+            for upsert, totals in ((self.INSPECTION_UPSERT, self.INSPECTION_TOTALS),
+                                   (self.DEFECT_UPSERT, self.DEFECT_TOTALS)):
+                connection.execute(upsert.format(totals=totals.format(schema=schema, rows=scope)))
+
+    def _mark(self, connection, marks):
+        """Сохранение отметок: последние ключи основной базы, учтенные в итогах"""
+        for table, key in (("inspections", "inspection_id"), ("defects", "defect_id")):
+            last = connection.execute(f"SELECT IFNULL(MAX({key}), 0) FROM main.{table}").fetchone()[0]
+            connection.execute(
+                "INSERT INTO rollup_state (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = excluded.value WHERE value != excluded.value",
+                (table, max(last, marks[table])))
+
+    def pending(self, connection):
+        """Число корзин в очереди и строк после отметки (без пересчета)"""
+        marks = dict(connection.execute("SELECT name, value FROM rollup_state"))
+        queued = connection.execute("SELECT COUNT(*) FROM rollup_queue").fetchone()[0]
+        inspections = connection.execute(
+            "SELECT COUNT(*) FROM inspections WHERE inspection_id > ?",
+            (marks.get("inspections", 0),)).fetchone()[0]
+        defects = connection.execute(
+            "SELECT COUNT(*) FROM defects WHERE defect_id > ?",
+            (marks.get("defects", 0),)).fetchone()[0]
+        return {"queued": queued, "inspections": inspections, "defects": defects}
+
+    def verify(self, connection, archives=()):
+        """Сравнение сводных таблиц с основными и архивными; возвращает список расхождений"""
+        mismatches = []
+        checks = [
+            ("rollup_inspections_daily", 2, self.INSPECTION_TOTALS),
+            ("rollup_defects_daily", 4, self.DEFECT_TOTALS),
+        ]
+        for table, key_size, statement in checks:
+            expected = {}
+            for schema in ("main", *archives):
+                query = statement.format(schema=schema, rows=self.ALL_ROWS.format(schema=schema))
+                for row in connection.execute(query):
+                    key, values = row[:key_size], row[key_size:]
+                    if key in expected:
+                        values = tuple(a + b for a, b in zip(expected[key], values))
+                    expected[key] = values
+            actual = {row[:key_size]: row[key_size:]
+                      for row in connection.execute(f"SELECT * FROM {table}")}
+            for key in sorted(set(expected) | set(actual)):
+                if expected.get(key) != actual.get(key):
+                    mismatches.append((table, key, expected.get(key), actual.get(key)))
+        return mismatches
+
+
+class QualityReports:
+    """Показатели качества за период по сводным таблицам DailyRollups.
+
+    Период - включительные даты ГГГГ-ММ-ДД; доля проверок с дефектами
+    (defect_rate), дефекты на проверку и доли результатов вычисляются по
+    суммам корзин.
+    """
+
+    GROUPS = {
+        "model": ("smartphone_id", "s.manufacturer, s.model_name",
+                  "LEFT JOIN smartphones s USING (smartphone_id)"),
+        "manufacturer": ("smartphone_id", "s.manufacturer",
+                         "LEFT JOIN smartphones s USING (smartphone_id)"),
+        "day": ("day", "day", ""),
+    }
+
+    COUNTS = ("inspections", "with_defects", "defects", "passed", "failed", "conditional")
+
+    @staticmethod
+    def period(since=None, until=None, days=30):
+        """Проверка дат периода; по умолчанию - последние days дней"""
+        until = until or date.today().isoformat()
+        since = since or (datetime.strptime(until, "%Y-%m-%d").date()
+                          - timedelta(days=days - 1)).isoformat()
+        for value in (since, until):
+            datetime.strptime(value, "%Y-%m-%d")
+        if since > until:
+            raise ValueError("Начало периода позже окончания")
+        return since, until
+
+    @classmethod
+    def rates(cls, counts):
+        """Показатели строки отчета по счетчикам (словарь COUNTS)"""
+        inspections = counts["inspections"]
+        result = dict(counts)
+        result["defect_rate"] = counts["with_defects"] / inspections if inspections else 0.0
+        result["defects_per_inspection"] = counts["defects"] / inspections if inspections else 0.0
+        for name in ("passed", "failed", "conditional"):
+            result[f"{name}_rate"] = counts[name] / inspections if inspections else 0.0
+        return result
+
+    def summary(self, connection, since, until):
+        """Итоги периода"""
+        row = connection.execute(
+            "SELECT IFNULL(SUM(inspections), 0), IFNULL(SUM(with_defects), 0), "
+            "(SELECT IFNULL(SUM(defects), 0) FROM rollup_defects_daily WHERE day BETWEEN ?1 AND ?2), "
+            "IFNULL(SUM(passed), 0), IFNULL(SUM(failed), 0), IFNULL(SUM(conditional), 0) "
+            "FROM rollup_inspections_daily WHERE day BETWEEN ?1 AND ?2",
+            (since, until)).fetchone()
+        return self.rates(dict(zip(self.COUNTS, row)))
+
+    def breakdown(self, connection, since, until, group="model"):
+        """Показатели по моделям, производителям или дням: список (группа, показатели)"""
+        key, columns, join = self.GROUPS[group]
+        query = f"""
+            WITH inspected AS (
+                SELECT {key}, SUM(inspections) AS inspections, SUM(with_defects) AS with_defects,
+                       SUM(passed) AS passed, SUM(failed) AS failed, SUM(conditional) AS conditional
+                FROM rollup_inspections_daily WHERE day BETWEEN ?1 AND ?2 GROUP BY {key}),
+            found AS (
+                SELECT {key}, SUM(defects) AS defects
+                FROM rollup_defects_daily WHERE day BETWEEN ?1 AND ?2 GROUP BY {key})
+            SELECT {columns}, SUM(inspections), SUM(with_defects), SUM(IFNULL(defects, 0)),
+                   SUM(passed), SUM(failed), SUM(conditional)
+            FROM inspected LEFT JOIN found USING ({key}) {join}
+            GROUP BY {columns} ORDER BY {columns}"""
+        size = len(columns.split(","))
+        return [(row[:size], self.rates(dict(zip(self.COUNTS, row[size:]))))
+                for row in connection.execute(query, (since, until))]
+
+    def severities(self, connection, since, until):
+        """Распределение дефектов по типам и серьезности: {тип: {серьезность: количество}}"""
+        result = {}
+        for defect_type, severity, count in connection.execute(
+                "SELECT defect_type, severity, SUM(defects) FROM rollup_defects_daily "
+                "WHERE day BETWEEN ? AND ? GROUP BY 1, 2 ORDER BY 1, 2", (since, until)):
+            result.setdefault(defect_type or None, {})[severity or None] = count
+        return result
+
+    def trend(self, connection, since, until):
+        """Показатели по всем дням периода, включая дни без проверок"""
+        rows = dict((group[0], values) for group, values in
+                    self.breakdown(connection, since, until, "day"))
+        day, last = date.fromisoformat(since), date.fromisoformat(until)
+        empty = self.rates(dict.fromkeys(self.COUNTS, 0))
+        result = []
+        while day <= last:
+            result.append((day.isoformat(), rows.get(day.isoformat(), empty)))
+            day += timedelta(days=1)
+        return result
+
+
+def main():
+    from smartphone_defect_detection import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Сводные таблицы и отчеты о качестве за период")
+    parser.add_argument("database", help="Путь к файлу базы данных")
+    parser.add_argument("command", choices=["refresh", "rebuild", "verify", "report"])
+    parser.add_argument("--since", help="Начало периода ГГГГ-ММ-ДД (по умолчанию - 30 дней назад)")
+    parser.add_argument("--until", help="Окончание периода ГГГГ-ММ-ДД (по умолчанию - сегодня)")
+    parser.add_argument("--group", choices=sorted(QualityReports.GROUPS), default="model",
+                        help="Группировка отчета")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager()
+    db_manager.open(args.database)
+    rollups, reports = DailyRollups(), QualityReports()
+    try:
+        since, until = reports.period(args.since, args.until)
+        with db_manager.pool.writer() as connection:
+            archives = db_manager.archives.attach_files(connection)
+            if args.command == "rebuild":
+                print(f"Корзин проверок: {rollups.rebuild(connection, archives)}")
+            else:
+                print(f"Пересчитано корзин: {rollups.refresh(connection, archives)}")
+
+            if args.command == "verify":
+                mismatches = rollups.verify(connection, archives)
+                for table, key, expected, actual in mismatches:
+                    print(f"{table}{list(key)}: ожидается {expected}, сохранено {actual}")
+                if mismatches:
+                    raise SystemExit(1)
+                print("Сводные таблицы отчетов соответствуют данным")
+            elif args.command == "report":
+                total = reports.summary(connection, since, until)
+                print(f"Период {since} - {until}: проверок {total['inspections']}, "
+                      f"с дефектами {total['defect_rate']:.1%}, дефектов {total['defects']}, "
+                      f"fail {total['failed_rate']:.1%}")
+                for group, row in reports.breakdown(connection, since, until, args.group):
+                    label = " ".join(str(value) for value in group if value is not None) or "—"
+                    print(f"{label:<40} {row['inspections']:>8} {row['defect_rate']:>7.1%} "
+                          f"{row['defects_per_inspection']:>6.2f} {row['failed_rate']:>7.1%}")
+    except (ValueError, sqlite3.Error) as e:
+        print(e)
+        raise SystemExit(1)
+    finally:
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
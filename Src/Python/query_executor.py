@@ -0,0 +1,192 @@
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+
+class QueryExecutor:
+    """Пул фоновых потоков для запросов к SQLite.
+
+    Каждый рабочий поток открывает собственное соединение только для чтения,
+    изменяющие задачи (write=True) выполняются через единственного писателя
+    пула соединений. Вызывающая сторона получает concurrent.futures.Future.
+    Выполняемый запрос можно отменить через cancel(): ожидающая задача
+    снимается с очереди, выполняющаяся прерывается вызовом Connection.interrupt().
+    """
+
+    def __init__(self, pool, workers=3):
+        self.pool = pool
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._tasks = {}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db-worker")
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self.pool.open_reader()
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _run(self, task, func, args, write):
+        if write:
+            with self.pool.writer() as connection:
+                return self._call(task, connection, func, args)
+        connection = self._connection()
+        try:
+            return self._call(task, connection, func, args)
+        finally:
+            if connection.in_transaction:
+                connection.rollback()
+
+    def _call(self, task, connection, func, args):
+        with self._lock:
+            task["connection"] = connection
+        try:
+            return func(connection, *args)
+        finally:
+            with self._lock:
+                task.pop("connection", None)
+
+    def _forget(self, future):
+        with self._lock:
+            self._tasks.pop(future, None)
+
+    def submit(self, func, *args, write=False):
+        """Выполнение func(connection, *args) в фоновом потоке"""
+        task = {}
+        future = self._pool.submit(self._run, task, func, args, write)
+        with self._lock:
+            self._tasks[future] = task
+        future.add_done_callback(self._forget)
+        return future
+
+    def fetch_all(self, query, params=()):
+        """Асинхронное получение всех результатов запроса"""
+        return self.submit(lambda connection: connection.execute(query, params).fetchall())
+
+    def fetch_one(self, query, params=()):
+        """Асинхронное получение одного результата запроса"""
+        return self.submit(lambda connection: connection.execute(query, params).fetchone())
+
+    def execute_query(self, query, params=()):
+        """Асинхронное выполнение изменяющего запроса; возвращает lastrowid"""
+        def run(connection):
+            return connection.execute(query, params).lastrowid
+        return self.submit(run, write=True)
+
+    def cancel(self, future):
+        """Отмена задачи: снятие с очереди или прерывание выполняющегося запроса"""
+        if future.cancel():
+            return True
+        with self._lock:
+            connection = self._tasks.get(future, {}).get("connection")
+            if connection is None:
+                return False
+            connection.interrupt()
+        return True
+
+    def shutdown(self):
+        """Остановка пула и закрытие соединений рабочих потоков"""
+        with self._lock:
+            for task in self._tasks.values():
+                if "connection" in task:
+                    task["connection"].interrupt()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+
+class TkResultDispatcher:
+    """Доставка результатов фоновых задач в поток Tk через root.after.
+
+    Рабочие потоки только кладут завершенные Future в очередь, все обратные вызовы
+    выполняются в главном цикле Tk. Пока есть незавершенные задачи, вызывается
+    on_busy_changed(True), что позволяет показывать индикатор загрузки.
+
+    Об отмене задачи (снятие с очереди или прерванный запрос) сообщает
+    on_cancel(), а если он не задан - on_error задачи с CancelledError. Без
+    обоих обработчиков отмена проходит молча.
+    """
+
+    POLL_INTERVAL_MS = 30
+
+    def __init__(self, root, executor, on_busy_changed=None, on_error=None):
+        self.root = root
+        self.executor = executor
+        self.on_busy_changed = on_busy_changed
+        self.on_error = on_error
+        self._done = queue.Queue()
+        self._pending = set()
+        self._poll_job = None
+
+    def call(self, func, on_success=None, on_error=None, write=False, on_cancel=None):
+        """Запуск func(connection) в фоне с доставкой результата в on_success"""
+        future = self.executor.submit(func, write=write)
+        self._pending.add(future)
+        future.add_done_callback(
+            lambda finished: self._done.put((finished, on_success, on_error, on_cancel)))
+        self._set_busy(True)
+        if self._poll_job is None:
+            self._poll_job = self.root.after(self.POLL_INTERVAL_MS, self._poll)
+        return future
+
+    def cancel_all(self):
+        """Отмена всех незавершенных задач"""
+        for future in list(self._pending):
+            self.executor.cancel(future)
+
+    def _poll(self):
+        self._poll_job = None
+        while True:
+            try:
+                future, on_success, on_error, on_cancel = self._done.get_nowait()
+            except queue.Empty:
+                break
+            self._pending.discard(future)
+            self._deliver(future, on_success, on_error, on_cancel)
+
+        if self._pending:
+            self._poll_job = self.root.after(self.POLL_INTERVAL_MS, self._poll)
+        else:
+            self._set_busy(False)
+
+    def _deliver(self, future, on_success, on_error, on_cancel=None):
+        try:
+            result = future.result()
+        except CancelledError:
+            self._cancelled(on_error, on_cancel)
+            return
+        except sqlite3.OperationalError as e:
+            if "interrupted" in str(e):
+                self._cancelled(on_error, on_cancel)
+                return
+            self._report(e, on_error)
+            return
+        except Exception as e:
+            self._report(e, on_error)
+            return
+        if on_success:
+            on_success(result)
+
+    def _cancelled(self, on_error, on_cancel):
+        if on_cancel:
+            on_cancel()
+        elif on_error:
+            on_error(CancelledError("Задача отменена"))
+
+    def _report(self, error, on_error):
+        handler = on_error or self.on_error
+        if handler:
+            handler(error)
+        else:
+            print(f"Ошибка фонового запроса: {error}")
+
+    def _set_busy(self, busy):
+        if self.on_busy_changed:
+            self.on_busy_changed(busy)
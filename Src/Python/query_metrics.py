@@ -0,0 +1,346 @@
+import argparse
+import bisect
+import itertools
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Курсор с замером времени выполнения и чтения результата.
+
+    Время запроса SELECT складывается из execute и вызовов fetchone/fetchmany/
+    fetchall и учитывается, когда результат прочитан полностью, курсор закрыт
+    или выполнен следующий запрос. Построчная итерация (for row in cursor)
+    не замеряется, чтобы не замедлять чтение больших выборок.
+    """
+
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._track(sql, parameters, time.perf_counter() - started)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        # Генератор параметров не материализуется: первый набор нужен только для плана
+        parameters = iter(seq_of_parameters)
+        first = next(parameters, None)
+        if first is not None:
+            parameters = itertools.chain([first], parameters)
+        started = time.perf_counter()
+        super().executemany(sql, parameters)
+        self.connection.metrics.record(sql, time.perf_counter() - started, self.connection,
+                                       first if first is not None else ())
+        return self
+
+    def _track(self, sql, parameters, elapsed):
+        if self.description is None:
+            self.connection.metrics.record(sql, elapsed, self.connection, parameters)
+        else:
+            self._pending = [sql, parameters, elapsed]
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        result = method(*args)
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - started
+        return result
+
+    def fetchone(self):
+        row = self._fetch(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._fetch(super().fetchmany, size)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(super().fetchall)
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            sql, parameters, elapsed = pending
+            self.connection.metrics.record(sql, elapsed, self.connection, parameters)
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Соединение, все запросы которого проходят через InstrumentedCursor"""
+
+    metrics = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        started = time.perf_counter()
+        cursor = super().executescript(sql_script)
+        self.metrics.record(sql_script, time.perf_counter() - started)
+        return cursor
+
+    def commit(self):
+        started = time.perf_counter()
+        super().commit()
+        self.metrics.record("COMMIT", time.perf_counter() - started)
+
+    def rollback(self):
+        started = time.perf_counter()
+        super().rollback()
+        self.metrics.record("ROLLBACK", time.perf_counter() - started)
+
+
+class StatementStats:
+    """Счетчики одного нормализованного запроса и гистограмма времени"""
+
+    def __init__(self, statement):
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+        self.buckets = [0] * (len(QueryMetrics.BUCKETS_MS) + 1)
+        self.last_plan = None
+
+    def percentile(self, fraction):
+        """Оценка перцентиля по гистограмме (верхняя граница интервала), мс"""
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                if index < len(QueryMetrics.BUCKETS_MS):
+                    return min(QueryMetrics.BUCKETS_MS[index], self.max * 1000)
+                return self.max * 1000
+        return 0.0
+
+    def as_dict(self):
+        bounds = [f"<={bound}" for bound in QueryMetrics.BUCKETS_MS] + [
+            f">{QueryMetrics.BUCKETS_MS[-1]}"]
+        return {
+            "statement": self.statement,
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 3),
+            "mean_ms": round(self.total * 1000 / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 3),
+            "p50_ms": round(self.percentile(0.50), 3),
+            "p95_ms": round(self.percentile(0.95), 3),
+            "p99_ms": round(self.percentile(0.99), 3),
+            "slow": self.slow,
+            "histogram_ms": {bound: count for bound, count in zip(bounds, self.buckets) if count},
+            "last_plan": self.last_plan,
+        }
+
+
+class QueryMetrics:
+    """Замер времени всех запросов соединений пула.
+
+    Соединения создаются с фабрикой InstrumentedConnection, поэтому учитываются
+    и вспомогательные методы DatabaseManager, и курсоры окон таблиц, диалогов
+    и фоновых задач. Запросы группируются по нормализованному тексту (литералы
+    заменяются на ?), для каждой группы ведется гистограмма времени. Запросы
+    дольше slow_ms записываются в журнал медленных запросов (JSON по строке,
+    с ротацией по размеру) вместе с EXPLAIN QUERY PLAN.
+
+    Накладные расходы - два вызова perf_counter и поиск в словаре на запрос;
+    нормализованный текст кэшируется, план строится только для медленных.
+    """
+
+    BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+    NORMALIZE = [
+        (re.compile(r"'(?:[^']|'')*'"), "?"),
+        (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+        (re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)"), "(...)"),
+        (re.compile(r"\s+"), " "),
+    ]
+    MAX_STATEMENTS = 2000
+    MAX_PARAMETERS_TEXT = 300
+
+    def __init__(self, slow_ms=100, log_path=None, log_bytes=5 * 1024 * 1024, log_backups=3,
+                 recent_slow=100):
+        self.slow_seconds = slow_ms / 1000.0
+        self.statements = {}
+        self.recent_slow = deque(maxlen=recent_slow)
+        self.started = time.time()
+        self._normalized = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.connection_class = type("InstrumentedConnection", (InstrumentedConnection,),
+                                     {"metrics": self})
+        self.log = None
+        if log_path:
+            self.log = logging.getLogger(f"{__name__}.{id(self)}")
+            self.log.propagate = False
+            self.log.setLevel(logging.INFO)
+            self._handler = RotatingFileHandler(log_path, maxBytes=log_bytes,
+                                                backupCount=log_backups, encoding="utf-8",
+                                                delay=True)
+            self.log.addHandler(self._handler)
+
+    def normalize(self, sql):
+        statement = self._normalized.get(sql)
+        if statement is None:
+            statement = sql.strip()
+            for pattern, replacement in self.NORMALIZE:
+                statement = pattern.sub(replacement, statement)
+            if len(self._normalized) < self.MAX_STATEMENTS * 4:
+                self._normalized[sql] = statement
+        return statement
+
+    def record(self, sql, seconds, connection=None, parameters=()):
+        """Учет выполненного запроса; медленные записываются в журнал с планом"""
+        if getattr(self._local, "explaining", False):
+            return
+        statement = self.normalize(sql)
+        index = bisect.bisect_left(self.BUCKETS_MS, seconds * 1000)
+        with self._lock:
+            stats = self.statements.get(statement)
+            if stats is None:
+                if len(self.statements) >= self.MAX_STATEMENTS:
+                    statement = "<прочие запросы>"
+                    stats = self.statements.get(statement)
+                if stats is None:
+                    stats = self.statements[statement] = StatementStats(statement)
+            stats.count += 1
+            stats.total += seconds
+            stats.buckets[index] += 1
+            if seconds > stats.max:
+                stats.max = seconds
+        if seconds >= self.slow_seconds:
+            self.record_slow(stats, sql, seconds, connection, parameters)
+
+    def explain(self, connection, sql, parameters=()):
+        """EXPLAIN QUERY PLAN в виде строк с отступами по вложенности"""
+        self._local.explaining = True
+        try:
+            rows = sqlite3.Connection.execute(
+                connection, "EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+        finally:
+            self._local.explaining = False
+        depth = {0: -1}
+        lines = []
+        for node, parent, _, detail in rows:
+            depth[node] = depth.get(parent, -1) + 1
+            lines.append("  " * depth[node] + detail)
+        return lines
+
+    def record_slow(self, stats, sql, seconds, connection, parameters):
+        plan = None
+        if connection is not None and sql.lstrip()[:7].upper() in (
+                "SELECT ", "WITH ", "INSERT ", "UPDATE ", "DELETE ", "REPLACE"):
+            try:
+                plan = self.explain(connection, sql, parameters)
+            except sqlite3.Error as e:
+                plan = [f"план недоступен: {e}"]
+        entry = {
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "ms": round(seconds * 1000, 3),
+            "statement": stats.statement,
+            "sql": " ".join(sql.split()),
+            "parameters": repr(parameters)[:self.MAX_PARAMETERS_TEXT],
+            "plan": plan,
+        }
+        with self._lock:
+            stats.slow += 1
+            stats.last_plan = plan
+            self.recent_slow.append(entry)
+        if self.log is not None:
+            self.log.info(json.dumps(entry, ensure_ascii=False))
+
+    def snapshot(self):
+        """Метрики по запросам, упорядоченные по суммарному времени"""
+        with self._lock:
+            statements = [stats.as_dict() for stats in self.statements.values()]
+            slow = list(self.recent_slow)
+        statements.sort(key=lambda item: item["total_ms"], reverse=True)
+        return {
+            "since": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "slow_ms": self.slow_seconds * 1000,
+            "buckets_ms": list(self.BUCKETS_MS),
+            "statements": statements,
+            "recent_slow": slow,
+        }
+
+    def export(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+    def reset(self):
+        with self._lock:
+            self.statements = {}
+            self.recent_slow.clear()
+            self.started = time.time()
+
+    def close(self):
+        if self.log is not None:
+            self.log.removeHandler(self._handler)
+            self._handler.close()
+            self.log = None
+
+
+def summarize_log(path, top):
+    """Сводка журнала медленных запросов по нормализованному тексту"""
+    groups = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            group = groups.setdefault(entry["statement"], {"count": 0, "total": 0.0,
+                                                           "max": 0.0, "plan": None})
+            group["count"] += 1
+            group["total"] += entry["ms"]
+            group["max"] = max(group["max"], entry["ms"])
+            group["plan"] = entry.get("plan") or group["plan"]
+    ordered = sorted(groups.items(), key=lambda item: item[1]["total"], reverse=True)
+    for statement, group in ordered[:top]:
+        print(f"{group['count']:>6} раз  всего {group['total']:>10.1f} мс  "
+              f"макс. {group['max']:>9.1f} мс")
+        print(f"  {statement}")
+        for line in group["plan"] or []:
+            print(f"    {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сводка журнала медленных запросов")
+    parser.add_argument("log", help="Файл журнала медленных запросов")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+    summarize_log(args.log, args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import image_store
+from config import Config
+
+
+def load_gray(path, size):
+    """Чтение изображения в оттенках серого, масштабированного до size=(ширина, высота)"""
+    from PIL import Image
+
+    with image_store.open_source(path) as source, Image.open(source) as image:
+        image.draft("L", size)
+        image = image.convert("L").resize(size, Image.Resampling.BILINEAR)
+        return np.asarray(image, dtype=np.float32)
+
+
+def normalize(values):
+    """Приведение яркости к нулевому среднему и единичному разбросу"""
+    values = values - values.mean()
+    return values / max(float(values.std()), 1e-3)
+
+
+def align(image, reference):
+    """Совмещение изображения с эталоном по сдвигу (фазовая корреляция)"""
+    spectrum = np.fft.rfft2(reference) * np.conj(np.fft.rfft2(image))
+    spectrum /= np.maximum(np.abs(spectrum), 1e-9)
+    correlation = np.fft.irfft2(spectrum, s=image.shape)
+    dy, dx = np.unravel_index(np.argmax(correlation), correlation.shape)
+    return np.roll(image, (dy, dx), axis=(0, 1))
+
+
+class ReferenceStore:
+    """Эталонные изображения экранов по smartphone_id для сравнения с новыми снимками.
+
+    Эталон строится из изображений проверок с overall_result='pass': снимки
+    масштабируются до общего размера, нормализуются, совмещаются и сводятся
+    в попиксельную медиану и допуск (MAD). Результат хранится в файле .npy
+    вида (2, H, W) float32 и открывается через memory map. Рядом лежит .json
+    с числом образцов и последней учтенной проверкой: при появлении новых
+    проверок 'pass' эталон считается устаревшим и перестраивается. При
+    сравнении снимков актуальность эталона проверяется по базе не чаще раза
+    в REFERENCE_STALE_CHECK_SECONDS для каждой модели.
+    """
+
+    STALE_QUERY = """
+        SELECT COUNT(*), IFNULL(MAX(inspection_id), 0) FROM inspections
+        WHERE smartphone_id = ? AND overall_result = 'pass' AND image_path IS NOT NULL"""
+
+    SAMPLES_QUERY = """
+        SELECT inspection_id, image_path FROM inspections
+        WHERE smartphone_id = ? AND overall_result = 'pass' AND image_path IS NOT NULL
+        ORDER BY inspection_id DESC LIMIT ?"""
+
+    DIFFERENCE_THRESHOLD = 4.0
+
+    def __init__(self, db_manager, base_dir=None, max_samples=None, max_loaded=16):
+        self.db_manager = db_manager
+        self.base_dir = base_dir or Config.REFERENCES_DIR
+        self.max_samples = max_samples or Config.REFERENCE_MAX_SAMPLES
+        self.max_loaded = max_loaded
+        self._loaded = OrderedDict()
+        self._checked = {}
+        self._lock = threading.Lock()
+
+    def paths(self, smartphone_id):
+        base = os.path.join(self.base_dir, f"smartphone_{smartphone_id}")
+        return base + ".npy", base + ".json"
+
+    def read_meta(self, smartphone_id):
+        try:
+            with open(self.paths(smartphone_id)[1], encoding="utf-8") as source:
+                return json.load(source)
+        except (OSError, ValueError):
+            return None
+
+    def is_stale(self, smartphone_id, meta=None, max_age=0):
+        """Эталон отсутствует или появились новые проверки 'pass'.
+
+        Если эталон был признан актуальным менее max_age секунд назад,
+        запрос к базе не выполняется.
+        """
+        meta = meta or self.read_meta(smartphone_id)
+        if meta is None:
+            return True
+        with self._lock:
+            checked = self._checked.get(smartphone_id)
+        if checked is not None and time.monotonic() - checked < max_age:
+            return False
+        count, last_id = self.db_manager.fetch_one(self.STALE_QUERY, (smartphone_id,))
+        if last_id != meta["last_inspection_id"] or count != meta["available_samples"]:
+            return True
+        with self._lock:
+            self._checked[smartphone_id] = time.monotonic()
+        return False
+
+    def target_size(self, smartphone_id, first_image_path):
+        """Размер эталона: длинная сторона REFERENCE_SIZE, пропорции - по разрешению модели"""
+        from PIL import Image
+
+        with image_store.open_source(first_image_path) as source, Image.open(source) as image:
+            width, height = image.size
+
+        row = self.db_manager.fetch_one(
+            "SELECT resolution FROM smartphones WHERE smartphone_id=?", (smartphone_id,))
+        try:
+            sides = sorted(int(part) for part in row[0].lower().replace(" ", "").split("x"))
+            # Разрешение записывается без учета ориентации - берем ее со снимка
+            width, height = sides if width <= height else sides[::-1]
+        except (TypeError, ValueError, AttributeError):
+            pass
+
+        scale = Config.REFERENCE_SIZE / max(width, height)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def build(self, smartphone_id):
+        """Построение эталона модели; возвращает метаданные или None при отсутствии образцов"""
+        count, last_id = self.db_manager.fetch_one(self.STALE_QUERY, (smartphone_id,))
+        rows = self.db_manager.fetch_all(self.SAMPLES_QUERY, (smartphone_id, self.max_samples))
+        rows = [(inspection_id, path) for inspection_id, path in rows if image_store.exists(path)]
+        if not rows:
+            return None
+
+        size = self.target_size(smartphone_id, rows[0][1])
+        samples = []
+        for _, path in rows:
+            try:
+                samples.append(normalize(load_gray(path, size)))
+            except Exception as e:
+                print(f"Ошибка при чтении эталонного образца {path}: {e}")
+        if not samples:
+            return None
+
+        anchor = samples[0]
+        stack = np.stack([anchor] + [align(sample, anchor) for sample in samples[1:]])
+        median = np.median(stack, axis=0)
+        tolerance = np.median(np.abs(stack - median), axis=0) * 1.4826
+        # Допуск не меньше шума всего снимка, иначе при малом числе образцов
+        # любое отличие в однородной области будет считаться дефектом
+        tolerance = np.maximum(tolerance, max(float(np.median(tolerance)), 0.05))
+
+        meta = {
+            "smartphone_id": smartphone_id,
+            "width": size[0],
+            "height": size[1],
+            "samples": len(samples),
+            "available_samples": count,
+            "last_inspection_id": last_id,
+            "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        self.save(smartphone_id, np.stack([median, tolerance]).astype(np.float32), meta)
+        with self._lock:
+            self._checked[smartphone_id] = time.monotonic()
+        return meta
+
+    def save(self, smartphone_id, reference, meta):
+        """Атомарная запись файлов эталона"""
+        array_path, meta_path = self.paths(smartphone_id)
+        os.makedirs(self.base_dir, exist_ok=True)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+
+        with open(array_path + suffix, "wb") as target:
+            np.save(target, reference)
+        with open(meta_path + suffix, "w", encoding="utf-8") as target:
+            json.dump(meta, target, ensure_ascii=False)
+
+        with self._lock:
+            self._loaded.pop(smartphone_id, None)
+        os.replace(array_path + suffix, array_path)
+        os.replace(meta_path + suffix, meta_path)
+
+    def get(self, smartphone_id, rebuild=True):
+        """Эталон модели (memory map) и его метаданные; при необходимости перестраивается"""
+        with self._lock:
+            cached = self._loaded.get(smartphone_id)
+            if cached is not None:
+                self._loaded.move_to_end(smartphone_id)
+
+        meta = cached[1] if cached else self.read_meta(smartphone_id)
+        if rebuild and self.is_stale(smartphone_id, meta, Config.REFERENCE_STALE_CHECK_SECONDS):
+            meta = self.build(smartphone_id)
+            cached = None
+        if meta is None:
+            return None, None
+        if cached is not None:
+            return cached
+
+        array_path = self.paths(smartphone_id)[0]
+        reference = np.load(array_path, mmap_mode="r")
+        os.utime(self.paths(smartphone_id)[1])
+
+        with self._lock:
+            self._loaded[smartphone_id] = (reference, meta)
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+        return reference, meta
+
+    def score(self, image_path, smartphone_id, rebuild=True):
+        """Сравнение снимка с эталоном модели.
+
+        Возвращает словарь с долей отличающихся пикселей, средним отклонением
+        и картой отклонений в единицах допуска (или None без эталона).
+        """
+        reference, meta = self.get(smartphone_id, rebuild)
+        if reference is None:
+            return None
+
+        image = normalize(load_gray(image_path, (meta["width"], meta["height"])))
+        image = align(image, reference[0])
+        difference = np.abs(image - reference[0]) / reference[1]
+        return {
+            "score": float(np.mean(difference > self.DIFFERENCE_THRESHOLD)),
+            "mean_difference": float(difference.mean()),
+            "max_difference": float(difference.max()),
+            "difference": difference,
+        }
+
+    def refresh(self, smartphone_ids=None):
+        """Перестроение устаревших эталонов; возвращает идентификаторы перестроенных"""
+        if smartphone_ids is None:
+            smartphone_ids = [row[0] for row in self.db_manager.fetch_all(
+                "SELECT DISTINCT smartphone_id FROM inspections "
+                "WHERE overall_result = 'pass' AND image_path IS NOT NULL")]
+        rebuilt = []
+        for smartphone_id in smartphone_ids:
+            if self.is_stale(smartphone_id) and self.build(smartphone_id):
+                rebuilt.append(smartphone_id)
+        return rebuilt
+
+    def evict(self, max_age_days=None, max_models=None):
+        """Удаление эталонов моделей, которые больше не проверяются.
+
+        Удаляются эталоны удаленных смартфонов, моделей без проверок за
+        max_age_days дней и наиболее давно использованные сверх max_models.
+        """
+        max_age_days = max_age_days if max_age_days is not None else Config.REFERENCE_MAX_AGE_DAYS
+        max_models = max_models if max_models is not None else Config.REFERENCE_MAX_MODELS
+        if not os.path.isdir(self.base_dir):
+            return []
+
+        stored = {}
+        for name in os.listdir(self.base_dir):
+            if name.startswith("smartphone_") and name.endswith(".json"):
+                try:
+                    smartphone_id = int(name[len("smartphone_"):-len(".json")])
+                except ValueError:
+                    continue
+                stored[smartphone_id] = os.path.getmtime(os.path.join(self.base_dir, name))
+
+        active = {row[0] for row in self.db_manager.fetch_all(
+            "SELECT DISTINCT smartphone_id FROM inspections "
+            "WHERE inspection_date >= datetime('now', ?)", (f"-{int(max_age_days)} days",))}
+        existing = {row[0] for row in self.db_manager.fetch_all(
+            "SELECT smartphone_id FROM smartphones")}
+
+        evicted = [smartphone_id for smartphone_id in stored
+                   if smartphone_id not in existing or smartphone_id not in active]
+        remaining = sorted((used, smartphone_id) for smartphone_id, used in stored.items()
+                           if smartphone_id not in evicted)
+        evicted.extend(smartphone_id for _, smartphone_id
+                       in remaining[:max(0, len(remaining) - max_models)])
+
+        for smartphone_id in evicted:
+            with self._lock:
+                self._loaded.pop(smartphone_id, None)
+            for path in self.paths(smartphone_id):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return evicted
+
+
+def main():
+    from smartphone_defect_detection import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Эталонные изображения моделей смартфонов")
+    parser.add_argument("database", help="Путь к файлу базы данных")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    refresh = subparsers.add_parser("refresh", help="Перестроить устаревшие эталоны")
+    refresh.add_argument("--smartphone-id", type=int, action="append", default=None)
+    score = subparsers.add_parser("score", help="Сравнить снимок с эталоном")
+    score.add_argument("image")
+    score.add_argument("--smartphone-id", type=int, required=True)
+    evict = subparsers.add_parser("evict", help="Удалить неиспользуемые эталоны")
+    evict.add_argument("--max-age-days", type=int, default=None)
+    evict.add_argument("--max-models", type=int, default=None)
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager()
+    db_manager.open(args.database)
+    store = ReferenceStore(db_manager)
+    try:
+        if args.command == "refresh":
+            rebuilt = store.refresh(args.smartphone_id)
+            print(f"Перестроено эталонов: {len(rebuilt)}")
+        elif args.command == "score":
+            result = store.score(args.image, args.smartphone_id)
+            if result is None:
+                print("Нет эталона: для модели отсутствуют проверки с результатом 'pass'")
+            else:
+                print(f"Доля отличий: {result['score']:.4f}, "
+                      f"среднее отклонение: {result['mean_difference']:.2f}, "
+                      f"максимальное: {result['max_difference']:.2f}")
+        else:
+            evicted = store.evict(args.max_age_days, args.max_models)
+            print(f"Удалено эталонов: {len(evicted)}")
+    finally:
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import re
+import threading
+
+
+class ColumnMetadata:
+    """Описание колонки: тип, ограничения и допустимые значения из CHECK"""
+
+    def __init__(self, name, column_type, not_null, default, primary_key):
+        self.name = name
+        self.type = column_type
+        self.not_null = bool(not_null)
+        self.default = default
+        self.primary_key = bool(primary_key)
+        self.choices = None
+        self.range = None
+
+    @property
+    def auto_timestamp(self):
+        """Колонка заполняется базой (DEFAULT CURRENT_TIMESTAMP)"""
+        return (self.default or "").upper() == "CURRENT_TIMESTAMP"
+
+    @property
+    def required(self):
+        return self.not_null and self.default is None and not self.primary_key
+
+
+class TableMetadata:
+    """Структура таблицы и заранее построенные запросы к ней"""
+
+    def __init__(self, name, columns, indexed_columns=(), references=()):
+        self.name = name
+        self.columns = columns
+        # Внешние ключи: (колонка, родительская таблица, колонка родителя, ON DELETE)
+        self.references = list(references)
+        self.column_names = [column.name for column in columns]
+        self.by_name = {column.name: column for column in columns}
+
+        pk_columns = [column.name for column in columns if column.primary_key]
+        self.key_column = pk_columns[0] if len(pk_columns) == 1 else "rowid"
+        self.select_list = ("rowid, *" if self.key_column == "rowid"
+                            else ", ".join(self.column_names))
+        # Колонки, с которых начинается какой-либо индекс (поиск по ним - без полного просмотра)
+        self.indexed_columns = set(indexed_columns) | set(pk_columns)
+
+        self.select_statement = (f"SELECT {', '.join(self.column_names)} FROM {name} "
+                                 f"WHERE {self.key_column}=?")
+        self.delete_statement = f"DELETE FROM {name} WHERE {self.key_column}=?"
+        self._insert_statements = {}
+        self._update_statements = {}
+
+    def column(self, name):
+        return self.by_name.get(name)
+
+    def choices(self, name):
+        column = self.by_name.get(name)
+        return column.choices if column else None
+
+    def insert_statement(self, columns):
+        """INSERT для набора колонок (кэшируется по набору)"""
+        columns = tuple(columns)
+        statement = self._insert_statements.get(columns)
+        if statement is None:
+            placeholders = ", ".join("?" for _ in columns)
+            statement = f"INSERT INTO {self.name} ({', '.join(columns)}) VALUES ({placeholders})"
+            self._insert_statements[columns] = statement
+        return statement
+
+    def update_statement(self, columns):
+        """UPDATE по первичному ключу для набора колонок (кэшируется по набору)"""
+        columns = tuple(columns)
+        statement = self._update_statements.get(columns)
+        if statement is None:
+            set_clause = ", ".join(f"{column}=?" for column in columns)
+            statement = f"UPDATE {self.name} SET {set_clause} WHERE {self.key_column}=?"
+            self._update_statements[columns] = statement
+        return statement
+
+
+class SchemaMetadata:
+    """Кэш метаданных схемы базы данных.
+
+    Структура всех таблиц читается один раз (sqlite_master, PRAGMA table_info
+    и index_list), ограничения CHECK вида "col IN (...)" и "col BETWEEN a AND b"
+    разбираются в допустимые значения. Кэш сбрасывается при изменении PRAGMA schema_version,
+    поэтому диалоги и представления таблиц открываются без запросов метаданных.
+    """
+
+    CHECK_IN = re.compile(r"CHECK\s*\(\s*(\w+)\s+IN\s*\(([^)]*)\)\s*\)", re.IGNORECASE)
+    CHECK_BETWEEN = re.compile(
+        r"CHECK\s*\(\s*(\w+)\s+BETWEEN\s+(-?\d+)\s+AND\s+(-?\d+)\s*\)", re.IGNORECASE)
+    STRING_LITERAL = re.compile(r"'((?:[^']|'')*)'")
+    MAX_RANGE_CHOICES = 20
+
+    def __init__(self):
+        self.schema_version = None
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def load(self, connection):
+        """Чтение структуры всех таблиц"""
+        version = connection.execute("PRAGMA schema_version").fetchone()[0]
+        tables = {}
+        rows = connection.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'table' "
+            "AND name NOT LIKE 'sqlite_%' AND sql NOT LIKE 'CREATE VIRTUAL%'").fetchall()
+        for name, sql in rows:
+            columns = [ColumnMetadata(col[1], col[2], col[3], col[4], col[5])
+                       for col in connection.execute(f"PRAGMA table_info({name})")]
+            by_name = {column.name: column for column in columns}
+            self.parse_checks(sql or "", by_name)
+            indexed = set()
+            for index in connection.execute(f"PRAGMA index_list({name})").fetchall():
+                first = connection.execute(f"PRAGMA index_info({index[1]})").fetchone()
+                if first and first[2]:
+                    indexed.add(first[2])
+            references = [(row[3], row[2], row[4], row[6]) for row in
+                          connection.execute(f"PRAGMA foreign_key_list({name})")]
+            tables[name] = TableMetadata(name, columns, indexed, references)
+
+        with self._lock:
+            self.tables = tables
+            self.schema_version = version
+
+    def parse_checks(self, sql, columns):
+        for name, values in self.CHECK_IN.findall(sql):
+            if name in columns:
+                columns[name].choices = [value.replace("''", "'")
+                                         for value in self.STRING_LITERAL.findall(values)]
+        for name, low, high in self.CHECK_BETWEEN.findall(sql):
+            if name in columns:
+                low, high = int(low), int(high)
+                columns[name].range = (low, high)
+                if high - low < self.MAX_RANGE_CHOICES:
+                    columns[name].choices = list(range(low, high + 1))
+
+    def check(self, connection):
+        """Сброс кэша при изменении схемы; возвращает True, если схема изменилась"""
+        version = connection.execute("PRAGMA schema_version").fetchone()[0]
+        if version == self.schema_version:
+            return False
+        self.load(connection)
+        return True
+
+    def children(self, name):
+        """Таблицы, ссылающиеся на name: (таблица, колонка, ON DELETE)"""
+        with self._lock:
+            tables = list(self.tables.values())
+        return [(table.name, column, on_delete) for table in tables
+                for column, parent, _, on_delete in table.references if parent == name]
+
+    def table(self, name, connection=None):
+        """Метаданные таблицы; с connection предварительно проверяется schema_version"""
+        if connection is not None:
+            self.check(connection)
+        with self._lock:
+            metadata = self.tables.get(name)
+        if metadata is None:
+            raise KeyError(f"Таблица {name} не найдена")
+        return metadata
@@ -0,0 +1,277 @@
+import argparse
+import sqlite3
+
+from archive import ArchiveManager
+from change_log import ChangeLog
+from defect_heatmap import DefectLocationIndex
+from full_text_search import FullTextSearch
+from quality_reports import DailyRollups
+from statistics_cache import StatisticsCache
+
+
+class SchemaMigrations:
+    """Версионные миграции схемы по PRAGMA user_version.
+
+    Каждая миграция выполняется в отдельной транзакции вместе с увеличением
+    user_version, поэтому существующие файлы .db обновляются на месте, а при
+    актуальной версии схемы подключение не выполняет ни одного DDL-запроса.
+    """
+
+    BASE_TABLES = [
+        """CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL CHECK(role IN ('admin', 'inspector', 'viewer')),
+            full_name TEXT,
+            email TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+
+        """CREATE TABLE IF NOT EXISTS smartphones (
+            smartphone_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            model_name TEXT NOT NULL,
+            manufacturer TEXT NOT NULL,
+            screen_size REAL,
+            resolution TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+
+        """CREATE TABLE IF NOT EXISTS inspections (
+            inspection_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            smartphone_id INTEGER,
+            inspector_id INTEGER,
+            inspection_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status TEXT CHECK(status IN ('pending', 'in_progress', 'completed', 'rejected')),
+            overall_result TEXT CHECK(overall_result IN ('pass', 'fail', 'conditional')),
+            notes TEXT,
+            image_path TEXT,
+            FOREIGN KEY (smartphone_id) REFERENCES smartphones(smartphone_id) ON DELETE CASCADE,
+            FOREIGN KEY (inspector_id) REFERENCES users(user_id) ON DELETE SET NULL
+        )""",
+
+        """CREATE TABLE IF NOT EXISTS defects (
+            defect_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            inspection_id INTEGER,
+            defect_type TEXT CHECK(defect_type IN ('scratch', 'chip', 'crack', 'discoloration', 'other')),
+            severity INTEGER CHECK(severity BETWEEN 1 AND 5),
+            location_x INTEGER,
+            location_y INTEGER,
+            size REAL,
+            description TEXT,
+            detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (inspection_id) REFERENCES inspections(inspection_id) ON DELETE CASCADE
+        )""",
+
+        """CREATE TABLE IF NOT EXISTS defect_images (
+            image_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            defect_id INTEGER,
+            image_path TEXT NOT NULL,
+            thumbnail_path TEXT,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (defect_id) REFERENCES defects(defect_id) ON DELETE CASCADE
+        )"""
+    ]
+
+    INDEXES = [
+        "CREATE INDEX IF NOT EXISTS idx_defects_inspection ON defects(inspection_id)",
+        "CREATE INDEX IF NOT EXISTS idx_defects_type ON defects(defect_type, severity)",
+        "CREATE INDEX IF NOT EXISTS idx_inspections_date ON inspections(inspection_date)",
+        "CREATE INDEX IF NOT EXISTS idx_inspections_smartphone "
+        "ON inspections(smartphone_id, inspection_date)",
+        "CREATE INDEX IF NOT EXISTS idx_inspections_status "
+        "ON inspections(status, inspection_date)",
+        "CREATE INDEX IF NOT EXISTS idx_smartphones_manufacturer "
+        "ON smartphones(manufacturer, model_name)",
+        "CREATE INDEX IF NOT EXISTS idx_defect_images_defect ON defect_images(defect_id)",
+        "CREATE INDEX IF NOT EXISTS idx_inspections_inspector ON inspections(inspector_id)"
+    ]
+
+    # Таблицы с внешними ключами, пересоздаваемые миграцией каскадного удаления
+    CASCADE_TABLES = ("inspections", "defects", "defect_images")
+
+    def __init__(self):
+        self.migrations = [
+            (1, "Базовые таблицы", self.create_base_tables),
+            (2, "Индексы для внешних ключей, дат и группировок", self.create_indexes),
+            (3, "Сводные таблицы статистики", self.create_statistics),
+            (4, "Пространственный индекс координат дефектов", self.create_defect_locations),
+            (5, "Полнотекстовый поиск по заметкам и описаниям", self.create_full_text_search),
+            (6, "Реестр архивных файлов", self.create_archive_registry),
+            (7, "Журнал изменений строк", self.create_change_log),
+            (8, "Каскадное удаление по внешним ключам", self.create_cascades),
+            (9, "Сводные таблицы отчетов о качестве по дням", self.create_daily_rollups),
+            (10, "Перцептивные хеши изображений дефектов", self.create_image_fingerprints),
+            (11, "Порядок записи перцептивных хешей", self.create_fingerprint_sequence),
+            (12, "Счетчик порядка записи перцептивных хешей", self.create_fingerprint_counter)
+        ]
+
+    @property
+    def latest_version(self):
+        return self.migrations[-1][0]
+
+    def current_version(self, connection):
+        """Текущая версия схемы файла базы данных"""
+        return connection.execute("PRAGMA user_version").fetchone()[0]
+
+    def is_current(self, connection):
+        return self.current_version(connection) >= self.latest_version
+
+    def migrate(self, connection):
+        """Применение недостающих миграций; возвращает список примененных версий"""
+        version = self.current_version(connection)
+        if version >= self.latest_version:
+            return []
+
+        if connection.in_transaction:
+            connection.commit()
+        # Пересоздание таблиц (DROP TABLE) при включенных внешних ключах
+        # удалило бы дочерние строки каскадом; PRAGMA действует только вне транзакции
+        foreign_keys = connection.execute("PRAGMA foreign_keys").fetchone()[0]
+        connection.execute("PRAGMA foreign_keys = OFF")
+        applied = []
+        try:
+            for number, description, migration in self.migrations:
+                if number <= version:
+                    continue
+                connection.execute("BEGIN IMMEDIATE")
+                try:
+                    if self.current_version(connection) >= number:
+                        connection.rollback()
+                        continue
+                    migration(connection)
+                    connection.execute(f"PRAGMA user_version = {number}")
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
+                applied.append((number, description))
+        finally:
+            if foreign_keys:
+                connection.execute("PRAGMA foreign_keys = ON")
+        return applied
+
+    def create_base_tables(self, connection):
+        for table in self.BASE_TABLES:
+            connection.execute(table)
+
+    def create_indexes(self, connection):
+        for index in self.INDEXES:
+            connection.execute(index)
+        connection.execute("PRAGMA analysis_limit = 1000")
+        connection.execute("ANALYZE")
+
+    def create_statistics(self, connection):
+        StatisticsCache().create(connection)
+
+    def create_defect_locations(self, connection):
+        DefectLocationIndex().create(connection)
+
+    def create_full_text_search(self, connection):
+        FullTextSearch().create(connection)
+
+    def create_archive_registry(self, connection):
+        connection.execute(ArchiveManager.REGISTRY)
+
+    def create_change_log(self, connection):
+        ChangeLog().create(connection)
+
+    def create_cascades(self, connection):
+        """Пересоздание таблиц с ON DELETE CASCADE / SET NULL.
+
+        Ссылки на уже удаленные строки (оставшиеся с тех пор, когда внешние
+        ключи не проверялись) обнуляются, а не удаляются вместе со строками.
+        """
+        statements = {table: statement for table in self.CASCADE_TABLES
+                      for statement in self.BASE_TABLES if f"EXISTS {table} (" in statement}
+        for table in self.CASCADE_TABLES:
+            for _, _, parent, column, key, *_ in connection.execute(
+                    f"PRAGMA foreign_key_list({table})").fetchall():
+                connection.execute(
+                    f"UPDATE {table} SET {column} = NULL WHERE {column} IS NOT NULL "
+                    f"AND {column} NOT IN (SELECT {key} FROM {parent})")
+            sql = connection.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                     (table,)).fetchone()[0]
+            if "ON DELETE" not in sql.upper():
+                self.rebuild_table(connection, table, statements[table])
+
+        # DROP TABLE удаляет индексы и триггеры таблицы - создаем их заново
+        for index in self.INDEXES:
+            connection.execute(index)
+        triggers = (StatisticsCache.TRIGGERS + DefectLocationIndex.TRIGGERS +
+                    FullTextSearch().triggers + ChangeLog().triggers)
+        for trigger in triggers:
+            connection.execute(trigger)
+        connection.execute("PRAGMA analysis_limit = 1000")
+        for table in self.CASCADE_TABLES:
+            connection.execute(f"ANALYZE {table}")
+
+        violations = connection.execute("PRAGMA foreign_key_check").fetchall()
+        if violations:
+            raise sqlite3.IntegrityError(
+                f"Нарушены внешние ключи: {len(violations)} строк, например {violations[0]}")
+
+    def create_daily_rollups(self, connection):
+        DailyRollups().create(connection)
+
+    def create_image_fingerprints(self, connection):
+        # Импорт при миграции: модуль загружает NumPy
+        from image_fingerprints import ImageFingerprints
+        connection.execute(ImageFingerprints.TABLE)
+
+    def create_fingerprint_sequence(self, connection):
+        from image_fingerprints import ImageFingerprints
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(image_fingerprints)")]
+        if "seq" not in columns:
+            connection.execute("ALTER TABLE image_fingerprints ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+            connection.execute("UPDATE image_fingerprints SET seq = image_id")
+        connection.execute(ImageFingerprints.INDEX)
+
+    def create_fingerprint_counter(self, connection):
+        from image_fingerprints import ImageFingerprints
+        connection.execute(ImageFingerprints.SEQUENCE)
+        connection.execute(
+            "INSERT INTO image_fingerprint_sequence (seq) SELECT IFNULL(MAX(seq), 0) FROM image_fingerprints "
+            "WHERE NOT EXISTS (SELECT 1 FROM image_fingerprint_sequence)")
+
+    @staticmethod
+    def rebuild_table(connection, table, statement):
+        """Пересоздание таблицы по новому определению с сохранением строк и счетчика ключей.
+
+        Внешние ключи соединения должны быть выключены; индексы и триггеры
+        таблицы вызывающая сторона создает заново.
+        """
+        rebuilt = f"{table}_rebuild"
+        columns = ", ".join(row[1] for row in connection.execute(f"PRAGMA table_info({table})"))
+        sequence = connection.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        connection.execute(statement.replace(f"EXISTS {table} (", f"EXISTS {rebuilt} (", 1))
+        connection.execute(f"INSERT INTO {rebuilt} ({columns}) SELECT {columns} FROM {table}")
+        connection.execute(f"DROP TABLE {table}")
+        connection.execute(f"ALTER TABLE {rebuilt} RENAME TO {table}")
+        if sequence is not None:
+            updated = connection.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?",
+                                         (sequence[0], table)).rowcount
+            if not updated:
+                connection.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)",
+                                   (table, sequence[0]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обновление схемы базы данных")
+    parser.add_argument("database", help="Путь к файлу базы данных")
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.database)
+    migrations = SchemaMigrations()
+    try:
+        applied = migrations.migrate(connection)
+        for number, description in applied:
+            print(f"Применена миграция {number}: {description}")
+        print(f"Версия схемы: {migrations.current_version(connection)}")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,92 +1,99 @@
+import time
+STARTED = time.perf_counter()
+
+import argparse
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import sqlite3
 import hashlib
 import os
 from datetime import datetime
-import json
-from PIL import Image, ImageTk
 import threading
+import startup_profile
+import image_store
+from table_view import PagedTreeview
+from query_executor import QueryExecutor, TkResultDispatcher
+from statistics_cache import StatisticsCache
+from defect_heatmap import DefectLocationIndex, DefectHeatmaps
+from full_text_search import FullTextSearch
+from schema_migrations import SchemaMigrations
+from schema_metadata import SchemaMetadata
+from connection_pool import ConnectionProfile, ConnectionPool
+from query_metrics import QueryMetrics
+from data_export import DataExporter, ExportReport
+from archive import ArchiveManager, default_cutoff
+from change_log import ChangeLog
+from batch_operations import BatchOperations, BatchReport
+from quality_reports import DailyRollups, QualityReports
+from config import Config
+from thumbnails import ThumbnailGenerator
+from image_viewer import PhotoImageCache, ImagePreviewPane
+
+IMPORTED = time.perf_counter()
 
 class DatabaseManager:
     def __init__(self):
         self.connection = None
         self.db_path = None
+        self.pool = None
+        self.executor = None
+        self.metrics = None
+        self.statistics = StatisticsCache()
+        self.locations = DefectLocationIndex()
+        self.heatmaps = DefectHeatmaps()
+        self.search = FullTextSearch()
+        self.migrations = SchemaMigrations()
+        self.schema = SchemaMetadata()
+        self.archives = ArchiveManager(self)
+        self.changes = ChangeLog()
+        self.rollups = DailyRollups()
+        self.reports = QualityReports()
+        self.images = None
         
     def connect(self, db_path):
         """Подключение к базе данных"""
         try:
-            self.connection = sqlite3.connect(db_path)
-            self.db_path = db_path
-            self.create_tables()
-            self.create_default_admin()
+            self.open(db_path)
             return True
         except Exception as e:
             messagebox.showerror("Ошибка подключения", str(e))
             return False
     
+    def open(self, db_path):
+        """Открытие базы данных без графического интерфейса; ошибки пробрасываются"""
+        self.close()
+        with startup_profile.phase("Открытие пула соединений"):
+            profile = ConnectionProfile(**Config.DB_PROFILE)
+            if Config.QUERY_METRICS_ENABLED:
+                self.metrics = QueryMetrics(Config.SLOW_QUERY_MS, f"{db_path}.slow.log",
+                                            Config.SLOW_QUERY_LOG_BYTES,
+                                            Config.SLOW_QUERY_LOG_BACKUPS)
+            self.pool = ConnectionPool(db_path, profile, readers=Config.DB_READ_CONNECTIONS,
+                                       metrics=self.metrics)
+            self.connection = self.pool.writer_connection
+            self.db_path = db_path
+            # Ссылки sha256: в image_path читаются из <база>.images.db
+            self.images = image_store.configure(image_store.ImageStore.path_for(db_path))
+        with self.pool.writer():
+            # Схема создается и обновляется только если user_version отстает от последней миграции
+            with startup_profile.phase("Проверка версии схемы"):
+                current = self.migrations.is_current(self.connection)
+            if not current:
+                with startup_profile.phase("Создание схемы"):
+                    self.create_tables()
+                    self.create_default_admin()
+            with startup_profile.phase("Чтение метаданных схемы"):
+                self.schema.load(self.connection)
+            self.archives.enabled = False
+            self.archives.load(self.connection)
+            self.changes.prune(self.connection, Config.CHANGE_LOG_MAX_ROWS)
+        # Отдельное соединение для опроса data_version: значение меняется только
+        # после фиксации транзакций других соединений, включая писателя пула
+        self.changes.watch(profile.open(db_path, read_only=True))
+        self.executor = QueryExecutor(self.pool)
+    
     def create_tables(self):
-        """Создание таблиц, если они не существуют"""
-        tables = [
-            """CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                role TEXT NOT NULL CHECK(role IN ('admin', 'inspector', 'viewer')),
-                full_name TEXT,
-                email TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )""",
-            
-            """CREATE TABLE IF NOT EXISTS smartphones (
-                smartphone_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                model_name TEXT NOT NULL,
-                manufacturer TEXT NOT NULL,
-                screen_size REAL,
-                resolution TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )""",
-            
-            """CREATE TABLE IF NOT EXISTS inspections (
-                inspection_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                smartphone_id INTEGER,
-                inspector_id INTEGER,
-                inspection_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                status TEXT CHECK(status IN ('pending', 'in_progress', 'completed', 'rejected')),
-                overall_result TEXT CHECK(overall_result IN ('pass', 'fail', 'conditional')),
-                notes TEXT,
-                image_path TEXT,
-                FOREIGN KEY (smartphone_id) REFERENCES smartphones(smartphone_id),
-                FOREIGN KEY (inspector_id) REFERENCES users(user_id)
-            )""",
-            
-            """CREATE TABLE IF NOT EXISTS defects (
-                defect_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                inspection_id INTEGER,
-                defect_type TEXT CHECK(defect_type IN ('scratch', 'chip', 'crack', 'discoloration', 'other')),
-                severity INTEGER CHECK(severity BETWEEN 1 AND 5),
-                location_x INTEGER,
-                location_y INTEGER,
-                size REAL,
-                description TEXT,
-                detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (inspection_id) REFERENCES inspections(inspection_id)
-            )""",
-            
-            """CREATE TABLE IF NOT EXISTS defect_images (
-                image_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                defect_id INTEGER,
-                image_path TEXT NOT NULL,
-                thumbnail_path TEXT,
-                uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (defect_id) REFERENCES defects(defect_id)
-            )"""
-        ]
-        
-        cursor = self.connection.cursor()
-        for table in tables:
-            cursor.execute(table)
-        self.connection.commit()
+        """Создание и обновление схемы базы данных до актуальной версии"""
+        self.migrations.migrate(self.connection)
     
     def create_default_admin(self):
         """Создание администратора по умолчанию"""
@@ -115,23 +122,35 @@ class DatabaseManager:
         return cursor.fetchone()
     
     def execute_query(self, query, params=()):
-        """Выполнение запроса"""
-        cursor = self.connection.cursor()
-        cursor.execute(query, params)
-        self.connection.commit()
+        """Выполнение запроса через соединение-писатель"""
+        with self.pool.writer() as connection:
+            cursor = connection.cursor()
+            cursor.execute(query, params)
         return cursor
     
     def fetch_all(self, query, params=()):
         """Получение всех результатов запроса"""
-        cursor = self.connection.cursor()
-        cursor.execute(query, params)
-        return cursor.fetchall()
+        with self.pool.reader() as connection:
+            return connection.execute(query, params).fetchall()
     
     def fetch_one(self, query, params=()):
         """Получение одного результата запроса"""
-        cursor = self.connection.cursor()
-        cursor.execute(query, params)
-        return cursor.fetchone()
+        with self.pool.reader() as connection:
+            return connection.execute(query, params).fetchone()
+    
+    def close(self):
+        """Остановка фоновых запросов и закрытие соединения"""
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+        if self.pool:
+            self.pool.close()
+            self.pool = None
+            self.connection = None
+        if self.metrics:
+            self.metrics.close()
+        self.changes.close()
+        self.images = image_store.configure(None)
 
 class LoginWindow:
     def __init__(self, root, db_manager, on_login_success):
@@ -199,9 +218,15 @@ class MainApplication:
         self.root.geometry("1200x700")
         
         self.db_manager = DatabaseManager()
+        self.thumbnails = ThumbnailGenerator(self.db_manager)
+        self._fingerprints = None
+        self.image_cache = PhotoImageCache(Config.IMAGE_CACHE_BYTES)
+        self.preview = None
+        self.dispatcher = None
         self.current_user = None
         
         self.create_menu()
+        self.create_status_bar()
         
         self.main_frame = tk.Frame(root)
         self.main_frame.pack(fill="both", expand=True)
@@ -222,6 +247,70 @@ class MainApplication:
         
         self.admin_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Администрирование", menu=self.admin_menu)
+        
+        self.historical = tk.BooleanVar(value=False)
+    
+    def toggle_historical(self):
+        """Включение чтения архивов в таблицах и статистике"""
+        archives = self.db_manager.archives
+        archives.enabled = self.historical.get()
+        if archives.enabled and not archives.archives:
+            messagebox.showinfo("Архив", "Архивных файлов нет, отображаются текущие данные")
+        table_view = getattr(self, "table_view", None)
+        if table_view is not None and table_view.tree.winfo_exists():
+            table_view.reload()
+    
+    def create_status_bar(self):
+        """Строка состояния с индикатором фоновых запросов"""
+        self.status_bar = tk.Frame(self.root, bd=1, relief="sunken")
+        self.status_bar.pack(side="bottom", fill="x")
+        
+        self.status_label = tk.Label(self.status_bar, text="Готово", anchor="w")
+        self.status_label.pack(side="left", padx=5)
+        
+        self.cancel_button = tk.Button(self.status_bar, text="Отмена", state="disabled",
+                                       command=self.cancel_background_tasks)
+        self.cancel_button.pack(side="right", padx=5)
+        
+        self.progress = ttk.Progressbar(self.status_bar, mode="indeterminate", length=150)
+        self.progress.pack(side="right", padx=5)
+    
+    def set_busy(self, busy):
+        """Отображение индикатора загрузки"""
+        if busy:
+            self.status_label.config(text="Загрузка...")
+            self.cancel_button.config(state="normal")
+            self.progress.start(10)
+        else:
+            self.status_label.config(text="Готово")
+            self.cancel_button.config(state="disabled")
+            self.progress.stop()
+    
+    def run_in_background(self, func, on_success=None, on_error=None, write=False, on_cancel=None):
+        """Выполнение func(connection) в фоновом потоке с возвратом результата в поток Tk.
+
+        При отмене вызывается on_cancel(), а без него - on_error с CancelledError.
+        """
+        if self.db_manager.archives.enabled:
+            # В режиме истории архивы подключаются к соединению перед запросом
+            query, archives = func, self.db_manager.archives
+            
+            def func(connection):
+                archives.attach(connection)
+                return query(connection)
+        if self.dispatcher is None or self.dispatcher.executor is not self.db_manager.executor:
+            self.dispatcher = TkResultDispatcher(self.root, self.db_manager.executor,
+                                                 on_busy_changed=self.set_busy,
+                                                 on_error=self.show_background_error)
+        return self.dispatcher.call(func, on_success, on_error, write=write, on_cancel=on_cancel)
+    
+    def cancel_background_tasks(self):
+        """Отмена выполняющихся запросов"""
+        if self.dispatcher:
+            self.dispatcher.cancel_all()
+    
+    def show_background_error(self, error):
+        messagebox.showerror("Ошибка", f"Ошибка при выполнении запроса: {str(error)}")
     
     def show_connection_screen(self):
         """Отображение экрана подключения к БД"""
@@ -306,10 +395,19 @@ class MainApplication:
         self.tables_menu.add_command(label="Инспекции", command=lambda: self.show_table("inspections"))
         self.tables_menu.add_command(label="Дефекты", command=lambda: self.show_table("defects"))
         self.tables_menu.add_command(label="Изображения дефектов", command=lambda: self.show_table("defect_images"))
+        self.tables_menu.add_separator()
+        self.tables_menu.add_checkbutton(label="Включая архив", variable=self.historical,
+                                         command=self.toggle_historical)
+        self.tables_menu.add_command(label="Экспорт данных...", command=self.show_export)
         
         if self.current_user['role'] == 'admin':
             self.admin_menu.add_command(label="Пользователи", command=lambda: self.show_table("users"))
             self.admin_menu.add_command(label="Статистика", command=self.show_statistics)
+            self.admin_menu.add_command(label="Отчет о качестве", command=self.show_quality_report)
+            self.admin_menu.add_command(label="Карта дефектов", command=self.show_heatmap)
+            self.admin_menu.add_command(label="Производительность запросов",
+                                        command=self.show_query_metrics)
+            self.admin_menu.add_command(label="Архивирование", command=self.show_archive)
     
     def show_main_panel(self):
         """Отображение главной панели"""
@@ -321,32 +419,36 @@ class MainApplication:
         stats_frame = tk.LabelFrame(self.main_frame, text="Статистика", padx=20, pady=20)
         stats_frame.pack(pady=20, padx=20, fill="both", expand=True)
         
-        stats = self.get_statistics()
+        loading_label = tk.Label(stats_frame, text="Загрузка...", font=("Arial", 12))
+        loading_label.grid(row=0, column=0, sticky="w", pady=5)
         
-        row = 0
-        for key, value in stats.items():
-            tk.Label(stats_frame, text=f"{key}: {value}", font=("Arial", 12)).grid(
-                row=row, column=0, sticky="w", pady=5)
-            row += 1
+        def show_stats(stats):
+            if not stats_frame.winfo_exists():
+                return
+            loading_label.destroy()
+            row = 0
+            for key, value in stats.items():
+                tk.Label(stats_frame, text=f"{key}: {value}", font=("Arial", 12)).grid(
+                    row=row, column=0, sticky="w", pady=5)
+                row += 1
+        
+        self.run_in_background(self.get_statistics, show_stats)
     
-    def get_statistics(self):
-        """Получение статистики из базы данных"""
+    def get_statistics(self, connection):
+        """Получение статистики из базы данных (выполняется в фоновом потоке)"""
         stats = {}
         
         try:
-            result = self.db_manager.fetch_one("SELECT COUNT(*) FROM smartphones")
-            stats["Всего смартфонов"] = result[0]
-            
-            result = self.db_manager.fetch_one("SELECT COUNT(*) FROM inspections")
-            stats["Всего проверок"] = result[0]
-            
-            result = self.db_manager.fetch_one("SELECT COUNT(*) FROM defects")
-            stats["Найдено дефектов"] = result[0]
-            
-            result = self.db_manager.fetch_one(
-                "SELECT COUNT(*) FROM inspections WHERE DATE(inspection_date) = DATE('now')"
-            )
-            stats["Проверок сегодня"] = result[0]
+            totals = self.db_manager.statistics.totals(connection)
+            stats["Всего смартфонов"] = totals["smartphones"]
+            stats["Всего проверок"] = totals["inspections"]
+            stats["Найдено дефектов"] = totals["defects"]
+            stats["Проверок сегодня"] = self.db_manager.statistics.inspections_on(connection)
+            if self.db_manager.archives.enabled:
+                archived = self.db_manager.archives.archived_totals(connection)
+                stats["Всего проверок"] += archived["inspections"]
+                stats["Найдено дефектов"] += archived["defects"]
+                stats["В том числе в архиве (проверок)"] = archived["inspections"]
             
         except Exception as e:
             print(f"Ошибка при получении статистики: {e}")
@@ -369,56 +471,109 @@ class MainApplication:
                  bg="#2196F3", fg="white").pack(side="left", padx=5)
         tk.Button(toolbar, text="Удалить", command=lambda: self.delete_record(table_name),
                  bg="#f44336", fg="white").pack(side="left", padx=5)
-        tk.Button(toolbar, text="Обновить", command=lambda: self.refresh_table(table_name)).pack(side="left", padx=5)
+        tk.Button(toolbar, text="Групповые операции",
+                  command=lambda: self.batch_operations(table_name)).pack(side="left", padx=5)
+        tk.Button(toolbar, text="Обновить", command=lambda: self.load_table_data(table_name)).pack(side="left", padx=5)
+        
+        if FullTextSearch.supports(table_name):
+            search_entry = tk.Entry(toolbar, width=30)
+            tk.Button(toolbar, text="Сбросить",
+                     command=lambda: (search_entry.delete(0, tk.END), self.table_view.search(""))
+                     ).pack(side="right", padx=5)
+            tk.Button(toolbar, text="Найти",
+                     command=lambda: self.table_view.search(search_entry.get())
+                     ).pack(side="right", padx=5)
+            search_entry.pack(side="right", padx=5)
+            search_entry.bind("<Return>", lambda event: self.table_view.search(search_entry.get()))
+            tk.Label(toolbar, text="Поиск:").pack(side="right")
+        
+        filter_bar = tk.Frame(self.main_frame)
+        filter_bar.pack(fill="x", padx=10)
+        
+        tk.Label(filter_bar, text="Фильтр:").pack(side="left")
+        filter_column = ttk.Combobox(filter_bar, state="readonly", width=20,
+                                     values=self.db_manager.schema.table(table_name).column_names)
+        filter_column.pack(side="left", padx=5)
+        filter_entry = tk.Entry(filter_bar, width=25)
+        filter_entry.pack(side="left", padx=5)
+        filters_label = tk.Label(filter_bar, text="", fg="gray")
+        
+        def apply_filter(event=None):
+            if filter_column.get():
+                self.apply_filter(filter_column.get(), filter_entry.get(), filters_label)
+        
+        def show_column_filter(event):
+            filter_entry.delete(0, tk.END)
+            filter_entry.insert(0, self.table_view.filters.get(filter_column.get(), ""))
+        
+        filter_column.bind("<<ComboboxSelected>>", show_column_filter)
+        filter_entry.bind("<Return>", apply_filter)
+        tk.Button(filter_bar, text="Применить", command=apply_filter).pack(side="left", padx=5)
+        tk.Button(filter_bar, text="Сбросить фильтры",
+                 command=lambda: (filter_entry.delete(0, tk.END),
+                                  self.apply_filter(None, "", filters_label))).pack(side="left", padx=5)
+        filters_label.pack(side="left", padx=10)
         
         table_frame = tk.Frame(self.main_frame)
         table_frame.pack(fill="both", expand=True, padx=10, pady=10)
         
-        self.tree = ttk.Treeview(table_frame)
+        self.table_view = PagedTreeview(table_frame, self.db_manager, table_name,
+                                        runner=self.run_in_background)
+        self.tree = self.table_view.tree
+        self.table_view.grid()
+        self.table_view.watch(Config.CHANGE_POLL_MS)
         
-        vsb = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree.yview)
-        hsb = ttk.Scrollbar(table_frame, orient="horizontal", command=self.tree.xview)
-        self.tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
+        self.preview = None
+        if ImagePreviewPane.supports(table_name):
+            self.preview = ImagePreviewPane(table_frame, table_name, self.image_cache,
+                                            self.run_in_background)
+            self.preview.frame.grid(row=0, column=2, rowspan=2, sticky="ns", padx=(10, 0))
+            self.tree.bind("<<TreeviewSelect>>", lambda event: self.show_preview())
         
-        self.tree.grid(row=0, column=0, sticky="nsew")
-        vsb.grid(row=0, column=1, sticky="ns")
-        hsb.grid(row=1, column=0, sticky="ew")
+        self.load_table_data(table_name)
+    
+    def apply_filter(self, column, text, filters_label):
+        """Применение фильтра колонки (column=None - сброс всех фильтров)"""
+        try:
+            if column is None:
+                self.table_view.clear_filters()
+            else:
+                self.table_view.set_filter(column, text)
+        except ValueError as e:
+            messagebox.showwarning("Фильтр", str(e))
+            return
+        filters_label.config(text="; ".join(f"{name}: {value}" for name, value
+                                            in self.table_view.filters.items()))
+    
+    def show_preview(self):
+        """Отображение изображения выбранной записи"""
+        selection = self.tree.selection()
+        if not self.preview or not selection:
+            return
         
-        table_frame.grid_rowconfigure(0, weight=1)
-        table_frame.grid_columnconfigure(0, weight=1)
+        item = selection[0]
+        neighbours = []
+        previous_item = next_item = item
+        for _ in range(ImagePreviewPane.PREFETCH_NEIGHBOURS):
+            next_item = self.tree.next(next_item) if next_item else ""
+            previous_item = self.tree.prev(previous_item) if previous_item else ""
+            neighbours.extend(int(i) for i in (next_item, previous_item) if i)
         
-        self.load_table_data(table_name)
+        self.preview.show_record(int(item), neighbours)
     
     def load_table_data(self, table_name):
-        """Загрузка данных таблицы в Treeview"""
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
+        """Загрузка данных таблицы в Treeview постранично"""
         try:
-            cursor = self.db_manager.connection.cursor()
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            columns = cursor.fetchall()
-            
-            self.tree["columns"] = [col[1] for col in columns]
-            self.tree["show"] = "headings"
-            
-            for col in columns:
-                self.tree.heading(col[1], text=col[1])
-                self.tree.column(col[1], width=100)
-            
-            cursor.execute(f"SELECT * FROM {table_name}")
-            rows = cursor.fetchall()
-            
-            for row in rows:
-                self.tree.insert("", "end", values=row)
-                
+            self.table_view.reload()
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка при загрузке данных: {str(e)}")
     
     def add_record(self, table_name):
         """Добавление новой записи"""
-        dialog = RecordDialog(self.root, self.db_manager, table_name, "add", None)
+        dialog = RecordDialog(self.root, self.db_manager, table_name, "add", None,
+                              runner=self.run_in_background)
         if dialog.result:
+            self.on_record_saved(table_name, dialog)
             self.refresh_table(table_name)
     
     def edit_record(self, table_name):
@@ -427,37 +582,234 @@ class MainApplication:
         if not selected_item:
             messagebox.showwarning("Внимание", "Выберите запись для редактирования")
             return
+        if len(selected_item) > 1:
+            self.batch_operations(table_name)
+            return
         
         item = self.tree.item(selected_item[0])
         record_id = item['values'][0]  
         
-        dialog = RecordDialog(self.root, self.db_manager, table_name, "edit", record_id)
+        dialog = RecordDialog(self.root, self.db_manager, table_name, "edit", record_id,
+                              runner=self.run_in_background)
         if dialog.result:
+            self.on_record_saved(table_name, dialog)
             self.refresh_table(table_name)
     
+    def on_record_saved(self, table_name, dialog):
+        """Дополнительная обработка сохраненной записи"""
+        image_path = dialog.data.get("image_path")
+        if (Config.IMAGE_STORE_UPLOADS and table_name in ("inspections", "defect_images")
+                and image_path and not image_store.is_reference(image_path)):
+            self.store_image(table_name, dialog.record_id, image_path)
+        if table_name == "defect_images" and dialog.data.get("image_path"):
+            self.thumbnails.generate_async(dialog.record_id, dialog.data["image_path"])
+            self.check_similar_images(dialog.record_id, dialog.data["image_path"])
+    
+    def store_image(self, table_name, record_id, image_path):
+        """Перенос изображения сохраненной записи в хранилище и замена пути ссылкой"""
+        key = self.db_manager.schema.table(table_name).key_column
+        
+        def store(connection):
+            reference = self.db_manager.images.put_file(image_path)
+            connection.execute(f"UPDATE {table_name} SET image_path = ? WHERE {key} = ? AND image_path = ?",
+                               (reference, record_id, image_path))
+        
+        def on_error(error):
+            print(f"Ошибка при записи изображения {image_path} в хранилище: {error}")
+        
+        self.run_in_background(store, on_error=on_error, write=True)
+    
+    @property
+    def fingerprints(self):
+        """Хеши изображений дефектов; NumPy загружается при первом обращении"""
+        if self._fingerprints is None:
+            from image_fingerprints import ImageFingerprints
+            self._fingerprints = ImageFingerprints(self.db_manager)
+        return self._fingerprints
+    
+    def check_similar_images(self, image_id, image_path):
+        """Предупреждение, если почти такое же изображение уже загружено"""
+        def show(similar):
+            if not similar:
+                return
+            listed = "\n".join(f"#{other_id}: {path} (отличие pHash {distance} бит)"
+                                for other_id, path, distance, _ in similar[:10])
+            messagebox.showwarning("Похожие изображения",
+                                   f"Изображение почти совпадает с уже загруженными "
+                                   f"({len(similar)}):\n{listed}")
+        
+        def on_error(error):
+            print(f"Ошибка при проверке изображения {image_path}: {error}")
+        
+        self.run_in_background(
+            lambda connection: self.fingerprints.register(connection, image_id, image_path),
+            show, on_error=on_error, write=True)
+    
+    def selected_keys(self):
+        """Первичные ключи выделенных строк (идентификаторы элементов Treeview)"""
+        return [int(item) for item in self.tree.selection()]
+    
     def delete_record(self, table_name):
-        """Удаление записи"""
-        selected_item = self.tree.selection()
-        if not selected_item:
-            messagebox.showwarning("Внимание", "Выберите запись для удаления")
+        """Удаление выделенных записей вместе с зависимыми одной транзакцией"""
+        keys = self.selected_keys()
+        if not keys:
+            messagebox.showwarning("Внимание", "Выберите записи для удаления")
             return
+        self.batch_delete(table_name, keys)
+    
+    def batch_delete(self, table_name, keys):
+        """Подтверждение с числом каскадно удаляемых строк и пакетное удаление"""
+        operations = BatchOperations(self.db_manager)
+        
+        def confirm(dependents):
+            text = f"Удалить записей: {len(keys)}?"
+            if dependents:
+                text += "\nВместе с ними будут удалены:\n" + "\n".join(
+                    f"  {table}: {count}" for table, count in dependents.items())
+            if messagebox.askyesno("Подтверждение", text):
+                self.run_batch("Удаление записей", table_name,
+                               lambda connection, report: operations.delete(
+                                   connection, table_name, keys, report))
+        
+        self.run_in_background(
+            lambda connection: operations.dependents(connection, table_name, keys), confirm)
+    
+    def batch_operations(self, table_name):
+        """Изменение колонки или удаление выделенных либо всех отфильтрованных строк"""
+        metadata = self.db_manager.schema.table(table_name)
+        table_view = self.table_view
+        selected = self.selected_keys()
+        operations = BatchOperations(self.db_manager)
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Групповые операции")
+        dialog.resizable(False, False)
+        dialog.transient(self.root)
+        dialog.grab_set()
+        frame = tk.Frame(dialog, padx=20, pady=20)
+        frame.pack(fill="both", expand=True)
+        
+        scope = tk.StringVar(value="selected" if selected else "filter")
+        tk.Radiobutton(frame, text=f"Выделенные строки ({len(selected)})", variable=scope,
+                       value="selected", state="normal" if selected else "disabled").grid(
+            row=0, column=0, columnspan=2, sticky="w")
+        filter_text = "Все строки по текущему фильтру" if table_view.filters else "Все строки таблицы"
+        tk.Radiobutton(frame, text=filter_text, variable=scope, value="filter").grid(
+            row=1, column=0, columnspan=2, sticky="w")
+        
+        columns = [column.name for column in metadata.columns
+                   if not column.primary_key and not column.auto_timestamp]
+        tk.Label(frame, text="Колонка:").grid(row=2, column=0, sticky="w", pady=(15, 5))
+        column_combo = ttk.Combobox(frame, values=columns, state="readonly", width=28)
+        column_combo.grid(row=2, column=1, pady=(15, 5), padx=10)
+        tk.Label(frame, text="Новое значение:").grid(row=3, column=0, sticky="w", pady=5)
+        value_combo = ttk.Combobox(frame, width=28)
+        value_combo.grid(row=3, column=1, pady=5, padx=10)
+        
+        def on_column(event=None):
+            value_combo.config(values=metadata.choices(column_combo.get()) or [])
+            value_combo.set("")
         
-        if messagebox.askyesno("Подтверждение", "Вы уверены, что хотите удалить выбранную запись?"):
-            item = self.tree.item(selected_item[0])
-            record_id = item['values'][0]
+        column_combo.bind("<<ComboboxSelected>>", on_column)
+        
+        def with_keys(action):
+            if scope.get() == "selected":
+                action(selected)
+                return
             
-            try:
-                cursor = self.db_manager.connection.cursor()
-                cursor.execute(f"DELETE FROM {table_name} WHERE rowid=?", (record_id,))
-                self.db_manager.connection.commit()
-                messagebox.showinfo("Успех", "Запись успешно удалена")
-                self.refresh_table(table_name)
-            except Exception as e:
-                messagebox.showerror("Ошибка", f"Ошибка при удалении: {str(e)}")
+            def check(keys):
+                if keys:
+                    action(keys)
+                else:
+                    messagebox.showinfo("Групповые операции", "Нет строк для обработки")
+            
+            self.run_in_background(table_view.fetch_keys, check)
+        
+        def update():
+            column, value = column_combo.get(), value_combo.get()
+            if not column:
+                messagebox.showwarning("Внимание", "Выберите колонку", parent=dialog)
+                return
+            if 'password' in column.lower() and value:
+                value = self.db_manager.hash_password(value)
+            values = {column: value if value != "" else None}
+            shown = "NULL" if values[column] is None else (
+                "***" if 'password' in column.lower() else value)
+            dialog.destroy()
+            
+            def confirm(keys):
+                if messagebox.askyesno("Подтверждение",
+                                       f"Установить {column} = {shown} в {len(keys)} строках?"):
+                    self.run_batch("Групповое изменение", table_name,
+                                   lambda connection, report: operations.update(
+                                       connection, table_name, keys, values, report))
+            
+            with_keys(confirm)
+        
+        def delete():
+            dialog.destroy()
+            with_keys(lambda keys: self.batch_delete(table_name, keys))
+        
+        button_frame = tk.Frame(frame)
+        button_frame.grid(row=4, column=0, columnspan=2, pady=(20, 0))
+        tk.Button(button_frame, text="Изменить", command=update,
+                  bg="#2196F3", fg="white", width=12).pack(side="left", padx=5)
+        tk.Button(button_frame, text="Удалить", command=delete,
+                  bg="#f44336", fg="white", width=12).pack(side="left", padx=5)
+        tk.Button(button_frame, text="Отмена", command=dialog.destroy, width=12).pack(side="left", padx=5)
+    
+    def run_batch(self, title, table_name, operation):
+        """Выполнение operation(connection, report) на писателе с окном хода выполнения"""
+        report = BatchReport()
+        window = tk.Toplevel(self.root)
+        window.title(title)
+        window.resizable(False, False)
+        window.transient(self.root)
+        label = tk.Label(window, text="Подготовка...")
+        label.pack(padx=20, pady=(15, 5))
+        bar = ttk.Progressbar(window, mode="determinate", length=300)
+        bar.pack(padx=20, pady=5)
+        # Отмена прерывает запрос, и вся транзакция откатывается
+        tk.Button(window, text="Отмена", command=self.cancel_background_tasks).pack(pady=(5, 15))
+        
+        def show_progress():
+            if window.winfo_exists() and report.finished is None:
+                if report.total:
+                    bar.config(maximum=report.total, value=report.done)
+                    label.config(text=f"Обработано: {report.done:,} из {report.total:,}")
+                self.root.after(100, show_progress)
+        
+        def on_done(result):
+            if window.winfo_exists():
+                window.destroy()
+            text = f"Изменено строк: {result.changed} за {result.elapsed:.1f} с"
+            for table, count in result.cascaded.items():
+                text += f"\nУдалено каскадом ({table}): {count}"
+            messagebox.showinfo(title, text)
+            self.refresh_table(table_name)
+        
+        def on_error(e):
+            report.finished = report.finished or time.perf_counter()
+            if window.winfo_exists():
+                window.destroy()
+            messagebox.showerror("Ошибка", f"{title}: изменения отменены ({str(e)})")
+        
+        def on_cancel():
+            report.finished = report.finished or time.perf_counter()
+            if window.winfo_exists():
+                window.destroy()
+            messagebox.showinfo(title, "Операция прервана, изменения отменены")
+        
+        self.run_in_background(lambda connection: operation(connection, report),
+                               on_done, on_error, write=True, on_cancel=on_cancel)
+        show_progress()
     
     def refresh_table(self, table_name):
-        """Обновление таблицы"""
-        self.load_table_data(table_name)
+        """Обновление таблицы: в окне меняются только измененные строки"""
+        try:
+            self.table_view.refresh_changes()
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Ошибка при обновлении данных: {str(e)}")
     
     def show_statistics(self):
         """Отображение статистики"""
@@ -470,57 +822,505 @@ class MainApplication:
         stats_frame = tk.Frame(self.main_frame)
         stats_frame.pack(pady=20, padx=20, fill="both", expand=True)
         
-        stats = self.get_detailed_statistics()
+        loading_label = tk.Label(stats_frame, text="Загрузка...")
+        loading_label.grid(row=0, column=0, sticky="w", pady=10)
         
-        row = 0
-        for category, data in stats.items():
-            tk.Label(stats_frame, text=category, font=("Arial", 12, "bold")).grid(
-                row=row, column=0, sticky="w", pady=10)
-            row += 1
-            
-            for key, value in data.items():
-                tk.Label(stats_frame, text=f"  {key}: {value}").grid(
-                    row=row, column=0, sticky="w", padx=20)
+        def show_stats(stats):
+            if not stats_frame.winfo_exists():
+                return
+            loading_label.destroy()
+            row = 0
+            for category, data in stats.items():
+                tk.Label(stats_frame, text=category, font=("Arial", 12, "bold")).grid(
+                    row=row, column=0, sticky="w", pady=10)
                 row += 1
+                
+                for key, value in data.items():
+                    tk.Label(stats_frame, text=f"  {key}: {value}").grid(
+                        row=row, column=0, sticky="w", padx=20)
+                    row += 1
+        
+        self.run_in_background(self.get_detailed_statistics, show_stats)
     
-    def get_detailed_statistics(self):
-        """Получение детальной статистики"""
+    def get_detailed_statistics(self, connection):
+        """Получение детальной статистики (выполняется в фоновом потоке)"""
         stats = {}
         
         try:
-            defect_stats = {}
-            result = self.db_manager.fetch_all(
-                "SELECT defect_type, COUNT(*) FROM defects GROUP BY defect_type"
-            )
-            for row in result:
-                defect_stats[row[0]] = row[1]
-            stats["Статистика по типам дефектов"] = defect_stats
-            
-            manufacturer_stats = {}
-            result = self.db_manager.fetch_all(
-                "SELECT manufacturer, COUNT(*) FROM smartphones GROUP BY manufacturer"
-            )
-            for row in result:
-                manufacturer_stats[row[0]] = row[1]
-            stats["Статистика по производителям"] = manufacturer_stats
+            stats["Статистика по типам дефектов"] = \
+                self.db_manager.statistics.defects_by_type(connection)
+            if self.db_manager.archives.enabled:
+                by_type = stats["Статистика по типам дефектов"]
+                for defect_type, count in self.db_manager.archives.defects_by_type(connection).items():
+                    by_type[defect_type] = by_type.get(defect_type, 0) + count
+            stats["Статистика по производителям"] = \
+                self.db_manager.statistics.smartphones_by_manufacturer(connection)
             
         except Exception as e:
             print(f"Ошибка при получении статистики: {e}")
         
         return stats
     
+    def show_quality_report(self):
+        """Отчет о качестве за период: таблица показателей и график по дням"""
+        self.clear_main_frame()
+        
+        tk.Label(self.main_frame, text="Отчет о качестве", 
+                font=("Arial", 16, "bold")).pack(pady=20)
+        
+        controls = tk.Frame(self.main_frame)
+        controls.pack(pady=5)
+        
+        since, until = QualityReports.period(days=Config.REPORT_DAYS)
+        tk.Label(controls, text="Период с (ГГГГ-ММ-ДД):").pack(side="left")
+        since_entry = tk.Entry(controls, width=12)
+        since_entry.insert(0, since)
+        since_entry.pack(side="left", padx=5)
+        tk.Label(controls, text="по:").pack(side="left")
+        until_entry = tk.Entry(controls, width=12)
+        until_entry.insert(0, until)
+        until_entry.pack(side="left", padx=5)
+        
+        groups = [("model", "По моделям"), ("manufacturer", "По производителям"),
+                  ("day", "По дням"), ("severity", "По типам и серьезности")]
+        tk.Label(controls, text="Группировка:").pack(side="left")
+        group_combo = ttk.Combobox(controls, values=[label for _, label in groups],
+                                   state="readonly", width=22)
+        group_combo.current(0)
+        group_combo.pack(side="left", padx=5)
+        
+        summary_label = tk.Label(self.main_frame, text="", justify="left")
+        summary_label.pack(pady=5)
+        
+        tree_frame = tk.Frame(self.main_frame)
+        tree_frame.pack(fill="both", expand=True, padx=20)
+        tree = ttk.Treeview(tree_frame, show="headings", height=12)
+        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        
+        chart = tk.Canvas(self.main_frame, height=220, bg="white", highlightthickness=0)
+        chart.pack(fill="x", padx=20, pady=10)
+        trend = []
+        chart.bind("<Configure>", lambda event: self.draw_trend(chart, trend))
+        
+        metrics = ["Проверок", "С дефектами", "Дефектов", "На проверку", "Pass", "Fail", "Conditional"]
+        
+        def metric_values(row):
+            return [row["inspections"], f"{row['defect_rate']:.1%}", row["defects"],
+                    f"{row['defects_per_inspection']:.2f}", f"{row['passed_rate']:.1%}",
+                    f"{row['failed_rate']:.1%}", f"{row['conditional_rate']:.1%}"]
+        
+        def fill_tree(columns, rows):
+            tree.delete(*tree.get_children())
+            tree.configure(columns=[str(index) for index in range(len(columns))])
+            for index, title in enumerate(columns):
+                tree.heading(str(index), text=title)
+                tree.column(str(index), width=160 if index == 0 else 100,
+                            anchor="w" if index == 0 else "e")
+            for values in rows:
+                tree.insert("", "end", values=["—" if value is None else value for value in values])
+        
+        def build():
+            try:
+                period = QualityReports.period(since_entry.get().strip() or None,
+                                               until_entry.get().strip() or None)
+            except ValueError as e:
+                messagebox.showerror("Ошибка", f"Неверный период: {e}")
+                return
+            group = groups[group_combo.current()][0]
+            
+            def load(connection):
+                # Сводные таблицы обновляются перед отчетом: пересчитываются
+                # только корзины, измененные после прошлого обновления
+                archives = self.db_manager.archives.attach_files(connection)
+                self.db_manager.rollups.refresh(connection, archives)
+                reports = self.db_manager.reports
+                if group == "severity":
+                    rows = reports.severities(connection, *period)
+                else:
+                    rows = reports.breakdown(connection, *period, group)
+                return reports.summary(connection, *period), rows, reports.trend(connection, *period)
+            
+            def show(result):
+                if not tree.winfo_exists():
+                    return
+                total, rows, days = result
+                summary_label.config(
+                    text=f"Проверок: {total['inspections']}, с дефектами: {total['defect_rate']:.1%}, "
+                         f"дефектов: {total['defects']} ({total['defects_per_inspection']:.2f} на проверку)\n"
+                         f"Результаты: pass {total['passed_rate']:.1%}, fail {total['failed_rate']:.1%}, "
+                         f"conditional {total['conditional_rate']:.1%}")
+                if group == "severity":
+                    severities = sorted({severity for counts in rows.values() for severity in counts},
+                                        key=lambda severity: severity or 0)
+                    fill_tree(["Тип дефекта"] + [f"Серьезность {severity or '—'}" for severity in severities]
+                              + ["Всего"],
+                              [[defect_type] + [counts.get(severity, 0) for severity in severities]
+                               + [sum(counts.values())] for defect_type, counts in rows.items()])
+                else:
+                    labels = {"model": ["Производитель", "Модель"],
+                              "manufacturer": ["Производитель"], "day": ["День"]}[group]
+                    fill_tree(labels + metrics,
+                              [list(key) + metric_values(row) for key, row in rows])
+                trend[:] = days
+                self.draw_trend(chart, trend)
+            
+            summary_label.config(text="Обновление сводных таблиц...")
+            self.run_in_background(load, show, write=True)
+        
+        tk.Button(controls, text="Построить", command=build).pack(side="left", padx=5)
+        build()
+    
+    def draw_trend(self, canvas, trend):
+        """График по дням: столбцы - число проверок, линии - доли с дефектами и fail"""
+        canvas.delete("all")
+        width, height = canvas.winfo_width(), canvas.winfo_height()
+        left, right, top, bottom = 50, 50, 20, 30
+        if not trend or width <= left + right:
+            return
+        plot_width, plot_height = width - left - right, height - top - bottom
+        peak = max(row["inspections"] for _, row in trend) or 1
+        peak_rate = max(max(row["defect_rate"], row["failed_rate"]) for _, row in trend) or 1.0
+        step = plot_width / len(trend)
+        
+        canvas.create_line(left, top + plot_height, left + plot_width, top + plot_height)
+        canvas.create_text(left - 5, top, text=str(peak), anchor="e")
+        canvas.create_text(left - 5, top + plot_height, text="0", anchor="e")
+        canvas.create_text(left + plot_width + 5, top, text=f"{peak_rate:.0%}", anchor="w")
+        canvas.create_text(left, top + plot_height + 5, text=trend[0][0], anchor="nw")
+        canvas.create_text(left + plot_width, top + plot_height + 5, text=trend[-1][0], anchor="ne")
+        
+        lines = {"defect_rate": [], "failed_rate": []}
+        for index, (_, row) in enumerate(trend):
+            x = left + index * step
+            bar_height = plot_height * row["inspections"] / peak
+            canvas.create_rectangle(x + step * 0.1, top + plot_height - bar_height,
+                                    x + step * 0.9, top + plot_height,
+                                    fill="#BBDEFB", outline="")
+            for name, points in lines.items():
+                points.extend([x + step / 2, top + plot_height * (1 - row[name] / peak_rate)])
+        for (name, points), color in zip(lines.items(), [Config.WARNING_COLOR, Config.ERROR_COLOR]):
+            if len(points) >= 4:
+                canvas.create_line(*points, fill=color, width=2)
+            else:
+                canvas.create_oval(points[0] - 3, points[1] - 3, points[0] + 3, points[1] + 3, fill=color)
+        canvas.create_text(left + plot_width / 2, 5, anchor="n",
+                           text="Проверок в день (столбцы), доля с дефектами (оранжевая), доля fail (красная)")
+    
+    def show_heatmap(self):
+        """Тепловая карта расположения дефектов по модели и типу"""
+        self.clear_main_frame()
+        
+        tk.Label(self.main_frame, text="Карта дефектов", 
+                font=("Arial", 16, "bold")).pack(pady=20)
+        
+        controls = tk.Frame(self.main_frame)
+        controls.pack(pady=5)
+        
+        tk.Label(controls, text="Модель:").pack(side="left")
+        model_combo = ttk.Combobox(controls, values=["Все модели"], state="readonly", width=30)
+        model_combo.current(0)
+        model_combo.pack(side="left", padx=5)
+        
+        tk.Label(controls, text="Тип дефекта:").pack(side="left")
+        type_combo = ttk.Combobox(controls, state="readonly", width=15,
+                                  values=["Все типы"] + self.db_manager.schema.table("defects").choices("defect_type"))
+        type_combo.current(0)
+        type_combo.pack(side="left", padx=5)
+        
+        image_label = tk.Label(self.main_frame)
+        image_label.pack(pady=10)
+        info_label = tk.Label(self.main_frame, text="")
+        info_label.pack()
+        
+        models = []
+        
+        def fill_models(rows):
+            if not model_combo.winfo_exists():
+                return
+            models.extend(rows)
+            model_combo.config(values=["Все модели"] + [f"{manufacturer} {model_name}" 
+                                                         for _, manufacturer, model_name in rows])
+        
+        self.run_in_background(
+            lambda connection: connection.execute(
+                "SELECT smartphone_id, manufacturer, model_name FROM smartphones "
+                "ORDER BY manufacturer, model_name").fetchall(),
+            fill_models)
+        
+        def build():
+            index = model_combo.current()
+            smartphone_id = models[index - 1][0] if index > 0 else None
+            defect_type = type_combo.get() if type_combo.current() > 0 else None
+            
+            def load(connection):
+                histogram, extent = self.db_manager.heatmaps.heatmap(
+                    connection, smartphone_id, defect_type)
+                return DefectHeatmaps.render(histogram), int(histogram.sum()), extent
+            
+            def show(result):
+                if not image_label.winfo_exists():
+                    return
+                image, count, extent = result
+                from PIL import ImageTk
+                image_label.photo = ImageTk.PhotoImage(image)
+                image_label.config(image=image_label.photo)
+                info_label.config(text=f"Дефектов на карте: {count}, область: {extent}x{extent} пикс.")
+            
+            info_label.config(text="Загрузка...")
+            self.run_in_background(load, show)
+        
+        tk.Button(controls, text="Построить", command=build).pack(side="left", padx=5)
+        build()
+    
+    def show_export(self):
+        """Выгрузка таблицы или отчета в файл CSV, JSONL или Parquet"""
+        self.clear_main_frame()
+        
+        tk.Label(self.main_frame, text="Экспорт данных", 
+                font=("Arial", 16, "bold")).pack(pady=20)
+        
+        exporter = DataExporter(self.db_manager)
+        frame = tk.Frame(self.main_frame)
+        frame.pack(pady=10)
+        
+        tk.Label(frame, text="Таблица или отчет:").grid(row=0, column=0, sticky="w", pady=5)
+        source_combo = ttk.Combobox(frame, values=exporter.sources(), state="readonly", width=30)
+        source_combo.current(0)
+        source_combo.grid(row=0, column=1, sticky="w", pady=5, padx=5)
+        
+        tk.Label(frame, text="Формат:").grid(row=1, column=0, sticky="w", pady=5)
+        format_combo = ttk.Combobox(frame, values=DataExporter.FORMATS, state="readonly", width=10)
+        format_combo.current(0)
+        format_combo.grid(row=1, column=1, sticky="w", pady=5, padx=5)
+        compress = tk.BooleanVar(value=False)
+        tk.Checkbutton(frame, text="Сжать (gzip)", variable=compress).grid(
+            row=1, column=2, sticky="w", pady=5)
+        
+        tk.Label(frame, text="Период с (ГГГГ-ММ-ДД):").grid(row=2, column=0, sticky="w", pady=5)
+        since_entry = tk.Entry(frame, width=12)
+        since_entry.grid(row=2, column=1, sticky="w", pady=5, padx=5)
+        tk.Label(frame, text="по:").grid(row=3, column=0, sticky="w", pady=5)
+        until_entry = tk.Entry(frame, width=12)
+        until_entry.grid(row=3, column=1, sticky="w", pady=5, padx=5)
+        
+        progress_label = tk.Label(self.main_frame, text="")
+        progress_label.pack(pady=10)
+        
+        def start():
+            source, file_format = source_combo.get(), format_combo.get()
+            filename = filedialog.asksaveasfilename(
+                title="Файл выгрузки", initialfile=source,
+                defaultextension=DataExporter.default_extension(file_format, compress.get()),
+                filetypes=[(file_format.upper(), f"*.{file_format}*"), ("All files", "*.*")])
+            if not filename:
+                return
+            report = ExportReport()
+            
+            def export(connection):
+                return exporter.export(connection, source, filename, file_format, compress.get(),
+                                       since_entry.get().strip() or None,
+                                       until_entry.get().strip() or None, report=report)
+            
+            def show_progress():
+                if progress_label.winfo_exists() and report.finished is None:
+                    progress_label.config(text=f"Выгружено строк: {report.rows:,} "
+                                               f"({report.rows_per_second:,.0f} строк/с)")
+                    self.root.after(250, show_progress)
+            
+            def on_done(result):
+                text = (f"Выгружено строк: {result.rows:,} за {result.elapsed:.1f} с "
+                        f"({result.rows_per_second:,.0f} строк/с)")
+                if export_button.winfo_exists():
+                    export_button.config(state="normal")
+                    progress_label.config(text=text)
+                messagebox.showinfo("Экспорт", f"{text}\n{filename}")
+            
+            def on_error(e):
+                report.finished = report.finished or time.perf_counter()
+                if export_button.winfo_exists():
+                    export_button.config(state="normal")
+                    progress_label.config(text="")
+                messagebox.showerror("Ошибка", f"Ошибка при экспорте: {str(e)}")
+            
+            def on_cancel():
+                # Незавершенный файл удаляет DataExporter.export
+                report.finished = report.finished or time.perf_counter()
+                if export_button.winfo_exists():
+                    export_button.config(state="normal")
+                    progress_label.config(text="Экспорт отменен")
+            
+            export_button.config(state="disabled")
+            self.run_in_background(export, on_done, on_error, on_cancel=on_cancel)
+            show_progress()
+        
+        export_button = tk.Button(self.main_frame, text="Экспортировать", command=start,
+                                  bg="#4CAF50", fg="white", width=20)
+        export_button.pack(pady=10)
+    
+    def show_archive(self):
+        """Перенос закрытых проверок в архивные файлы и список архивов"""
+        self.clear_main_frame()
+        
+        tk.Label(self.main_frame, text="Архивирование проверок", 
+                font=("Arial", 16, "bold")).pack(pady=20)
+        
+        controls = tk.Frame(self.main_frame)
+        controls.pack(pady=5)
+        tk.Label(controls, text="Закрытые проверки старше (ГГГГ-ММ-ДД):").pack(side="left")
+        cutoff_entry = tk.Entry(controls, width=12)
+        cutoff_entry.insert(0, default_cutoff(Config.ARCHIVE_AFTER_DAYS))
+        cutoff_entry.pack(side="left", padx=5)
+        tk.Label(controls, text="Файл на период:").pack(side="left")
+        period_combo = ttk.Combobox(controls, values=sorted(ArchiveManager.PERIODS),
+                                    state="readonly", width=8)
+        period_combo.set(Config.ARCHIVE_PERIOD)
+        period_combo.pack(side="left", padx=5)
+        vacuum = tk.BooleanVar(value=True)
+        tk.Checkbutton(controls, text="Сжать базу (VACUUM)", variable=vacuum).pack(side="left")
+        
+        columns = ("period", "inspections", "defects", "defect_images", "first_date", "last_date", "path")
+        headings = ("Период", "Проверок", "Дефектов", "Изображений", "С", "По", "Файл")
+        tree = ttk.Treeview(self.main_frame, columns=columns, show="headings", height=10)
+        for column, heading in zip(columns, headings):
+            tree.heading(column, text=heading)
+            tree.column(column, width=300 if column == "path" else 110)
+        tree.pack(fill="both", expand=True, padx=10, pady=10)
+        info_label = tk.Label(self.main_frame, text="")
+        info_label.pack()
+        
+        def fill(rows):
+            if not tree.winfo_exists():
+                return
+            tree.delete(*tree.get_children())
+            for row in rows:
+                tree.insert("", "end", values=["" if value is None else value for value in row])
+        
+        def refresh():
+            self.run_in_background(
+                lambda connection: connection.execute(
+                    "SELECT period, inspections, defects, defect_images, first_date, last_date, path "
+                    "FROM archives ORDER BY period").fetchall(), fill)
+        
+        def start():
+            cutoff, period = cutoff_entry.get().strip(), period_combo.get()
+            if not messagebox.askyesno("Подтверждение",
+                                       f"Перенести закрытые проверки до {cutoff} в архив?"):
+                return
+            
+            def on_done(report):
+                if archive_button.winfo_exists():
+                    archive_button.config(state="normal")
+                    info_label.config(text=f"Перенесено проверок: {report.inspections} "
+                                           f"за {report.elapsed:.1f} с")
+                    refresh()
+            
+            def on_error(e):
+                if archive_button.winfo_exists():
+                    archive_button.config(state="normal")
+                    info_label.config(text="")
+                messagebox.showerror("Ошибка", f"Ошибка при архивировании: {str(e)}")
+            
+            archive_button.config(state="disabled")
+            info_label.config(text="Архивирование...")
+            # Перенос сам берет соединение-писатель на каждый пакет
+            self.run_in_background(
+                lambda connection: self.db_manager.archives.archive(
+                    cutoff, period, vacuum=vacuum.get()), on_done, on_error)
+        
+        archive_button = tk.Button(controls, text="Архивировать", command=start,
+                                   bg="#2196F3", fg="white")
+        archive_button.pack(side="left", padx=10)
+        refresh()
+    
+    def show_query_metrics(self):
+        """Время выполнения запросов по нормализованному тексту и медленные запросы"""
+        self.clear_main_frame()
+        
+        tk.Label(self.main_frame, text="Производительность запросов", 
+                font=("Arial", 16, "bold")).pack(pady=10)
+        
+        metrics = self.db_manager.metrics
+        if metrics is None:
+            tk.Label(self.main_frame, text="Замер запросов отключен (Config.QUERY_METRICS_ENABLED)").pack()
+            return
+        
+        toolbar = tk.Frame(self.main_frame)
+        toolbar.pack(fill="x", padx=10, pady=5)
+        summary_label = tk.Label(toolbar, text="", anchor="w")
+        
+        columns = ("count", "total", "mean", "p95", "max", "slow", "statement")
+        headings = ("Вызовов", "Всего, мс", "Среднее, мс", "p95, мс", "Макс., мс", "Медленных", "Запрос")
+        tree = ttk.Treeview(self.main_frame, columns=columns, show="headings", height=14)
+        for column, heading in zip(columns, headings):
+            tree.heading(column, text=heading)
+            tree.column(column, width=600 if column == "statement" else 80,
+                        anchor="w" if column == "statement" else "e")
+        tree.pack(fill="both", expand=True, padx=10)
+        
+        tk.Label(self.main_frame, text="План последнего медленного выполнения:",
+                anchor="w").pack(fill="x", padx=10, pady=(10, 0))
+        plan_text = tk.Text(self.main_frame, height=8, font=("Courier", 10))
+        plan_text.pack(fill="x", padx=10, pady=(0, 10))
+        
+        statements = []
+        
+        def refresh():
+            snapshot = metrics.snapshot()
+            statements[:] = snapshot["statements"]
+            tree.delete(*tree.get_children())
+            for index, item in enumerate(statements):
+                tree.insert("", "end", iid=str(index), values=(
+                    item["count"], f"{item['total_ms']:.1f}", f"{item['mean_ms']:.2f}",
+                    item["p95_ms"], f"{item['max_ms']:.1f}", item["slow"], item["statement"]))
+            summary_label.config(text=f"С {snapshot['since']}: запросов {len(statements)}, "
+                                      f"медленных (>{snapshot['slow_ms']:.0f} мс) "
+                                      f"{sum(item['slow'] for item in statements)}")
+        
+        def show_plan(event=None):
+            selection = tree.selection()
+            plan_text.delete("1.0", tk.END)
+            if selection:
+                item = statements[int(selection[0])]
+                plan_text.insert("1.0", "\n".join(item["last_plan"] or ["(медленных выполнений не было)"]))
+        
+        def export():
+            filename = filedialog.asksaveasfilename(
+                title="Экспорт метрик запросов", defaultextension=".json",
+                filetypes=[("JSON", "*.json"), ("All files", "*.*")])
+            if filename:
+                try:
+                    metrics.export(filename)
+                except OSError as e:
+                    messagebox.showerror("Ошибка", f"Ошибка при экспорте: {str(e)}")
+        
+        def reset():
+            metrics.reset()
+            refresh()
+        
+        tree.bind("<<TreeviewSelect>>", show_plan)
+        tk.Button(toolbar, text="Обновить", command=refresh).pack(side="left", padx=5)
+        tk.Button(toolbar, text="Сбросить", command=reset).pack(side="left", padx=5)
+        tk.Button(toolbar, text="Экспорт JSON", command=export).pack(side="left", padx=5)
+        summary_label.pack(side="left", padx=10)
+        refresh()
+    
     def clear_main_frame(self):
         """Очистка основного фрейма"""
         for widget in self.main_frame.winfo_children():
             widget.destroy()
 
 class RecordDialog:
-    def __init__(self, parent, db_manager, table_name, mode, record_id=None):
+    def __init__(self, parent, db_manager, table_name, mode, record_id=None, runner=None):
         self.parent = parent
         self.db_manager = db_manager
+        self.runner = runner
         self.table_name = table_name
         self.mode = mode
         self.record_id = record_id
+        self.data = {}
         self.result = False
         
         self.dialog = tk.Toplevel(parent)
@@ -555,32 +1355,30 @@ class RecordDialog:
         button_frame = tk.Frame(main_frame)
         button_frame.pack(fill="x", pady=20)
         
-        tk.Button(button_frame, text="Сохранить", command=self.save,
-                 bg="#4CAF50", fg="white", width=15).pack(side="left", padx=5)
+        self.save_button = tk.Button(button_frame, text="Сохранить", command=self.save,
+                                     bg="#4CAF50", fg="white", width=15)
+        self.save_button.pack(side="left", padx=5)
         tk.Button(button_frame, text="Отмена", command=self.dialog.destroy,
                  bg="#f44336", fg="white", width=15).pack(side="right", padx=5)
     
     def load_data(self):
         """Загрузка структуры таблицы и данных записи"""
         try:
-            cursor = self.db_manager.connection.cursor()
-            cursor.execute(f"PRAGMA table_info({self.table_name})")
-            columns = cursor.fetchall()
-            
-            skip_columns = ['created_at', 'uploaded_at', 'detected_at', 'inspection_date']
+            self.metadata = self.db_manager.schema.table(self.table_name)
             
             row = 0
-            for col in columns:
-                col_name = col[1]
-                col_type = col[2]
+            for col in self.metadata.columns:
+                col_name = col.name
                 
-                if col_name in skip_columns or (col[5] == 1 and self.mode == 'add'):
+                if col.auto_timestamp or (col.primary_key and self.mode == 'add'):
                     continue
                 
                 tk.Label(self.labels_frame, text=col_name).grid(
                     row=row, column=0, sticky="w", pady=5)
                 
-                if 'password' in col_name.lower():
+                if col.choices:
+                    entry = ttk.Combobox(self.labels_frame, values=col.choices, width=28)
+                elif 'password' in col_name.lower():
                     entry = tk.Entry(self.labels_frame, width=30, show="*")
                 else:
                     entry = tk.Entry(self.labels_frame, width=30)
@@ -588,39 +1386,13 @@ class RecordDialog:
                 entry.grid(row=row, column=1, pady=5, padx=10)
                 self.entries[col_name] = entry
                 
-                if col_name == 'role':
-                    entry.destroy()
-                    combo = ttk.Combobox(self.labels_frame, values=['admin', 'inspector', 'viewer'], width=28)
-                    combo.grid(row=row, column=1, pady=5, padx=10)
-                    self.entries[col_name] = combo
-                elif col_name == 'defect_type':
-                    entry.destroy()
-                    combo = ttk.Combobox(self.labels_frame, 
-                                        values=['scratch', 'chip', 'crack', 'discoloration', 'other'], 
-                                        width=28)
-                    combo.grid(row=row, column=1, pady=5, padx=10)
-                    self.entries[col_name] = combo
-                elif col_name in ['status', 'overall_result', 'severity']:
-                    entry.destroy()
-                    if col_name == 'severity':
-                        values = [1, 2, 3, 4, 5]
-                    elif col_name == 'status':
-                        values = ['pending', 'in_progress', 'completed', 'rejected']
-                    elif col_name == 'overall_result':
-                        values = ['pass', 'fail', 'conditional']
-                    combo = ttk.Combobox(self.labels_frame, values=values, width=28)
-                    combo.grid(row=row, column=1, pady=5, padx=10)
-                    self.entries[col_name] = combo
-                
                 row += 1
             
             if self.mode == 'edit' and self.record_id:
-                cursor.execute(f"SELECT * FROM {self.table_name} WHERE rowid=?", (self.record_id,))
-                record = cursor.fetchone()
+                record = self.db_manager.fetch_one(self.metadata.select_statement, (self.record_id,))
                 
                 if record:
-                    for i, col in enumerate(columns):
-                        col_name = col[1]
+                    for i, col_name in enumerate(self.metadata.column_names):
                         if col_name in self.entries:
                             widget = self.entries[col_name]
                             if isinstance(widget, ttk.Combobox):
@@ -636,6 +1408,7 @@ class RecordDialog:
         """Сохранение записи"""
         try:
             data = {}
+            references = {column for column, *_ in self.metadata.references}
             for col_name, widget in self.entries.items():
                 if isinstance(widget, ttk.Combobox):
                     value = widget.get()
@@ -644,40 +1417,85 @@ class RecordDialog:
                 
                 if 'password' in col_name.lower() and value:
                     value = self.db_manager.hash_password(value)
+                # Пустая ссылка - NULL: пустая строка нарушила бы внешний ключ
+                if value == "" and col_name in references:
+                    value = None
                 
                 data[col_name] = value
             
-            cursor = self.db_manager.connection.cursor()
-            cursor.execute(f"PRAGMA table_info({self.table_name})")
-            columns = cursor.fetchall()
-            
-            for col in columns:
-                if col[3] == 1 and col[1] in data and not data[col[1]]:
-                    messagebox.showwarning("Ошибка", f"Поле '{col[1]}' обязательно для заполнения")
+            for col in self.metadata.columns:
+                if col.not_null and col.name in data and not data[col.name]:
+                    messagebox.showwarning("Ошибка", f"Поле '{col.name}' обязательно для заполнения")
                     return
             
             if self.mode == 'add':
-                columns_str = ', '.join(data.keys())
-                placeholders = ', '.join(['?' for _ in data])
-                query = f"INSERT INTO {self.table_name} ({columns_str}) VALUES ({placeholders})"
+                query = self.metadata.insert_statement(data.keys())
                 params = tuple(data.values())
             else:
-                set_clause = ', '.join([f"{col}=?" for col in data.keys()])
-                query = f"UPDATE {self.table_name} SET {set_clause} WHERE rowid=?"
+                query = self.metadata.update_statement(data.keys())
                 params = tuple(data.values()) + (self.record_id,)
             
-            self.db_manager.execute_query(query, params)
-            messagebox.showinfo("Успех", "Данные успешно сохранены")
-            self.result = True
-            self.dialog.destroy()
+            self.data = data
+            if self.runner is None:
+                cursor = self.db_manager.execute_query(query, params)
+                self.on_saved(cursor.lastrowid)
+                return
+            
+            def write(connection):
+                return connection.execute(query, params).lastrowid
+            
+            self.save_button.config(state="disabled", text="Сохранение...")
+            self.runner(write, self.on_saved, self.on_save_error, write=True)
             
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при сохранении: {str(e)}")
+            self.on_save_error(e)
+    
+    def on_saved(self, lastrowid=None):
+        if self.mode == 'add':
+            self.record_id = lastrowid
+        self.result = True
+        if self.dialog.winfo_exists():
+            messagebox.showinfo("Успех", "Данные успешно сохранены")
+            self.dialog.destroy()
+    
+    def on_save_error(self, e):
+        if self.save_button.winfo_exists():
+            self.save_button.config(state="normal", text="Сохранить")
+        messagebox.showerror("Ошибка", f"Ошибка при сохранении: {str(e)}")
 
 def main():
-    root = tk.Tk()
-    app = MainApplication(root)
+    parser = argparse.ArgumentParser(description="Система обнаружения дефектов экранов смартфонов")
+    parser.add_argument("--database", help="Сразу подключиться к указанной базе данных")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Вывести разбивку времени запуска и завершить работу")
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        startup_profile.enable(STARTED).add("Импорт модулей", IMPORTED - STARTED)
+    with startup_profile.phase("Создание рабочих каталогов"):
+        Config.ensure_dirs()
+    with startup_profile.phase("Создание окна Tk"):
+        root = tk.Tk()
+    with startup_profile.phase("Построение интерфейса"):
+        app = MainApplication(root)
+    if args.database:
+        with startup_profile.phase("Подключение к базе данных"):
+            app.db_path_entry.delete(0, tk.END)
+            app.db_path_entry.insert(0, args.database)
+            if app.db_manager.connect(args.database):
+                app.show_login_window()
+
+    if args.profile_startup:
+        def finish():
+            root.update_idletasks()
+            print(startup_profile.report())
+            root.destroy()
+        root.after_idle(finish)
     root.mainloop()
+    app.thumbnails.shutdown()
+    if app._fingerprints is not None:
+        app._fingerprints.shutdown()
+    app.db_manager.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,75 @@
+import cProfile
+import io
+import pstats
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+HEAVY_MODULES = ("PIL", "numpy", "multiprocessing")
+
+_profiler = None
+
+
+class StartupProfiler:
+    """Замер этапов запуска приложения для отчета --profile-startup.
+
+    Каждый этап замеряется по времени и дополнительно профилируется cProfile,
+    чтобы отчет показывал и крупные этапы, и самые дорогие функции внутри них.
+    """
+
+    def __init__(self, started):
+        self.started = started
+        self.phases = []
+        self.profile = cProfile.Profile()
+        self._depth = 0
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        if self._depth == 0:
+            self.profile.enable()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self.profile.disable()
+            self.phases.append(("  " * self._depth + name, time.perf_counter() - started))
+
+    def add(self, name, seconds):
+        self.phases.append((name, seconds))
+
+    def report(self, top=15):
+        total = time.perf_counter() - self.started
+        lines = ["Профиль запуска", "-" * 60]
+        for name, seconds in self.phases:
+            lines.append(f"{name:<42} {seconds * 1000:9.1f} мс {seconds / total:6.1%}")
+        lines.append(f"{'Всего от начала импорта':<42} {total * 1000:9.1f} мс")
+
+        loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+        lines.append("Загруженные тяжелые модули: " + (", ".join(loaded) or "нет"))
+
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats("cumulative").print_stats(top)
+        lines.extend(["", f"Функции с наибольшим временем (первые {top}):", stream.getvalue()])
+        return "\n".join(lines)
+
+
+def enable(started):
+    """Включение профилирования; started - time.perf_counter() до импорта модулей"""
+    global _profiler
+    _profiler = StartupProfiler(started)
+    return _profiler
+
+
+def phase(name):
+    """Контекст замера этапа; без --profile-startup ничего не делает"""
+    if _profiler is None:
+        return nullcontext()
+    return _profiler.phase(name)
+
+
+def report():
+    return _profiler.report() if _profiler is not None else ""
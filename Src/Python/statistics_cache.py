@@ -0,0 +1,226 @@
+import argparse
+import sqlite3
+
+
+class StatisticsCache:
+    """Счетчики для панели статистики, поддерживаемые триггерами.
+
+    Итоговые значения хранятся в сводных таблицах stats_*, которые обновляются
+    триггерами на smartphones, inspections и defects при каждой вставке,
+    удалении и изменении. Чтение статистики сводится к нескольким строкам
+    сводных таблиц вместо полного сканирования основных таблиц.
+    """
+
+    TABLES = [
+        """CREATE TABLE IF NOT EXISTS stats_totals (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )""",
+
+        """CREATE TABLE IF NOT EXISTS stats_inspections_daily (
+            day TEXT PRIMARY KEY,
+            inspections INTEGER NOT NULL DEFAULT 0
+        )""",
+
+        """CREATE TABLE IF NOT EXISTS stats_defect_types (
+            defect_type TEXT PRIMARY KEY,
+            defects INTEGER NOT NULL DEFAULT 0
+        )""",
+
+        """CREATE TABLE IF NOT EXISTS stats_manufacturers (
+            manufacturer TEXT PRIMARY KEY,
+            smartphones INTEGER NOT NULL DEFAULT 0
+        )"""
+    ]
+
+    TRIGGERS = [
+        """CREATE TRIGGER IF NOT EXISTS stats_smartphones_insert AFTER INSERT ON smartphones BEGIN
+            UPDATE stats_totals SET value = value + 1 WHERE name = 'smartphones';
+            INSERT INTO stats_manufacturers (manufacturer, smartphones)
+                VALUES (IFNULL(NEW.manufacturer, ''), 1)
+                ON CONFLICT(manufacturer) DO UPDATE SET smartphones = smartphones + 1;
+        END""",
+
+        """CREATE TRIGGER IF NOT EXISTS stats_smartphones_delete AFTER DELETE ON smartphones BEGIN
+            UPDATE stats_totals SET value = value - 1 WHERE name = 'smartphones';
+            UPDATE stats_manufacturers SET smartphones = smartphones - 1
+                WHERE manufacturer = IFNULL(OLD.manufacturer, '');
+        END""",
+
+        """CREATE TRIGGER IF NOT EXISTS stats_smartphones_update
+        AFTER UPDATE OF manufacturer ON smartphones
+        WHEN OLD.manufacturer IS NOT NEW.manufacturer BEGIN
+            UPDATE stats_manufacturers SET smartphones = smartphones - 1
+                WHERE manufacturer = IFNULL(OLD.manufacturer, '');
+            INSERT INTO stats_manufacturers (manufacturer, smartphones)
+                VALUES (IFNULL(NEW.manufacturer, ''), 1)
+                ON CONFLICT(manufacturer) DO UPDATE SET smartphones = smartphones + 1;
+        END""",
+
+        """CREATE TRIGGER IF NOT EXISTS stats_inspections_insert AFTER INSERT ON inspections BEGIN
+            UPDATE stats_totals SET value = value + 1 WHERE name = 'inspections';
+            INSERT INTO stats_inspections_daily (day, inspections)
+                VALUES (IFNULL(DATE(NEW.inspection_date), ''), 1)
+                ON CONFLICT(day) DO UPDATE SET inspections = inspections + 1;
+        END""",
+
+        """CREATE TRIGGER IF NOT EXISTS stats_inspections_delete AFTER DELETE ON inspections BEGIN
+            UPDATE stats_totals SET value = value - 1 WHERE name = 'inspections';
+            UPDATE stats_inspections_daily SET inspections = inspections - 1
+                WHERE day = IFNULL(DATE(OLD.inspection_date), '');
+        END""",
+
+        """CREATE TRIGGER IF NOT EXISTS stats_inspections_update
+        AFTER UPDATE OF inspection_date ON inspections
+        WHEN DATE(OLD.inspection_date) IS NOT DATE(NEW.inspection_date) BEGIN
+            UPDATE stats_inspections_daily SET inspections = inspections - 1
+                WHERE day = IFNULL(DATE(OLD.inspection_date), '');
+            INSERT INTO stats_inspections_daily (day, inspections)
+                VALUES (IFNULL(DATE(NEW.inspection_date), ''), 1)
+                ON CONFLICT(day) DO UPDATE SET inspections = inspections + 1;
+        END""",
+
+        """CREATE TRIGGER IF NOT EXISTS stats_defects_insert AFTER INSERT ON defects BEGIN
+            UPDATE stats_totals SET value = value + 1 WHERE name = 'defects';
+            INSERT INTO stats_defect_types (defect_type, defects)
+                VALUES (IFNULL(NEW.defect_type, ''), 1)
+                ON CONFLICT(defect_type) DO UPDATE SET defects = defects + 1;
+        END""",
+
+        """CREATE TRIGGER IF NOT EXISTS stats_defects_delete AFTER DELETE ON defects BEGIN
+            UPDATE stats_totals SET value = value - 1 WHERE name = 'defects';
+            UPDATE stats_defect_types SET defects = defects - 1
+                WHERE defect_type = IFNULL(OLD.defect_type, '');
+        END""",
+
+        """CREATE TRIGGER IF NOT EXISTS stats_defects_update
+        AFTER UPDATE OF defect_type ON defects
+        WHEN OLD.defect_type IS NOT NEW.defect_type BEGIN
+            UPDATE stats_defect_types SET defects = defects - 1
+                WHERE defect_type = IFNULL(OLD.defect_type, '');
+            INSERT INTO stats_defect_types (defect_type, defects)
+                VALUES (IFNULL(NEW.defect_type, ''), 1)
+                ON CONFLICT(defect_type) DO UPDATE SET defects = defects + 1;
+        END"""
+    ]
+
+    TOTALS = ["smartphones", "inspections", "defects"]
+
+    SOURCE_QUERIES = {
+        "stats_totals": """
+            SELECT 'smartphones', COUNT(*) FROM smartphones
+            UNION ALL SELECT 'inspections', COUNT(*) FROM inspections
+            UNION ALL SELECT 'defects', COUNT(*) FROM defects""",
+        "stats_inspections_daily": """
+            SELECT IFNULL(DATE(inspection_date), ''), COUNT(*) FROM inspections
+            GROUP BY 1""",
+        "stats_defect_types": """
+            SELECT IFNULL(defect_type, ''), COUNT(*) FROM defects GROUP BY 1""",
+        "stats_manufacturers": """
+            SELECT IFNULL(manufacturer, ''), COUNT(*) FROM smartphones GROUP BY 1"""
+    }
+
+    def is_installed(self, connection):
+        """Проверка наличия сводных таблиц"""
+        row = connection.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name='stats_totals'"
+        ).fetchone()
+        return row[0] > 0
+
+    def create(self, connection):
+        """Создание сводных таблиц и триггеров и заполнение их по основным таблицам"""
+        for statement in self.TABLES + self.TRIGGERS:
+            connection.execute(statement)
+        for table, query in self.SOURCE_QUERIES.items():
+            connection.execute(f"DELETE FROM {table}")
+            connection.execute(f"INSERT INTO {table} {query}")
+
+    def rebuild(self, connection):
+        """Полный пересчет сводных таблиц по основным таблицам"""
+        if not connection.in_transaction:
+            connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.create(connection)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
+    def verify(self, connection):
+        """Сравнение сводных таблиц с основными; возвращает список расхождений"""
+        mismatches = []
+        for table, query in self.SOURCE_QUERIES.items():
+            expected = {key: count for key, count in connection.execute(query)}
+            actual = {key: count for key, count in connection.execute(f"SELECT * FROM {table}")}
+
+            for key in sorted(set(expected) | set(actual)):
+                expected_count = expected.get(key, 0)
+                actual_count = actual.get(key, 0)
+                if expected_count != actual_count:
+                    mismatches.append((table, key, expected_count, actual_count))
+        return mismatches
+
+    def totals(self, connection):
+        """Общее количество смартфонов, проверок и дефектов"""
+        result = {name: 0 for name in self.TOTALS}
+        for name, value in connection.execute("SELECT name, value FROM stats_totals"):
+            result[name] = value
+        return result
+
+    def inspections_on(self, connection, day=None):
+        """Количество проверок за день (по умолчанию - за сегодня)"""
+        if day is None:
+            row = connection.execute(
+                "SELECT inspections FROM stats_inspections_daily WHERE day = DATE('now')"
+            ).fetchone()
+        else:
+            row = connection.execute(
+                "SELECT inspections FROM stats_inspections_daily WHERE day = ?", (day,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def defects_by_type(self, connection):
+        """Количество дефектов по типам"""
+        return self._read_counts(connection, "SELECT defect_type, defects FROM stats_defect_types")
+
+    def smartphones_by_manufacturer(self, connection):
+        """Количество смартфонов по производителям"""
+        return self._read_counts(connection,
+                                 "SELECT manufacturer, smartphones FROM stats_manufacturers")
+
+    def _read_counts(self, connection, query):
+        result = {}
+        for key, count in connection.execute(query + " ORDER BY 1"):
+            if count > 0:
+                result[key if key != '' else None] = count
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание сводных таблиц статистики")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    parser.add_argument("database", help="Путь к файлу базы данных")
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.database)
+    cache = StatisticsCache()
+    try:
+        if args.command == "rebuild":
+            cache.rebuild(connection)
+            print("Сводные таблицы статистики пересчитаны")
+        else:
+            if not cache.is_installed(connection):
+                print("Сводные таблицы статистики не созданы, выполните rebuild")
+                raise SystemExit(1)
+            mismatches = cache.verify(connection)
+            for table, key, expected, actual in mismatches:
+                print(f"{table}[{key}]: ожидается {expected}, сохранено {actual}")
+            if mismatches:
+                raise SystemExit(1)
+            print("Сводные таблицы статистики соответствуют данным")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,781 @@
+import bisect
+from tkinter import ttk
+
+
+class PagedTreeview:
+    """Виртуализированное представление таблицы с постраничной загрузкой по первичному ключу.
+
+    В Treeview одновременно хранится не более MAX_PAGES страниц: видимые строки
+    и небольшой буфер предзагрузки. Следующие страницы подгружаются keyset-запросами
+    (WHERE pk > ? ORDER BY pk LIMIT ?) по мере прокрутки, лишние удаляются,
+    поэтому время открытия и память не зависят от размера таблицы.
+
+    Запросы выполняются через runner(func, on_success): func(connection) может
+    выполняться в фоновом потоке, on_success получает результат в потоке Tk.
+    По умолчанию запросы выполняются синхронно на основном соединении.
+
+    Сортировка по колонке (щелчок по заголовку) и фильтры по колонкам
+    компилируются в параметризованные WHERE/ORDER BY; при сортировке keyset
+    строится по паре (значение колонки, первичный ключ).
+
+    Для таблиц с полнотекстовым индексом search(text) переключает представление
+    на результаты поиска: строки по убыванию релевантности, страницы по OFFSET.
+
+    refresh_changes() применяет к окну только строки, измененные после загрузки
+    (по журналу change_log), а watch(interval_ms) вызывает его при изменении
+    PRAGMA data_version, чтобы окно показывало изменения других станций.
+    """
+
+    PAGE_SIZE = 200
+    MAX_PAGES = 3
+    PREFETCH_THRESHOLD = 0.25
+    SEEK_DELAY_MS = 40
+    MATCH_COLOR = "#FFF59D"
+    NUMERIC_TYPES = ("INT", "REAL", "FLOA", "DOUB", "NUM")
+    OPERATORS = (">=", "<=", "!=", "<>", ">", "<", "=")
+
+    def __init__(self, parent, db_manager, table_name, page_size=None, runner=None):
+        self.parent = parent
+        self.db_manager = db_manager
+        self.table_name = table_name
+        self.page_size = page_size or self.PAGE_SIZE
+        self.runner = runner or self.run_sync
+
+        self.columns = []
+        self.sources = [table_name]
+        self.pk_column = "rowid"
+        self.min_key = None
+        self.max_key = None
+        self.has_before = False
+        self.has_after = False
+        self._loading = False
+        self._generation = 0
+        self._seek_job = None
+        self._seek_fraction = None
+        self.search_text = None
+        self.search_offset = 0
+        self.search_start = 0
+        self.sort_column = None
+        self.sort_descending = False
+        self.filters = {}
+        self.filter_sql = ""
+        self.filter_params = []
+        self._sort_values = {}
+        self.change_id = None
+        self.data_version = None
+        self.watch_interval = None
+        self._watch_job = None
+        self._refreshing = False
+        self._epoch = 0
+
+        self.tree = ttk.Treeview(parent)
+        self.vsb = ttk.Scrollbar(parent, orient="vertical", command=self.on_scrollbar)
+        self.hsb = ttk.Scrollbar(parent, orient="horizontal", command=self.tree.xview)
+        self.tree.configure(yscrollcommand=self.on_tree_scroll, xscrollcommand=self.hsb.set)
+        self.tree.tag_configure("match", background=self.MATCH_COLOR)
+
+    def run_sync(self, func, on_success):
+        on_success(func(self.db_manager.connection))
+
+    def grid(self):
+        """Размещение Treeview и полос прокрутки в родительском фрейме"""
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.vsb.grid(row=0, column=1, sticky="ns")
+        self.hsb.grid(row=1, column=0, sticky="ew")
+
+        self.parent.grid_rowconfigure(0, weight=1)
+        self.parent.grid_columnconfigure(0, weight=1)
+
+    def configure_columns(self):
+        """Настройка колонок Treeview по структуре таблицы"""
+        self.metadata = self.db_manager.schema.table(self.table_name)
+        self.sources = self.db_manager.archives.sources(self.table_name)
+        self.columns = self.metadata.column_names
+        self.pk_column = self.metadata.key_column
+        if self.sort_column not in self.columns:
+            self.sort_column = None
+        self.filters = {column: text for column, text in self.filters.items()
+                        if column in self.columns}
+        self.build_queries()
+
+        self.tree["columns"] = self.columns
+        self.tree["show"] = "headings"
+
+        for col_name in self.columns:
+            self.tree.column(col_name, width=100)
+        self.update_headings()
+
+    def update_headings(self):
+        """Заголовки колонок с отметками сортировки и фильтра"""
+        for col_name in self.columns:
+            text = col_name
+            if col_name in self.filters:
+                text += " *"
+            if col_name == self.sort_column:
+                text += " ▼" if self.sort_descending else " ▲"
+            self.tree.heading(col_name, text=text,
+                              command=lambda column=col_name: self.sort_by(column))
+
+    def reload(self):
+        """Полная перезагрузка представления с начала таблицы"""
+        self._epoch += 1
+        self._refreshing = False
+        self.configure_columns()
+        if self.search_text:
+            self.search(self.search_text)
+            return
+        self._start_request()
+        generation = self._generation
+
+        def query(connection):
+            self.db_manager.schema.check(connection)
+            # Номер журнала читается до строк: изменения между запросами будут
+            # применены повторно, что безопасно
+            change_id = self.db_manager.changes.latest(connection)
+            if self.sort_column is not None:
+                return change_id, (None, None), self.fetch_window(connection, None, None)
+            bounds = connection.execute(self.bounds_query, self.bounds_params).fetchone()
+            return change_id, bounds, self.fetch_window(connection, bounds[0], bounds[0])
+
+        def apply(result):
+            change_id, (self.min_key, self.max_key), window = result
+            if self._is_current(generation):
+                self.change_id = change_id
+            self.apply_window(generation, window)
+
+        self.runner(query, apply)
+
+    def _start_request(self):
+        self._generation += 1
+        self._loading = True
+
+    def _is_current(self, generation):
+        return generation == self._generation and self.tree.winfo_exists()
+
+    def clear(self):
+        """Удаление всех строк из Treeview"""
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+        self._sort_values.clear()
+
+    def delete_items(self, items):
+        self.tree.delete(*items)
+        for item in items:
+            self._sort_values.pop(item, None)
+
+    def compile_filter(self, column, text):
+        """Условие WHERE и параметры для фильтра колонки.
+
+        Числовые колонки и колонки с перечислимыми значениями: "5", ">=3",
+        "!=2", "1..4". Текст: для индексированных колонок - поиск по началу
+        строки (диапазон по индексу), иначе - вхождение подстроки; "*" и "%"
+        задают шаблон LIKE. "NULL" - пустые значения.
+        """
+        metadata = self.metadata.column(column)
+        if metadata is None:
+            raise ValueError(f"Колонка {column} отсутствует в таблице {self.table_name}")
+        text = text.strip()
+        if text.upper() == "NULL":
+            return f"{column} IS NULL", []
+
+        numeric = metadata.primary_key or any(
+            name in (metadata.type or "").upper() for name in self.NUMERIC_TYPES)
+        if numeric or metadata.choices:
+            convert = self.number if numeric else str
+            if ".." in text:
+                low, high = text.split("..", 1)
+                return f"{column} BETWEEN ? AND ?", [convert(low.strip()), convert(high.strip())]
+            for operator in self.OPERATORS:
+                if text.startswith(operator):
+                    return f"{column} {operator} ?", [convert(text[len(operator):].strip())]
+            return f"{column} = ?", [convert(text)]
+
+        if "*" in text or "%" in text:
+            return f"{column} LIKE ?", [text.replace("*", "%")]
+        if column in self.metadata.indexed_columns:
+            # Диапазон [текст, текст + U+10FFFF) использует индекс, в отличие от LIKE
+            return f"{column} >= ? AND {column} < ?", [text, text + "\U0010ffff"]
+        return f"instr({column}, ?) > 0", [text]
+
+    @staticmethod
+    def number(text):
+        try:
+            return int(text)
+        except ValueError:
+            try:
+                return float(text)
+            except ValueError:
+                raise ValueError(f"Ожидается число: {text!r}")
+
+    def build_queries(self):
+        """Запросы страниц с учетом фильтров; первичный ключ всегда идет первым"""
+        conditions = []
+        params = []
+        for column, text in self.filters.items():
+            condition, values = self.compile_filter(column, text)
+            conditions.append(f"({condition})")
+            params.extend(values)
+        self.filter_sql = " AND ".join(conditions)
+        self.filter_params = params
+
+        # MIN и MAX отдельными подзапросами: каждый читает один край индекса,
+        # а не всю таблицу
+        pk, where = self.pk_column, (f" WHERE {self.filter_sql}" if conditions else "")
+        bounds = [f"SELECT (SELECT MIN({pk}) FROM {source}{where}) AS low, "
+                  f"(SELECT MAX({pk}) FROM {source}{where}) AS high" for source in self.sources]
+        if len(bounds) == 1:
+            self.bounds_query = bounds[0]
+        else:
+            self.bounds_query = f"SELECT MIN(low), MAX(high) FROM ({' UNION ALL '.join(bounds)})"
+        self.bounds_params = self.filter_params * (2 * len(self.sources))
+        self.page_conditions = {
+            1: ([self.filter_sql] if conditions else []) + [f"{pk} > ?"],
+            -1: ([self.filter_sql] if conditions else []) + [f"{pk} < ?"],
+        }
+
+    def query_page(self, connection, conditions, params, order):
+        """Страница строк источника; с архивами - UNION ALL страниц каждого файла.
+
+        LIMIT повторяется в каждой части объединения, поэтому из каждого файла
+        читается не больше страницы, а не вся таблица с сортировкой.
+        """
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        select_list = self.metadata.select_list
+        if len(self.sources) == 1:
+            query = f"SELECT {select_list} FROM {self.sources[0]}{where} ORDER BY {order} LIMIT ?"
+            return connection.execute(query, params + [self.page_size]).fetchall()
+        parts = [f"SELECT * FROM (SELECT {select_list} FROM {source}{where} "
+                 f"ORDER BY {order} LIMIT ?)" for source in self.sources]
+        query = " UNION ALL ".join(parts) + f" ORDER BY {order} LIMIT ?"
+        params = (params + [self.page_size]) * len(self.sources) + [self.page_size]
+        return connection.execute(query, params).fetchall()
+
+    def keyset_condition(self, cursor, ascending):
+        """Условие продолжения после cursor=(значение, ключ) в порядке (колонка, ключ).
+
+        NULL при сортировке по возрастанию идут первыми, поэтому для них
+        условие строится отдельно.
+        """
+        column, pk = self.sort_column, self.pk_column
+        value, key = cursor
+        if ascending:
+            if value is None:
+                return f"(({column} IS NULL AND {pk} > ?) OR {column} IS NOT NULL)", [key]
+            return f"({column} >= ? AND ({column} > ? OR {pk} > ?))", [value, value, key]
+        if value is None:
+            return f"({column} IS NULL AND {pk} < ?)", [key]
+        return (f"(({column} <= ? AND ({column} < ? OR {pk} < ?)) OR {column} IS NULL)",
+                [value, value, key])
+
+    def fetch_sorted_page(self, connection, cursor, direction):
+        """Страница при сортировке по колонке; cursor=None - с начала"""
+        ascending = (direction > 0) != self.sort_descending
+        conditions = [self.filter_sql] if self.filter_sql else []
+        params = list(self.filter_params)
+        if cursor is not None:
+            condition, values = self.keyset_condition(cursor, ascending)
+            conditions.append(condition)
+            params.extend(values)
+
+        order = "ASC" if ascending else "DESC"
+        return self.query_page(connection, conditions, params,
+                               f"{self.sort_column} {order}, {self.pk_column} {order}")
+
+    def fetch_page(self, connection, key, direction):
+        """Получение одной страницы строк после (direction=1) или до (direction=-1) ключа"""
+        if self.sort_column is not None:
+            rows = self.fetch_sorted_page(connection, key, direction)
+        else:
+            rows = self.query_page(connection, self.page_conditions[direction],
+                                   self.filter_params + [key],
+                                   self.pk_column if direction > 0 else f"{self.pk_column} DESC")
+        if direction > 0:
+            return rows
+        rows.reverse()
+        return rows
+
+    def fetch_window(self, connection, key, min_key):
+        """Получение окна строк от ключа: основная страница и страница буфера"""
+        if self.sort_column is not None:
+            rows = self.fetch_page(connection, None, 1)
+            has_after = len(rows) == self.page_size
+            if has_after:
+                following = self.fetch_page(connection, self.row_cursor(rows[-1]), 1)
+                has_after = len(following) == self.page_size
+                rows = rows + following
+            return {"rows": rows, "anchor": None, "has_before": False, "has_after": has_after}
+
+        if key is None:
+            return {"rows": [], "anchor": None, "has_before": False, "has_after": False}
+
+        rows = self.fetch_page(connection, key - 1, 1)
+        has_after = len(rows) == self.page_size
+        has_before = bool(rows) and rows[0][0] > min_key
+        anchor = rows[0][0] if rows else None
+
+        if len(rows) < self.page_size and has_before:
+            previous = self.fetch_page(connection, rows[0][0], -1)
+            has_before = len(previous) == self.page_size and previous[0][0] > min_key
+            rows = previous + rows
+        elif has_after:
+            following = self.fetch_page(connection, rows[-1][0], 1)
+            has_after = len(following) == self.page_size
+            rows = rows + following
+
+        return {"rows": rows, "anchor": anchor,
+                "has_before": has_before, "has_after": has_after}
+
+    def insert_rows(self, rows, index="end", tags=()):
+        """Вставка строк в Treeview; идентификатор элемента - значение первичного ключа"""
+        for offset, row in enumerate(rows):
+            values = row[1:] if self.pk_column == "rowid" else row
+            position = index if index == "end" else index + offset
+            self.tree.insert("", position, iid=str(row[0]), values=values, tags=tags)
+            if self.sort_column is not None:
+                self._sort_values[str(row[0])] = values[self.columns.index(self.sort_column)]
+
+    def row_cursor(self, row):
+        """Позиция строки для keyset-запроса: ключ или (значение сортировки, ключ)"""
+        if self.sort_column is None:
+            return row[0]
+        values = row[1:] if self.pk_column == "rowid" else row
+        return values[self.columns.index(self.sort_column)], row[0]
+
+    def item_cursor(self, item):
+        if self.sort_column is None:
+            return int(item)
+        return self._sort_values[item], int(item)
+
+    def sort_by(self, column):
+        """Сортировка по колонке: по возрастанию, по убыванию, без сортировки"""
+        if column not in self.columns:
+            raise ValueError(f"Колонка {column} отсутствует в таблице {self.table_name}")
+        if column != self.sort_column:
+            self.sort_column, self.sort_descending = column, False
+        elif not self.sort_descending:
+            self.sort_descending = True
+        else:
+            self.sort_column, self.sort_descending = None, False
+        self.search_text = None
+        self.reload()
+
+    def set_filter(self, column, text):
+        """Установка (или снятие при пустом тексте) фильтра колонки"""
+        text = text.strip()
+        previous = dict(self.filters)
+        if text:
+            self.compile_filter(column, text)
+            self.filters[column] = text
+        else:
+            self.filters.pop(column, None)
+        if self.filters != previous:
+            self.search_text = None
+            self.reload()
+
+    def clear_filters(self):
+        if self.filters:
+            self.filters.clear()
+            self.reload()
+
+    def search(self, text):
+        """Показ строк, найденных полнотекстовым поиском; пустой текст - вся таблица"""
+        self.search_text = text.strip() or None
+        if self.search_text is None:
+            self.reload()
+            return
+
+        self._epoch += 1
+        self._refreshing = False
+        self._start_request()
+        generation = self._generation
+        self.runner(lambda connection: self.fetch_search_page(connection, 0),
+                    lambda rows: self.apply_search(generation, rows))
+
+    def fetch_search_page(self, connection, offset):
+        """Страница результатов поиска; в текстовой колонке выделены совпадения"""
+        search = self.db_manager.search
+        text_index = self.columns.index(search.INDEXES[self.table_name][1])
+        rows = search.search(connection, self.table_name, self.search_text, self.columns,
+                             self.page_size, offset)
+        return [row[:text_index] + (row[-1],) + row[text_index + 1:-1] for row in rows]
+
+    def apply_search(self, generation, rows):
+        if not self._is_current(generation):
+            return
+        self._loading = False
+
+        self.clear()
+        self.insert_rows(rows, tags=("match",))
+        self.search_start = 0
+        self.search_offset = len(rows)
+        self.has_before = False
+        self.has_after = len(rows) == self.page_size
+        self.tree.yview_moveto(0)
+        self.update_scrollbar()
+
+    def load_next_matches(self):
+        """Подгрузка следующей страницы результатов поиска"""
+        self._start_request()
+        generation = self._generation
+        offset = self.search_offset
+        self.runner(lambda connection: self.fetch_search_page(connection, offset),
+                    lambda rows: self.append_matches(generation, rows))
+
+    def append_matches(self, generation, rows):
+        """Добавление результатов поиска в конец окна и удаление лишних строк сверху"""
+        if not self._is_current(generation):
+            return
+        self._loading = False
+
+        self.has_after = len(rows) == self.page_size
+        if not rows:
+            return
+
+        first, _ = self.tree.yview()
+        top_index = int(round(first * len(self.tree.get_children())))
+
+        self.insert_rows(rows, tags=("match",))
+        self.search_offset += len(rows)
+
+        children = self.tree.get_children()
+        excess = len(children) - self.MAX_PAGES * self.page_size
+        if excess > 0:
+            self.delete_items(children[:excess])
+            self.search_start += excess
+            self.has_before = True
+            remaining = len(children) - excess
+            self.tree.yview_moveto(max(top_index - excess, 0) / remaining)
+
+    def load_previous_matches(self):
+        """Подгрузка предыдущей страницы результатов поиска"""
+        self._start_request()
+        generation = self._generation
+        offset = max(self.search_start - self.page_size, 0)
+        count = self.search_start - offset
+        self.runner(lambda connection: self.fetch_search_page(connection, offset)[:count],
+                    lambda rows: self.prepend_matches(generation, offset, rows))
+
+    def prepend_matches(self, generation, offset, rows):
+        """Добавление результатов поиска в начало окна и удаление лишних строк снизу"""
+        if not self._is_current(generation):
+            return
+        self._loading = False
+
+        self.search_start = offset
+        self.has_before = offset > 0
+        if not rows:
+            return
+
+        first, _ = self.tree.yview()
+        top_index = int(round(first * len(self.tree.get_children())))
+
+        self.insert_rows(rows, index=0, tags=("match",))
+
+        children = self.tree.get_children()
+        excess = len(children) - self.MAX_PAGES * self.page_size
+        if excess > 0:
+            self.delete_items(children[-excess:])
+            self.search_offset -= excess
+            self.has_after = True
+        self.tree.yview_moveto((top_index + len(rows)) / len(self.tree.get_children()))
+
+    def seek_key(self, key):
+        """Загрузка окна строк, начинающегося с указанного ключа"""
+        self._start_request()
+        generation = self._generation
+        min_key = self.min_key
+        self.runner(lambda connection: self.fetch_window(connection, key, min_key),
+                    lambda window: self.apply_window(generation, window))
+
+    def apply_window(self, generation, window):
+        """Замена содержимого Treeview загруженным окном строк"""
+        if not self._is_current(generation):
+            return
+        self._loading = False
+
+        self.clear()
+        self.insert_rows(window["rows"])
+        self.has_before = window["has_before"]
+        self.has_after = window["has_after"]
+
+        children = self.tree.get_children()
+        if window["anchor"] is not None and children:
+            self.tree.yview_moveto(self.tree.index(str(window["anchor"])) / len(children))
+        self.update_scrollbar()
+
+    def first_key(self):
+        children = self.tree.get_children()
+        return self.item_cursor(children[0]) if children else None
+
+    def last_key(self):
+        children = self.tree.get_children()
+        return self.item_cursor(children[-1]) if children else None
+
+    def scroll_by_key(self):
+        """Положение полосы прокрутки вычисляется по первичному ключу"""
+        return not self.search_text and self.sort_column is None
+
+    def load_next(self):
+        """Подгрузка следующей страницы"""
+        if self.search_text:
+            self.load_next_matches()
+            return
+        last_key = self.last_key()
+        if last_key is None:
+            self._loading = False
+            return
+        self._start_request()
+        generation = self._generation
+        self.runner(lambda connection: self.fetch_page(connection, last_key, 1),
+                    lambda rows: self.append_page(generation, rows))
+
+    def append_page(self, generation, rows):
+        """Добавление страницы в конец окна и удаление лишних строк сверху"""
+        if not self._is_current(generation):
+            return
+        self._loading = False
+
+        self.has_after = len(rows) == self.page_size
+        if not rows:
+            return
+
+        first, _ = self.tree.yview()
+        top_index = int(round(first * len(self.tree.get_children())))
+
+        self.insert_rows(rows)
+
+        children = self.tree.get_children()
+        excess = len(children) - self.MAX_PAGES * self.page_size
+        if excess > 0:
+            self.delete_items(children[:excess])
+            self.has_before = True
+            remaining = len(children) - excess
+            self.tree.yview_moveto(max(top_index - excess, 0) / remaining)
+
+    def load_previous(self):
+        """Подгрузка предыдущей страницы"""
+        if self.search_text:
+            self.load_previous_matches()
+            return
+        first_key = self.first_key()
+        if first_key is None:
+            self._loading = False
+            return
+        self._start_request()
+        generation = self._generation
+        self.runner(lambda connection: self.fetch_page(connection, first_key, -1),
+                    lambda rows: self.prepend_page(generation, rows))
+
+    def prepend_page(self, generation, rows):
+        """Добавление страницы в начало окна и удаление лишних строк снизу"""
+        if not self._is_current(generation):
+            return
+        self._loading = False
+
+        self.has_before = len(rows) == self.page_size and (
+            self.sort_column is not None or rows[0][0] > self.min_key)
+        if not rows:
+            return
+
+        first, _ = self.tree.yview()
+        top_index = int(round(first * len(self.tree.get_children())))
+
+        self.insert_rows(rows, index=0)
+
+        children = self.tree.get_children()
+        excess = len(children) - self.MAX_PAGES * self.page_size
+        if excess > 0:
+            self.delete_items(children[-excess:])
+            self.has_after = True
+        self.tree.yview_moveto((top_index + len(rows)) / len(self.tree.get_children()))
+
+    def on_tree_scroll(self, first, last):
+        """Реакция на прокрутку Treeview: предзагрузка страниц у краев окна"""
+        first, last = float(first), float(last)
+        self.update_scrollbar(first, last)
+
+        if self._loading:
+            return
+        if last >= 1.0 - self.PREFETCH_THRESHOLD and self.has_after:
+            self._loading = True
+            self.tree.after_idle(self.load_next)
+        elif first <= self.PREFETCH_THRESHOLD and self.has_before:
+            self._loading = True
+            self.tree.after_idle(self.load_previous)
+
+    def key_fraction(self, key):
+        """Приблизительное положение ключа в таблице (интерполяция между MIN и MAX)"""
+        if self.min_key is None or self.max_key == self.min_key:
+            return 0.0
+        return (key - self.min_key) / (self.max_key - self.min_key + 1)
+
+    def update_scrollbar(self, first=None, last=None):
+        """Пересчет положения внешней полосы прокрутки относительно всей таблицы"""
+        if not self.scroll_by_key():
+            self.vsb.set(*self.tree.yview())
+            return
+
+        children = self.tree.get_children()
+        if not children or self.min_key is None:
+            self.vsb.set(0.0, 1.0)
+            return
+
+        if first is None or last is None:
+            first, last = self.tree.yview()
+
+        total = self.max_key - self.min_key + 1
+        top_index = min(int(first * len(children)), len(children) - 1)
+        visible = max(last - first, 0.0) * len(children)
+
+        start = self.key_fraction(int(children[top_index]))
+        end = min(start + visible / total, 1.0)
+        if not self.has_after and last >= 1.0:
+            end = 1.0
+        if not self.has_before and first <= 0.0:
+            start = 0.0
+        self.vsb.set(start, end)
+
+    def on_scrollbar(self, *args):
+        """Обработка команд полосы прокрутки"""
+        if not args:
+            return
+        if args[0] == "moveto" and not self.scroll_by_key():
+            self.tree.yview_moveto(float(args[1]))
+        elif args[0] == "moveto":
+            self._seek_fraction = float(args[1])
+            if self._seek_job is None:
+                self._seek_job = self.tree.after(self.SEEK_DELAY_MS, self._apply_seek)
+        elif args[0] == "scroll":
+            self.tree.yview_scroll(int(args[1]), args[2])
+
+    def watch(self, interval_ms):
+        """Периодический опрос PRAGMA data_version и применение изменений других станций"""
+        self.watch_interval = interval_ms
+        if self._watch_job is None:
+            self._watch_job = self.tree.after(interval_ms, self._poll_changes)
+
+    def _poll_changes(self):
+        self._watch_job = None
+        if not self.tree.winfo_exists():
+            return
+        # Пока загружается страница, изменения применяются на следующем опросе
+        if not self._loading and not self._refreshing:
+            version = self.db_manager.changes.data_version()
+            if version != self.data_version:
+                self.data_version = version
+                self.refresh_changes()
+        self._watch_job = self.tree.after(self.watch_interval, self._poll_changes)
+
+    def refresh_changes(self):
+        """Применение к окну строк, измененных после последней загрузки.
+
+        Из журнала читаются ключи измененных строк, сами строки перечитываются
+        по ключам с учетом фильтров: отсутствующие удаляются из окна, остальные
+        изменяются на месте или вставляются в свою позицию, если попадают в
+        загруженное окно. При большом числе изменений окно перезагружается.
+        В режиме поиска изменения применяются при следующем поиске.
+        """
+        if self.search_text or self.change_id is None or self._refreshing:
+            return
+        self._refreshing = True
+        epoch, change_id = self._epoch, self.change_id
+        limit = self.MAX_PAGES * self.page_size
+
+        def query(connection):
+            changes = self.db_manager.changes.since(connection, self.table_name, change_id, limit)
+            if changes is None:
+                return None
+            latest, keys = changes
+            return latest, keys, self.fetch_rows(connection, keys)
+
+        def apply(result):
+            if epoch != self._epoch or not self.tree.winfo_exists():
+                return
+            self._refreshing = False
+            if result is None:
+                self.reload()
+                return
+            self.change_id, keys, rows = result
+            self.apply_changes(keys, rows)
+
+        self.runner(query, apply)
+
+    def fetch_rows(self, connection, keys):
+        """Текущие строки с указанными ключами, удовлетворяющие фильтрам"""
+        if not keys:
+            return []
+        conditions = ([self.filter_sql] if self.filter_sql else []) + [
+            f"{self.pk_column} IN ({', '.join('?' * len(keys))})"]
+        rows = []
+        for source in self.sources:
+            rows.extend(connection.execute(
+                f"SELECT {self.metadata.select_list} FROM {source} "
+                f"WHERE {' AND '.join(conditions)}", self.filter_params + list(keys)).fetchall())
+        return rows
+
+    def fetch_keys(self, connection):
+        """Ключи всех строк основной таблицы, удовлетворяющих фильтрам"""
+        where = f" WHERE {self.filter_sql}" if self.filter_sql else ""
+        return [row[0] for row in connection.execute(
+            f"SELECT {self.pk_column} FROM {self.table_name}{where}", self.filter_params)]
+
+    def apply_changes(self, keys, rows):
+        """Удаление, изменение и вставка отдельных строк окна"""
+        current = {row[0]: row for row in rows}
+        for key in keys:
+            item, row = str(key), current.get(key)
+            if self.tree.exists(item):
+                if row is not None and self.row_cursor(row) == self.item_cursor(item):
+                    values = row[1:] if self.pk_column == "rowid" else row
+                    self.tree.item(item, values=values)
+                    continue
+                # Строка удалена, перестала подходить под фильтр или сменила позицию
+                self.delete_items([item])
+            if row is None:
+                continue
+            index = self.window_position(self.row_cursor(row))
+            if index is not None:
+                self.insert_rows([row], index=index)
+            if self.sort_column is None:
+                self.min_key = key if self.min_key is None else min(self.min_key, key)
+                self.max_key = key if self.max_key is None else max(self.max_key, key)
+        self.update_scrollbar()
+
+    @staticmethod
+    def order_value(value):
+        """Ключ сравнения в порядке SQLite: NULL, числа, текст, BLOB"""
+        if value is None:
+            return (0, 0)
+        if isinstance(value, (int, float)):
+            return (1, value)
+        if isinstance(value, str):
+            return (2, value)
+        return (3, bytes(value))
+
+    def order_key(self, cursor):
+        if self.sort_column is None:
+            return cursor
+        value, key = cursor
+        return self.order_value(value), key
+
+    def window_position(self, cursor):
+        """Индекс вставки строки в окно или None, если строка за его пределами"""
+        keys = [self.order_key(self.item_cursor(item)) for item in self.tree.get_children()]
+        target = self.order_key(cursor)
+        if self.sort_column is not None and self.sort_descending:
+            index = len(keys) - bisect.bisect_right(keys[::-1], target)
+        else:
+            index = bisect.bisect_left(keys, target)
+        if (index == 0 and self.has_before) or (index == len(keys) and self.has_after):
+            return None
+        return index
+
+    def _apply_seek(self):
+        self._seek_job = None
+        if self.min_key is None or self._seek_fraction is None:
+            return
+
+        fraction = min(max(self._seek_fraction, 0.0), 1.0)
+        key = self.min_key + int(fraction * (self.max_key - self.min_key))
+        self.seek_key(key)
@@ -0,0 +1,185 @@
+import argparse
+import hashlib
+import os
+import time
+
+import image_store
+from config import Config
+
+THUMBNAIL_SIZE = (256, 256)
+THUMBNAIL_QUALITY = 85
+
+
+def thumbnails_dir():
+    return os.path.join(Config.IMAGES_DIR, "thumbnails")
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """SHA-256 содержимого файла (чтение блоками)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def thumbnail_path_for(digest, base_dir=None):
+    """Путь миниатюры по хешу содержимого: <base>/ab/abcdef....jpg"""
+    base_dir = base_dir or thumbnails_dir()
+    return os.path.join(base_dir, digest[:2], digest + ".jpg")
+
+
+def make_thumbnail(image_path, base_dir=None, size=THUMBNAIL_SIZE):
+    """Создание миниатюры; выполняется в дочернем процессе.
+
+    Возвращает (image_path, thumbnail_path, created, error). Если миниатюра
+    для такого же содержимого уже существует, изображение не декодируется.
+    Для ссылки на хранилище изображений хеш содержимого берется из ссылки.
+    """
+    from PIL import Image
+
+    try:
+        if image_store.is_reference(image_path):
+            digest = image_store.reference_digest(image_path)
+        else:
+            digest = file_sha256(image_path)
+        target = thumbnail_path_for(digest, base_dir)
+        if os.path.exists(target):
+            return image_path, target, False, None
+
+        with image_store.open_source(image_path) as source, Image.open(source) as image:
+            # Для JPEG draft() декодирует сразу в уменьшенном масштабе (1/2..1/8)
+            image.draft("RGB", size)
+            image.thumbnail(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            temporary = f"{target}.{os.getpid()}.tmp"
+            image.save(temporary, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+            os.replace(temporary, target)
+        return image_path, target, True, None
+    except Exception as e:
+        return image_path, None, False, str(e)
+
+
+class ThumbnailGenerator:
+    """Генерация миниатюр для defect_images.thumbnail_path в пуле процессов.
+
+    Миниатюры адресуются хешем содержимого и хранятся в Config.IMAGES_DIR,
+    поэтому одинаковые изображения используют одну миниатюру. Путь к миниатюре
+    записывается в базу пакетами через соединение-писатель DatabaseManager.
+    """
+
+    def __init__(self, db_manager, workers=None, batch_size=500):
+        self.db_manager = db_manager
+        self.workers = workers
+        self.batch_size = batch_size
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             initializer=image_store.configure,
+                                             initargs=(self.db_manager.images.path,))
+        return self._pool
+
+    def backfill(self, on_progress=None):
+        """Создание миниатюр для всех строк без thumbnail_path"""
+        stats = {"processed": 0, "created": 0, "reused": 0, "failed": 0}
+        started = time.perf_counter()
+        last_id = 0
+
+        while True:
+            rows = self.db_manager.fetch_all(
+                "SELECT image_id, image_path FROM defect_images "
+                "WHERE thumbnail_path IS NULL AND image_id > ? ORDER BY image_id LIMIT ?",
+                (last_id, self.batch_size)
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            chunksize = max(1, len(rows) // (4 * (self.workers or os.cpu_count() or 1)))
+            results = self.pool.map(make_thumbnail, [row[1] for row in rows],
+                                    chunksize=chunksize)
+
+            updates = []
+            for (image_id, _), (_, target, created, error) in zip(rows, results):
+                stats["processed"] += 1
+                if error:
+                    stats["failed"] += 1
+                    continue
+                stats["created" if created else "reused"] += 1
+                updates.append((target, image_id))
+
+            self.save_paths(updates)
+
+            stats["images_per_second"] = stats["processed"] / (time.perf_counter() - started)
+            if on_progress:
+                on_progress(stats)
+        return stats
+
+    def save_paths(self, updates):
+        """Пакетная запись путей миниатюр"""
+        if not updates:
+            return
+        with self.db_manager.pool.writer() as connection:
+            connection.executemany(
+                "UPDATE defect_images SET thumbnail_path=? WHERE image_id=?", updates)
+
+    def generate_async(self, image_id, image_path):
+        """Создание миниатюры для добавленного изображения без ожидания результата"""
+        future = self.pool.submit(make_thumbnail, image_path)
+
+        def on_done(finished):
+            try:
+                _, target, _, error = finished.result()
+                if error:
+                    print(f"Ошибка при создании миниатюры {image_path}: {error}")
+                else:
+                    self.save_paths([(target, image_id)])
+            except Exception as e:
+                print(f"Ошибка при создании миниатюры {image_path}: {e}")
+
+        future.add_done_callback(on_done)
+        return future
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def print_progress(stats):
+    print(f"\rобработано: {stats['processed']} | создано: {stats['created']} | "
+          f"повторно: {stats['reused']} | ошибок: {stats['failed']} | "
+          f"{stats['images_per_second']:,.1f} изобр./с", end="", flush=True)
+
+
+def main():
+    from smartphone_defect_detection import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Создание миниатюр изображений дефектов")
+    parser.add_argument("database", help="Путь к файлу базы данных")
+    parser.add_argument("--workers", type=int, default=None, help="Число процессов")
+    parser.add_argument("--batch-size", type=int, default=500,
+                        help="Количество изображений в одном пакете")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager()
+    db_manager.open(args.database)
+    generator = ThumbnailGenerator(db_manager, workers=args.workers, batch_size=args.batch_size)
+    try:
+        generator.backfill(on_progress=print_progress)
+    finally:
+        generator.shutdown()
+        db_manager.close()
+    print()
+
+
+if __name__ == "__main__":
+    main()